@@ -21,14 +21,30 @@ try:
     from src.routes.translate import translate_bp
     from src.routes.generate import generate_bp
     from src.routes.tags import tags_bp
+    from src.routes.admin import admin_bp
     from src.models.note import Note
+    from src.models.schema import ensure_schema
+    from src.search_index import init_search_index
+    from src.duplicates import init_duplicate_index
+    from src.archive import init_archive
+    from src.revisions import init_revisions
+    from src.note_events import init_note_events
+    from src.static_assets import register_static_routes
+    from src.streaming import init_compression
+    from src.profiling import init_profiling
+    from src.db_routing import configure_read_replica, init_read_routing
     
     # Create Flask app instance
     app = Flask(__name__, static_folder=os.path.join(REPO_ROOT, 'src', 'static'))
     
     # Configure app
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'default-secret-key-for-vercel')
+    # also signs user tokens (src/auth.py); without it no tokens are issued or accepted
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+    if not app.config['SECRET_KEY']:
+        print("[WARN] SECRET_KEY is not set; user tokens are disabled")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # no process outlives the request, so coalesced PATCHes are committed right away
+    app.config['PATCH_COALESCE'] = False
     
     # Enable CORS for all routes
     CORS(app)
@@ -45,6 +61,9 @@ try:
         # Fallback to in-memory SQLite for Vercel if no DATABASE_URL
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     
+    # Optional read replica for GET requests (DATABASE_READ_URL)
+    configure_read_replica(app)
+
     # Initialize database
     db.init_app(app)
     
@@ -54,6 +73,7 @@ try:
     app.register_blueprint(translate_bp, url_prefix='/api')
     app.register_blueprint(generate_bp, url_prefix='/api')
     app.register_blueprint(tags_bp)
+    app.register_blueprint(admin_bp, url_prefix='/api')
     
     # Configure Flask to handle UTF-8 properly in Vercel environment
     app.config['JSON_AS_ASCII'] = False
@@ -61,30 +81,23 @@ try:
     # Create tables
     with app.app_context():
         db.create_all()
+        ensure_schema()
+        init_search_index(app)
+        init_duplicate_index(app)
+        init_archive(app)
+        init_revisions(app)
+        init_note_events(app)
+        init_profiling(app, db)
+        init_read_routing(app, db)
     
     # Add health check endpoint
     @app.route('/api/health')
     def health_check():
         return {'status': 'healthy', 'message': 'Vercel deployment is working'}
     
-    # Serve static files
-    @app.route('/', defaults={'path': ''})
-    @app.route('/<path:path>')
-    def serve(path):
-        static_folder_path = app.static_folder
-        if static_folder_path is None:
-            return "Static folder not configured", 404
-
-        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-            from flask import send_from_directory
-            return send_from_directory(static_folder_path, path)
-        else:
-            index_path = os.path.join(static_folder_path, 'index.html')
-            if os.path.exists(index_path):
-                from flask import send_from_directory
-                return send_from_directory(static_folder_path, 'index.html')
-            else:
-                return "index.html not found", 404
+    # Serve static files from a startup-built manifest (fingerprinted, precompressed)
+    register_static_routes(app)
+    init_compression(app)
 
 except Exception as e:
     # Create a minimal error-reporting app if main app fails
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compare LLM-bound throughput of the sync Flask app and the ASGI mode.
+
+A fake OpenAI-compatible upstream answers every chat completion after a
+fixed delay. The sync run pushes N `/api/translate` requests through the
+Flask app with a pool of `--workers` threads (the worker/thread count a
+WSGI server would have). The async run sends the same N requests
+concurrently through `src.asgi.app` on one event loop.
+
+    python benchmarks/bench_async_llm.py --requests 200 --workers 8 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def start_fake_upstream(latency):
+    """Serve chat completions on 127.0.0.1 after `latency` seconds; returns the port."""
+    ready = threading.Event()
+    state = {}
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(latency)
+                body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': '你好'}}]}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(asyncio.start_server(handle, '127.0.0.1', 0, backlog=1024))
+        state['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return state['port']
+
+
+def run_sync(flask_app, n, workers):
+    client = flask_app.test_client()
+
+    def one(i):
+        r = client.post('/api/translate', json={'text': f'hello {i}', 'lang': 'zh-CN'})
+        return r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(one, range(n)))
+    return time.perf_counter() - start, statuses
+
+
+async def _asgi_request(asgi_app, path, payload):
+    body = json.dumps(payload).encode()
+    sent = {'body': False}
+    result = {}
+
+    async def receive():
+        if not sent['body']:
+            sent['body'] = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            result['status'] = message['status']
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': [(b'content-type', b'application/json')],
+             'query_string': b'', 'root_path': '', 'scheme': 'http', 'server': ('127.0.0.1', 5001),
+             'client': ('127.0.0.1', 1), 'http_version': '1.1', 'raw_path': path.encode()}
+    await asgi_app(scope, receive, send)
+    return result.get('status')
+
+
+def run_async(asgi_app, n):
+    async def main():
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*[
+            _asgi_request(asgi_app, '/api/translate', {'text': f'hello {i}', 'lang': 'zh-CN'})
+            for i in range(n)
+        ])
+        return time.perf_counter() - start, statuses
+
+    return asyncio.run(main())
+
+
+def report(name, elapsed, statuses):
+    ok = sum(1 for s in statuses if s == 200)
+    print(f"{name:>6}: {len(statuses)} requests in {elapsed:.2f}s "
+          f"-> {len(statuses) / elapsed:.1f} req/s ({ok} ok)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8, help='sync worker threads')
+    parser.add_argument('--latency', type=float, default=0.5, help='fake upstream latency in seconds')
+    args = parser.parse_args()
+
+    port = start_fake_upstream(args.latency)
+    os.environ['GITHUB_TOKEN'] = 'benchmark'
+    os.environ['GITHUB_MODELS_ENDPOINT'] = f'http://127.0.0.1:{port}'
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    os.environ.setdefault('LLM_BREAKER_SLOW_SECONDS', str(max(10.0, args.latency * 4)))
+
+    from src.asgi import app as asgi_app, flask_app
+
+    print(f"upstream latency {args.latency}s, {args.requests} requests, {args.workers} sync workers")
+    report('sync', *run_sync(flask_app, args.requests, args.workers))
+    report('async', *run_async(asgi_app, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Load-test the LLM-backed endpoints against the mock upstream.
+
+Starts benchmarks/mock_llm_server.py in-process (or uses `--endpoint`),
+points the app at it and drives `--requests` calls per scenario with
+`--concurrency` requests in flight:
+
+* translate  - POST /api/translate
+* generate   - POST /api/generate-notes
+* batch      - POST /api/translate/batch (--batch-texts texts x --batch-langs languages)
+
+`--mode sync` goes through the Flask app from a thread pool (as a threaded
+WSGI server would); `--mode async` sends everything concurrently through the
+ASGI app on one event loop (translate and generate only; batch requests are
+served by the Flask app behind it). `--repeat-ratio` makes that share of
+requests reuse an earlier input, to show what the translation cache saves.
+
+For each scenario it prints throughput, latency percentiles, status codes,
+the share of degraded (fallback) answers, upstream calls per request and,
+for batches, the share of tasks served from cache.
+
+    python benchmarks/bench_llm_pipeline.py --scenario all --requests 300 --concurrency 32 \\
+        --latency lognormal:0.4,0.5 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from mock_llm_server import add_config_arguments, config_from_args, start_mock_server  # noqa: E402
+
+SCENARIOS = ('translate', 'generate', 'batch')
+LANGS = ('zh-CN', 'en', 'ja', 'fr', 'de', 'es')
+SAMPLES = (
+    'Team meeting tomorrow at 10:00 to review the quarterly budget',
+    '明天下午三点去超市买牛奶和鸡蛋',
+    'Call the dentist to move the appointment to next Friday',
+    'Draft the release notes for the new search feature',
+    '今天晚上8点和朋友一起吃饭',
+)
+
+
+class Workload:
+    def __init__(self, scenario, repeat_ratio, batch_texts, batch_langs):
+        self.scenario = scenario
+        self.repeat_ratio = repeat_ratio
+        self.batch_texts = batch_texts
+        self.batch_langs = batch_langs
+        self.history = []
+
+    def _text(self, i):
+        if self.history and random.random() < self.repeat_ratio:
+            return random.choice(self.history)
+        text = f'{random.choice(SAMPLES)} #{i}'
+        self.history.append(text)
+        return text
+
+    def request(self, i):
+        """(path, JSON body) of request number `i`."""
+        if self.scenario == 'translate':
+            return '/api/translate', {'text': self._text(i), 'lang': random.choice(LANGS)}
+        if self.scenario == 'generate':
+            return '/api/generate-notes', {'user_input': self._text(i), 'language': 'English'}
+        texts = [self._text(f'{i}.{j}') for j in range(self.batch_texts)]
+        return '/api/translate/batch', {'texts': texts, 'langs': list(LANGS[:self.batch_langs])}
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.degraded = 0
+        self.tasks = 0
+        self.cached = 0
+
+    def add(self, status, elapsed, body):
+        self.latencies.append(elapsed)
+        self.statuses[status] += 1
+        if isinstance(body, dict):
+            if body.get('degraded'):
+                self.degraded += 1
+            self.tasks += body.get('tasks', 0)
+            self.cached += body.get('cached', 0)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_sync(flask_app, requests, concurrency, result):
+    client = flask_app.test_client()
+
+    def one(request):
+        path, payload = request
+        start = time.perf_counter()
+        response = client.post(path, json=payload)
+        result.add(response.status_code, time.perf_counter() - start, response.get_json(silent=True))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, requests))
+
+
+async def _asgi_post(asgi_app, path, payload):
+    body = json.dumps(payload).encode()
+    sent = {'body': False}
+    out = {'body': b''}
+
+    async def receive():
+        if not sent['body']:
+            sent['body'] = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            out['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            out['body'] += message.get('body', b'')
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': [(b'content-type', b'application/json')],
+             'query_string': b'', 'root_path': '', 'scheme': 'http', 'server': ('127.0.0.1', 5001),
+             'client': ('127.0.0.1', 1), 'http_version': '1.1', 'raw_path': path.encode()}
+    await asgi_app(scope, receive, send)
+    try:
+        parsed = json.loads(out['body'])
+    except ValueError:
+        parsed = None
+    return out.get('status'), parsed
+
+
+def run_async(asgi_app, requests, concurrency, result):
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(request):
+            async with limit:
+                start = time.perf_counter()
+                status, body = await _asgi_post(asgi_app, *request)
+                result.add(status, time.perf_counter() - start, body)
+
+        await asyncio.gather(*(one(r) for r in requests))
+
+    asyncio.run(main())
+
+
+def report(scenario, result, elapsed, upstream_calls):
+    n = len(result.latencies)
+    ms = [x * 1000 for x in result.latencies]
+    line = {
+        'scenario': scenario,
+        'requests': n,
+        'throughput_rps': round(n / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(ms, 50), 1),
+        'p95_ms': round(percentile(ms, 95), 1),
+        'p99_ms': round(percentile(ms, 99), 1),
+        'max_ms': round(max(ms), 1) if ms else 0.0,
+        'statuses': dict(sorted(result.statuses.items())),
+        'degraded_rate': round(result.degraded / n, 3) if n else 0.0,
+        'upstream_calls_per_request': round(upstream_calls / n, 2) if n else 0.0,
+    }
+    if result.tasks:
+        line['cache_hit_rate'] = round(result.cached / result.tasks, 3)
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--repeat-ratio', type=float, default=0.3, help='share of requests reusing an earlier text')
+    parser.add_argument('--batch-texts', type=int, default=10)
+    parser.add_argument('--batch-langs', type=int, default=2)
+    parser.add_argument('--endpoint', help='use this upstream instead of starting the mock')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per scenario')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    stats = None
+    if args.endpoint:
+        os.environ['GITHUB_MODELS_ENDPOINT'] = args.endpoint
+    else:
+        port, stats = start_mock_server(config_from_args(args))
+        os.environ['GITHUB_MODELS_ENDPOINT'] = f'http://127.0.0.1:{port}'
+    os.environ.setdefault('GITHUB_TOKEN', 'benchmark')
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+    from src.asgi import app as asgi_app, flask_app
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    if not args.json:
+        print(f"mode={args.mode} requests={args.requests} concurrency={args.concurrency} "
+              f"upstream={os.environ['GITHUB_MODELS_ENDPOINT']}")
+    for scenario in scenarios:
+        workload = Workload(scenario, args.repeat_ratio, args.batch_texts, args.batch_langs)
+        requests = [workload.request(i) for i in range(args.requests)]
+        result = Result()
+        before = stats.snapshot()['requests'] if stats else 0
+        start = time.perf_counter()
+        if args.mode == 'async':
+            run_async(asgi_app, requests, args.concurrency, result)
+        else:
+            run_sync(flask_app, requests, args.concurrency, result)
+        elapsed = time.perf_counter() - start
+        upstream = (stats.snapshot()['requests'] - before) if stats else 0
+        line = report(scenario, result, elapsed, upstream)
+        if args.json:
+            print(json.dumps(line))
+        else:
+            extra = f" cache_hit={line['cache_hit_rate']:.1%}" if 'cache_hit_rate' in line else ''
+            print(f"{scenario:>9}: {line['throughput_rps']:7.1f} req/s  p50 {line['p50_ms']:7.1f}ms  "
+                  f"p95 {line['p95_ms']:7.1f}ms  p99 {line['p99_ms']:7.1f}ms  "
+                  f"degraded {line['degraded_rate']:.1%}  upstream/req {line['upstream_calls_per_request']:.2f}"
+                  f"{extra}  statuses {line['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in for the GitHub Models endpoint.
+
+Answers `POST /chat/completions` without calling anything, so the LLM
+endpoints can be load-tested for free. Any other POST path is treated the
+same, because the plain HTTP fallback in src/llm.py posts to the bare
+endpoint URL. Point the app at it with
+
+    python benchmarks/mock_llm_server.py --port 8090 --latency lognormal:0.6,0.4 --error-rate 0.02
+    GITHUB_TOKEN=x GITHUB_MODELS_ENDPOINT=http://127.0.0.1:8090 python src/main.py
+
+Replies are canned but shaped like the real thing:
+
+* note extraction prompts (`process_user_notes`) get the JSON object it
+  parses (Title / Notes / Tags / Event_Date / Event_Time),
+* batch translation prompts get one `<<<id>>>` block per task,
+* anything else gets "[<target language>] <user text>".
+
+Latency is drawn per request from `--latency` (`fixed:S`, `uniform:A,B`,
+`normal:MEAN,SD`, `lognormal:MEDIAN,SIGMA` or `pareto:SCALE,ALPHA`, in
+seconds). `--error-rate`, `--rate-limit-rate` and `--hang-rate` inject 500s,
+429s and requests that never answer; `--malformed-rate` returns output the
+app cannot parse. `"stream": true` requests get server-sent event chunks.
+`GET /stats` returns request counters.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+
+class LatencyDistribution:
+    def __init__(self, spec):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(p) for p in params.split(',') if p]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal', 'pareto'):
+            raise ValueError(f'Unknown latency distribution: {spec}')
+
+    def sample(self):
+        p = self.params
+        if self.kind == 'fixed':
+            return p[0]
+        if self.kind == 'uniform':
+            return random.uniform(p[0], p[1])
+        if self.kind == 'normal':
+            return max(0.0, random.gauss(p[0], p[1]))
+        if self.kind == 'lognormal':
+            return random.lognormvariate(math.log(p[0]), p[1])
+        return p[0] * random.paretovariate(p[1])
+
+
+class MockConfig:
+    def __init__(self, latency='fixed:0.5', error_rate=0.0, rate_limit_rate=0.0, hang_rate=0.0,
+                 malformed_rate=0.0, stream_chunk_delay=0.02, seed=None):
+        self.latency = LatencyDistribution(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.hang_rate = hang_rate
+        self.malformed_rate = malformed_rate
+        self.stream_chunk_delay = stream_chunk_delay
+        if seed is not None:
+            random.seed(seed)
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'ok': 0, 'errors': 0, 'rate_limited': 0, 'hung': 0,
+                         'malformed': 0, 'streamed': 0, 'prompt_chars': 0}
+
+    def add(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+# --- canned replies ----------------------------------------------------
+
+def _note_reply(user_text):
+    words = re.findall(r'\w+', user_text)
+    tags = []
+    for word in words:
+        if len(word) > 3 and word.lower() not in tags:
+            tags.append(word.lower())
+        if len(tags) == 3:
+            break
+    event_date = None
+    if 'tomorrow' in user_text.lower() or '明天' in user_text:
+        event_date = (date.today() + timedelta(days=1)).isoformat()
+    elif 'today' in user_text.lower() or '今天' in user_text:
+        event_date = date.today().isoformat()
+    match = re.search(r'(\d{1,2}):(\d{2})', user_text)
+    event_time = f'{int(match.group(1)):02d}:{match.group(2)}' if match else None
+    return json.dumps({
+        'Title': ' '.join(words[:4]) or 'Note',
+        'Notes': user_text,
+        'Tags': tags or ['note'],
+        'Event_Date': event_date,
+        'Event_Time': event_time,
+    }, ensure_ascii=False)
+
+
+def _batch_reply(user_text):
+    segments = dict(re.findall(r'<<<S(\d+)>>>\n(.*?)(?=\n<<<)', user_text, re.S))
+    blocks = []
+    for task_id, segment, lang in re.findall(r'^(\d+): S(\d+) -> (.+)$', user_text, re.M):
+        blocks.append(f'<<<{task_id}>>>\n[{lang.strip()}] {segments.get(segment, "")}')
+    return '\n'.join(blocks) + '\n<<<end>>>'
+
+
+def canned_reply(messages):
+    system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+    user = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    if 'Extract the user' in system:
+        return _note_reply(user)
+    if '<<<' in system:
+        return _batch_reply(user)
+    match = re.search(r'into ([^.]+)\.', system)
+    return f'[{match.group(1) if match else "translated"}] {user}'
+
+
+def _usage(messages, content):
+    # about four characters per token, like the app's own estimate
+    prompt = sum(len(m.get('content') or '') for m in messages) // 4 + 1
+    completion = len(content) // 4 + 1
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def _completion(content, model, messages=()):
+    return {
+        'id': f'chatcmpl-mock-{random.getrandbits(48):x}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': _usage(messages, content),
+    }
+
+
+# --- HTTP ----------------------------------------------------------------
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0) or 0)
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def _response(status, body, content_type='application/json', reason=None):
+    reasons = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body, ensure_ascii=False)
+    data = body.encode('utf-8')
+    return (f'HTTP/1.1 {status} {reason or reasons.get(status, "OK")}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(data)}\r\n\r\n').encode('latin-1') + data
+
+
+async def _stream(writer, content, model, chunk_delay):
+    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                 b'Transfer-Encoding: chunked\r\n\r\n')
+
+    async def event(payload):
+        data = f'data: {payload}\n\n'.encode('utf-8')
+        writer.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        await writer.drain()
+
+    base = {'id': f'chatcmpl-mock-{random.getrandbits(48):x}', 'object': 'chat.completion.chunk',
+            'created': int(time.time()), 'model': model}
+    pieces = re.findall(r'\S+\s*', content) or ['']
+    for i, piece in enumerate(pieces):
+        delta = {'content': piece} if i else {'role': 'assistant', 'content': piece}
+        await event(json.dumps(dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': None}]),
+                               ensure_ascii=False))
+        await asyncio.sleep(chunk_delay)
+    await event(json.dumps(dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])))
+    await event('[DONE]')
+    writer.write(b'0\r\n\r\n')
+
+
+def make_handler(config, stats):
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if method == 'GET' and path in ('/stats', '/health'):
+                    writer.write(_response(200, stats.snapshot() if path == '/stats' else {'status': 'ok'}))
+                    await writer.drain()
+                    continue
+                if method != 'POST':
+                    writer.write(_response(404, {'error': {'message': f'No route for {method} {path}'}}))
+                    await writer.drain()
+                    continue
+                await _complete(writer, json.loads(body or b'{}'), config, stats)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def _complete(writer, payload, config, stats):
+    stats.add('requests')
+    messages = payload.get('messages') or []
+    stats.add('prompt_chars', sum(len(m.get('content') or '') for m in messages))
+    model = payload.get('model', 'mock')
+
+    roll = random.random()
+    if roll < config.hang_rate:
+        stats.add('hung')
+        # hold the connection until the client gives up
+        await asyncio.sleep(3600)
+    await asyncio.sleep(config.latency.sample())
+    roll = random.random()
+    if roll < config.error_rate:
+        stats.add('errors')
+        writer.write(_response(500, {'error': {'message': 'mock upstream failure', 'type': 'server_error'}}))
+        await writer.drain()
+        return
+    if roll < config.error_rate + config.rate_limit_rate:
+        stats.add('rate_limited')
+        writer.write(_response(429, {'error': {'message': 'mock rate limit', 'type': 'rate_limit'}}))
+        await writer.drain()
+        return
+
+    content = canned_reply(messages)
+    if random.random() < config.malformed_rate:
+        stats.add('malformed')
+        content = 'Sorry, I cannot help with that.'
+    stats.add('ok')
+    if payload.get('stream'):
+        stats.add('streamed')
+        await _stream(writer, content, model, config.stream_chunk_delay)
+    else:
+        writer.write(_response(200, _completion(content, model, messages)))
+    await writer.drain()
+
+
+def start_mock_server(config=None, host='127.0.0.1', port=0):
+    """Run the mock in a background thread; returns (port, stats)."""
+    config = config or MockConfig()
+    stats = MockStats()
+    ready = threading.Event()
+    state = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(
+            asyncio.start_server(make_handler(config, stats), host, port, backlog=2048))
+        state['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name='mock-llm', daemon=True).start()
+    ready.wait()
+    return state['port'], stats
+
+
+def add_config_arguments(parser):
+    parser.add_argument('--latency', default='fixed:0.5',
+                        help='fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA | pareto:SCALE,ALPHA')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 500 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of 429 responses')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='share of requests never answered')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of unparseable replies')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args):
+    return MockConfig(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                      hang_rate=args.hang_rate, malformed_rate=args.malformed_rate, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    port, _ = start_mock_server(config_from_args(args), args.host, args.port)
+    print(f"mock LLM listening on http://{args.host}:{port} (GITHUB_MODELS_ENDPOINT)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
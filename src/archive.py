@@ -0,0 +1,211 @@
+"""Hot/cold tiering for notes.
+
+Notes not updated for ARCHIVE_AFTER_DAYS are moved, ARCHIVE_BATCH_SIZE at a
+time, from `note` into the compressed `note_archive` table, so listings,
+LIKE searches and tag scans only walk the working set. Their n-gram and
+fingerprint rows go with them. Archived notes keep their id: `load_note()`
+moves a note back into `note` the first time it is read or edited by id,
+and listing/search endpoints accept `include_archived=1` to see both tiers.
+
+The job runs on demand (`POST /api/admin/archive/run`) and, when
+ARCHIVE_INTERVAL_HOURS is set, periodically in a background thread.
+
+SQLite hands out max(id) + 1 for new rows, so an archived id could be
+reused once every newer note has been deleted. A before_insert hook on
+SQLite assigns ids above the archive's highest id in that case.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import IntegrityError
+
+from src.cache import note_cache
+from src.db_routing import use_primary
+from src.models.note import Note
+from src.models.note_archive import NoteArchive
+from src.models.note_fingerprint import NoteFingerprint
+from src.models.note_ngram import NoteNgram
+from src.models.user import db
+from src.streaming import YIELD_PER, keyset_pages
+from src.tag_suggest import tag_suggester
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', '0'))
+
+NOTE_COLUMNS = ('id', 'user_id', 'title', 'tags', 'event_date', 'event_time',
+                'created_at', 'updated_at', 'version')
+
+
+def include_archived_requested(args):
+    return args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to `batch_size` notes last updated before `cutoff`; returns how many moved."""
+    note = Note.__table__
+    rows = db.session.execute(
+        select(note).where(note.c.updated_at < cutoff).order_by(note.c.id).limit(batch_size)
+    ).mappings().all()
+    if not rows:
+        return 0
+    ids = [row['id'] for row in rows]
+    now = datetime.utcnow()
+    db.session.execute(NoteArchive.__table__.insert(), [
+        dict({name: row[name] for name in NOTE_COLUMNS},
+             content_z=NoteArchive.compress(row['content']), archived_at=now)
+        for row in rows
+    ])
+    # Only delete rows that are still untouched; anything edited since the
+    # select stays hot and its archive copy is dropped again.
+    db.session.execute(note.delete().where(note.c.id.in_(ids), note.c.updated_at < cutoff))
+    still_hot = [i for (i,) in db.session.execute(select(note.c.id).where(note.c.id.in_(ids)))]
+    if still_hot:
+        archive = NoteArchive.__table__
+        db.session.execute(archive.delete().where(archive.c.id.in_(still_hot)))
+    moved = [i for i in ids if i not in set(still_hot)]
+    if moved:
+        for table in (NoteNgram.__table__, NoteFingerprint.__table__):
+            db.session.execute(table.delete().where(table.c.note_id.in_(moved)))
+    db.session.commit()
+
+    for user_id in {row['user_id'] for row in rows}:
+        note_cache.invalidate_user(user_id)
+        tag_suggester.forget(user_id)
+    return len(moved)
+
+
+def archive_cold_notes(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Archive every note older than `days`, batch by batch; returns the number moved."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        batches += 1
+        total += moved
+        if moved < batch_size:
+            break
+    return total
+
+
+def rehydrate(note_id, user_id):
+    """Move archived note `note_id` of `user_id` back into `note`. Returns True if it is hot now.
+
+    The note's `updated_at` is set to now, otherwise the next archive run
+    would move it straight back. This is a write even when it happens on a
+    GET, so it reads the archive row from the primary, not a lagging replica.
+    """
+    use_primary()
+    archived = NoteArchive.owned_by(user_id).filter_by(id=note_id).first()
+    if archived is None:
+        return False
+    note = Note(id=archived.id, user_id=archived.user_id, title=archived.title, content=archived.content,
+                tags=archived.tags, event_date=archived.event_date, event_time=archived.event_time,
+                created_at=archived.created_at, updated_at=datetime.utcnow(), version=archived.version)
+    db.session.add(note)
+    db.session.delete(archived)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another request rehydrated it first
+        db.session.rollback()
+        return db.session.get(Note, note_id) is not None
+    note_cache.invalidate_user(user_id)
+    return True
+
+
+def load_note(user_id, note_id):
+    """The note `note_id` of `user_id`, rehydrated from the archive if needed; None if missing."""
+    note = Note.owned_by(user_id).filter_by(id=note_id).first()
+    if note is None:
+        # the replica may not have seen an earlier rehydration yet; after
+        # rehydrate() this reads from the primary either way
+        rehydrate(note_id, user_id)
+        note = Note.owned_by(user_id).filter_by(id=note_id).first()
+    return note
+
+
+def archived_notes(user_id, batch_size=YIELD_PER):
+    """Archived notes of `user_id`, most recently updated first, read in keyset pages."""
+    return keyset_pages(NoteArchive.owned_by(user_id),
+                        ((NoteArchive.updated_at, True), (NoteArchive.id, True)), batch_size)
+
+
+def archive_stats():
+    return {
+        'hot': db.session.query(func.count(Note.id)).scalar(),
+        'archived': db.session.query(func.count(NoteArchive.id)).scalar(),
+        'after_days': ARCHIVE_AFTER_DAYS,
+        'interval_hours': ARCHIVE_INTERVAL_HOURS,
+    }
+
+
+@event.listens_for(Note, 'before_insert')
+def _keep_archived_ids_reserved(mapper, connection, target):
+    if target.id is not None or connection.dialect.name != 'sqlite':
+        return
+    note, archive = Note.__table__, NoteArchive.__table__
+    hot_max, archive_max = connection.execute(
+        select(select(func.max(note.c.id)).scalar_subquery(),
+               select(func.max(archive.c.id)).scalar_subquery())
+    ).one()
+    if archive_max is not None and (hot_max or 0) < archive_max:
+        target.id = archive_max + 1
+
+
+class ArchiveJob:
+    """Runs `archive_cold_notes()` in a background thread, on demand or every ARCHIVE_INTERVAL_HOURS."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._scheduler = None
+        self.status = {'state': 'idle'}
+
+    def start(self, app, days=ARCHIVE_AFTER_DAYS):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {'state': 'running', 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'days': days}
+            self._thread = threading.Thread(target=self._run, args=(app, days), name='note-archiver', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, app, days):
+        started = time.perf_counter()
+        status = dict(self.status)
+        try:
+            with app.app_context():
+                status['moved'] = archive_cold_notes(days=days)
+                db.session.remove()
+            status['state'] = 'done'
+        except Exception as e:
+            print(f"[WARN] Note archiving failed: {e}")
+            status.update(state='failed', error=str(e))
+        status['took_s'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self.status = status
+
+    def schedule(self, app, interval_hours=ARCHIVE_INTERVAL_HOURS):
+        """Run the job every `interval_hours` (no-op when it is 0)."""
+        if interval_hours <= 0 or self._scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_hours * 3600)
+                self.start(app)
+
+        self._scheduler = threading.Thread(target=loop, name='note-archiver-schedule', daemon=True)
+        self._scheduler.start()
+
+
+archive_job = ArchiveJob()
+
+
+def init_archive(app):
+    archive_job.schedule(app)
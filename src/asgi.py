@@ -0,0 +1,206 @@
+"""ASGI entry point: `uvicorn src.asgi:app --host 0.0.0.0 --port 5001`.
+
+The LLM-bound endpoints (`POST /api/translate`, `POST /api/generate-notes`)
+are served natively on the event loop with the async LLM client, so many
+concurrent upstream calls share one loop instead of one worker thread
+each. Every other request is handed to the regular Flask app through
+asgiref's WsgiToAsgi adapter, which runs it on a thread pool and keeps
+database access off the loop.
+
+`GET /api/notes/stream` (Server-Sent Events) is also served on the loop,
+so thousands of mostly idle subscribers do not pin a worker thread each.
+"""
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from asgiref.wsgi import WsgiToAsgi
+
+from src.main import app as flask_app
+from src.async_llm import atranslate, aprocess_user_notes, aclose
+from src.circuit_breaker import CircuitOpenError
+from src.tokens import TokenBudgetError
+from src.auth import AuthError, resolve_user_id
+from src.routes.generate import format_generate_response
+from src.tag_suggest import tag_suggester
+from src.models.user import db
+from src.note_events import AsyncSubscription, aevent_stream, broadcaster, parse_last_event_id, replay
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def _read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            # mirror flask-cors' defaults used by the WSGI app
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def translate_endpoint(scope, receive, send):
+    data = await _read_json(receive)
+    text = data.get('text')
+    lang = data.get('lang', 'zh-CN')
+    if not text:
+        return await _send_json(send, {'error': 'No text provided'}, 400)
+    try:
+        translated = await atranslate(text, lang)
+        await _send_json(send, {'translation': translated})
+    except TokenBudgetError as e:
+        await _send_json(send, {'error': str(e)}, 413)
+    except CircuitOpenError as e:
+        await _send_json(send, {'error': str(e), 'degraded': True}, 503)
+    except Exception as e:
+        await _send_json(send, {'error': str(e)}, 500)
+
+
+def _header(scope, wanted):
+    for name, value in scope.get('headers', []):
+        if name == wanted:
+            return value.decode('latin-1')
+    return None
+
+
+def _query_param(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    return values[0] if values else None
+
+
+def _user_id(scope):
+    """Same identification as `src.auth.current_user_id()`; raises AuthError.
+
+    Checking a token reads the user row, so run it off the loop.
+    """
+    with flask_app.app_context():
+        try:
+            return resolve_user_id(lambda name: _header(scope, name.lower().encode('latin-1')),
+                                   lambda name: _query_param(scope, name), flask_app.secret_key)
+        finally:
+            db.session.remove()
+
+
+async def generate_notes_endpoint(scope, receive, send):
+    data = await _read_json(receive)
+    user_input = data.get('user_input')
+    language = data.get('language', 'Chinese')
+    if not user_input:
+        return await _send_json(send, {'error': 'No user_input provided'}, 400)
+    try:
+        user_id = await asyncio.to_thread(_user_id, scope)
+    except AuthError as e:
+        return await _send_json(send, {'error': str(e)}, 401)
+    try:
+        # only statistics already in memory: loading them would hit the DB on the loop
+        result = await aprocess_user_notes(
+            language, user_input,
+            tag_suggester=lambda text: tag_suggester.suggest_names(text, user_id, load=False),
+            use_llm=data.get('use_llm', True) is not False,
+        )
+        payload, status = format_generate_response(result)
+        await _send_json(send, payload, status)
+    except Exception as e:
+        await _send_json(send, {'error': f'Note generation failed: {str(e)}'}, 500)
+
+
+def _replay(user_id, last_event_id):
+    with flask_app.app_context():
+        try:
+            return replay(user_id, last_event_id)
+        finally:
+            db.session.remove()
+
+
+async def notes_stream_endpoint(scope, receive, send):
+    """`GET /api/notes/stream` on the loop: an idle subscriber is a queue, not a thread."""
+    try:
+        user_id = await asyncio.to_thread(_user_id, scope)
+    except AuthError as e:
+        return await _send_json(send, {'error': str(e)}, 401)
+    last_event_id = parse_last_event_id(_header(scope, b'last-event-id'), _query_param(scope, 'last_event_id'))
+    subscription = broadcaster.subscribe(AsyncSubscription(user_id, asyncio.get_running_loop()))
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+        # wake the stream if it is waiting for events
+        subscription.push(None)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        replayed, reset = [], False
+        if last_event_id is not None:
+            replayed, reset = await asyncio.to_thread(_replay, user_id, last_event_id)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        async for frame in aevent_stream(subscription, replayed, reset, last_event_id, disconnected):
+            await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        broadcaster.unsubscribe(subscription)
+        watcher.cancel()
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/translate'): translate_endpoint,
+    ('POST', '/api/generate-notes'): generate_notes_endpoint,
+    ('GET', '/api/notes/stream'): notes_stream_endpoint,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            return await handler(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
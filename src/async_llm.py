@@ -0,0 +1,160 @@
+"""Async counterparts of the LLM helpers, used by the ASGI serving mode.
+
+All in-flight requests share one event loop and one pooled `httpx`
+AsyncClient, so hundreds of slow upstream calls cost sockets, not worker
+threads. Calls go through the same `llm_breaker` and token budgets as the
+sync client and are metered by the same `usage_meter`; prompts and parsing
+are shared with `src.llm` and `src.call_llm_model`.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+from src.llm import (GITHUB_TOKEN, ENDPOINT, DEFAULT_MODEL, default_timeout, build_translate_messages,
+                     fit_translation, split_whitespace)
+from src.circuit_breaker import llm_breaker, CircuitOpenError
+from src.call_llm_model import (LLM_LATENCY_BUDGET, build_note_messages, parse_note_response,
+                                degraded_result, fit_note_input)
+from src.llm_usage import usage_meter
+from src.tokens import TokenBudgetError
+
+MAX_CONNECTIONS = int(os.environ.get('LLM_ASYNC_MAX_CONNECTIONS', '500'))
+# httpcore's pool gets slow when hundreds of idle keep-alive connections pile
+# up under bursty load, so only a small warm set is kept between bursts.
+MAX_KEEPALIVE = int(os.environ.get('LLM_ASYNC_MAX_KEEPALIVE', '20'))
+
+_client = {'loop': None, 'client': None}
+
+
+def _get_client():
+    loop = asyncio.get_running_loop()
+    if _client['client'] is None or _client['loop'] is not loop:
+        _client['client'] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+        )
+        _client['loop'] = loop
+    return _client['client']
+
+
+async def aclose():
+    client = _client['client']
+    _client['client'] = None
+    _client['loop'] = None
+    if client is not None:
+        await client.aclose()
+
+
+def _chat_url():
+    endpoint = os.environ.get("GITHUB_MODELS_ENDPOINT") or ENDPOINT
+    return endpoint.rstrip('/') + '/chat/completions'
+
+
+async def acall_llm_model(model, messages, temperature=1.0, top_p=1.0, timeout=None, endpoint='other'):
+    """Async version of `call_llm_model` (OpenAI-compatible chat completions over HTTP)."""
+    if not GITHUB_TOKEN:
+        raise RuntimeError("GITHUB_TOKEN is not set in environment")
+    if not llm_breaker.allow_request():
+        usage_meter.count(endpoint, 'rejected')
+        raise CircuitOpenError(f"Circuit '{llm_breaker.name}' is open; skipping call")
+
+    payload = {"model": model, "messages": messages, "temperature": temperature, "top_p": top_p}
+    headers = {"Authorization": f"Bearer {GITHUB_TOKEN}", "Content-Type": "application/json"}
+    start = time.monotonic()
+    try:
+        resp = await _get_client().post(_chat_url(), json=payload, headers=headers,
+                                        timeout=timeout or default_timeout())
+        if resp.status_code >= 400:
+            raise RuntimeError(f"LLM request failed: {resp.status_code} {resp.reason_phrase}. "
+                               f"Response body: {resp.text}")
+        data = resp.json()
+        try:
+            content = data["choices"][0]["message"]["content"]
+        except Exception:
+            choice = (data.get("choices") or [None])[0]
+            if isinstance(choice, dict) and "text" in choice:
+                content = choice["text"]
+            else:
+                raise RuntimeError("Unexpected LLM response format: %r" % (data,))
+    except asyncio.CancelledError:
+        # a sibling chunk failed or the client went away, which says nothing
+        # about the upstream; an expired latency budget is recorded by the caller
+        llm_breaker.release()
+        raise
+    except Exception:
+        llm_breaker.record(False, time.monotonic() - start, endpoint)
+        usage_meter.record_error(endpoint, time.monotonic() - start)
+        raise
+    llm_breaker.record(True, time.monotonic() - start, endpoint)
+    usage_meter.record(endpoint, messages, content, data.get("usage"), time.monotonic() - start)
+    return content
+
+
+def _record_timeout(endpoint, seconds):
+    """Count a call abandoned at its latency budget as a failure."""
+    llm_breaker.record(False, seconds, endpoint)
+    usage_meter.record_error(endpoint, seconds)
+
+
+async def _atranslate_piece(text, target_lang):
+    before, core, after = split_whitespace(text)
+    if not core:
+        return text
+    translated = await acall_llm_model(DEFAULT_MODEL, build_translate_messages(core, target_lang),
+                                       endpoint='translate')
+    return before + translated + after
+
+
+async def atranslate(text, target_lang="zh-CN"):
+    pieces = fit_translation(text)
+    if len(pieces) == 1:
+        return await acall_llm_model(DEFAULT_MODEL, build_translate_messages(pieces[0], target_lang),
+                                     endpoint='translate')
+    # chunks of one text go out together; the shared client's pool bounds the fan-out
+    tasks = [asyncio.ensure_future(_atranslate_piece(piece, target_lang)) for piece in pieces]
+    timeout = default_timeout()
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+        errors = [task.exception() for task in tasks if task in done and task.exception() is not None]
+        if errors:
+            raise errors[0]
+        if pending:
+            _record_timeout('translate', timeout)
+            raise RuntimeError(f"Translation timed out after {timeout}s")
+        return ''.join(task.result() for task in tasks)
+    finally:
+        # one failed chunk fails the text: stop spending upstream calls on the others
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def aprocess_user_notes(language, user_input, latency_budget=None, tag_suggester=None, use_llm=True):
+    """Async version of `process_user_notes`, with the same degraded fallbacks."""
+    if latency_budget is None:
+        latency_budget = LLM_LATENCY_BUDGET
+    if not use_llm:
+        return degraded_result(user_input, "LLM skipped", tag_suggester)
+    if llm_breaker.state == llm_breaker.OPEN:
+        return degraded_result(user_input, "LLM circuit open", tag_suggester)
+
+    try:
+        llm_input, truncated = fit_note_input(user_input)
+    except TokenBudgetError as e:
+        return degraded_result(user_input, str(e), tag_suggester)
+    messages = build_note_messages(language, llm_input)
+    try:
+        response_content = await asyncio.wait_for(
+            acall_llm_model(DEFAULT_MODEL, messages, timeout=latency_budget, endpoint='notes'), latency_budget)
+    except asyncio.TimeoutError:
+        _record_timeout('notes', latency_budget)
+        return degraded_result(user_input, f"LLM latency budget of {latency_budget}s exceeded", tag_suggester)
+    except CircuitOpenError:
+        return degraded_result(user_input, "LLM circuit open", tag_suggester)
+    except Exception as e:
+        return degraded_result(user_input, f"LLM call failed: {str(e)}", tag_suggester)
+    result = parse_note_response(user_input, response_content)
+    if truncated:
+        result["input_truncated"] = True
+    return result
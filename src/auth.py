@@ -0,0 +1,103 @@
+import hmac
+import os
+import secrets
+
+from flask import abort, current_app, jsonify, make_response, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+TOKEN_SALT = 'notetaker-user'
+# 0 keeps tokens valid until they are revoked
+USER_TOKEN_MAX_AGE = int(os.environ.get('USER_TOKEN_MAX_AGE_DAYS', '0')) * 86400
+# Only for deployments behind a proxy that authenticates users itself and
+# sets X-User-Id; anyone who can reach the app directly could set it too.
+TRUST_USER_ID_HEADER = os.environ.get('TRUST_USER_ID_HEADER') == '1'
+
+
+class AuthError(Exception):
+    """The request carries a user credential that is invalid or not accepted."""
+
+
+def _serializer(secret_key):
+    if not secret_key:
+        raise AuthError('User tokens are disabled: SECRET_KEY is not set')
+    return URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT)
+
+
+def issue_user_token(user, secret_key=None):
+    """A signed token identifying `user`, valid until it is revoked.
+
+    The token carries the user's `token_secret`, so rotating that column
+    (`revoke_user_tokens()`) or deleting the user invalidates it, even if
+    the id is reused later. Assigns a secret to users that have none yet;
+    the caller commits. Raises AuthError when SECRET_KEY is not set.
+    """
+    serializer = _serializer(secret_key or current_app.secret_key)
+    if not user.token_secret:
+        user.token_secret = secrets.token_hex(16)
+    return serializer.dumps([user.id, user.token_secret])
+
+
+def revoke_user_tokens(user):
+    """Invalidate every token issued for `user` so far; the caller commits."""
+    user.token_secret = secrets.token_hex(16)
+
+
+def _token_user_id(token, secret_key):
+    from src.models.user import User, db
+    try:
+        payload = _serializer(secret_key).loads(token, max_age=USER_TOKEN_MAX_AGE or None)
+    except BadSignature:
+        raise AuthError('Invalid user token')
+    if (not isinstance(payload, list) or len(payload) != 2
+            or not isinstance(payload[0], int) or not isinstance(payload[1], str)):
+        raise AuthError('Invalid user token')
+    user_id, token_secret = payload
+    # on the primary: a revocation must not be hidden by replica lag
+    user = db.session.get(User, user_id, bind_arguments={'bind': db.engine})
+    if user is None or not user.token_secret or not hmac.compare_digest(user.token_secret, token_secret):
+        raise AuthError('Invalid user token')
+    return user_id
+
+
+def resolve_user_id(get_header, get_arg, secret_key):
+    """The user id proven by a request's credentials, or None for anonymous requests.
+
+    `get_header` / `get_arg` look up a request header / query parameter.
+    The user token goes in `Authorization: Bearer <token>`, or `?token=`
+    where headers cannot be set (EventSource). Checking a token reads the
+    user row, so this needs an app context. Raises AuthError.
+    """
+    auth = get_header('Authorization') or ''
+    token = auth[7:].strip() if auth[:7].lower() == 'bearer ' else get_arg('token')
+    if token:
+        return _token_user_id(token, secret_key)
+    raw = get_header('X-User-Id') or get_arg('user_id')
+    if not raw:
+        return None
+    if not TRUST_USER_ID_HEADER:
+        raise AuthError('X-User-Id is not accepted; send a user token as `Authorization: Bearer <token>`')
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise AuthError('Invalid user id')
+
+
+def current_user_id():
+    """Return the id of the requesting user, or None for anonymous requests.
+
+    The user is identified by a signed token from `POST /api/users` (or
+    `POST /api/admin/users/<id>/token`), see `resolve_user_id()`. Requests
+    without one see the anonymous bucket, i.e. notes that have no owner,
+    which keeps the existing single-user frontend working. Those notes are
+    shared by every anonymous caller: only tokens keep notes private.
+    """
+    try:
+        return resolve_user_id(request.headers.get, request.args.get, current_app.secret_key)
+    except AuthError as e:
+        abort(make_response(jsonify({'error': str(e)}), 401))
+
+
+def is_admin_request():
+    """True if the request carries `X-Admin-Token` matching ADMIN_TOKEN (never when it is unset)."""
+    token = os.environ.get('ADMIN_TOKEN')
+    return bool(token) and request.headers.get('X-Admin-Token') == token
@@ -0,0 +1,238 @@
+"""Batched translation of several texts into several languages.
+
+`translate()` costs one LLM round trip (and one copy of the system prompt)
+per text and language. `translate_batch()` instead packs (text, language)
+tasks into as few requests as BATCH_TRANSLATE_MAX_TOKENS allows. Each text
+is sent once per request however many languages it is wanted in, and the
+model answers with one delimited block per task:
+
+    <<<3>>>
+    translated text
+
+Blocks are matched back to tasks by id. Tasks whose block is missing or
+empty are retried in two smaller batches, and a task left on its own goes
+through the plain single-text `translate()`. Texts that contain one of the
+`<<<...>>>` markers themselves would throw off the segmentation, so they are
+always translated on their own. Translations are cached by (language,
+text), so repeated items never reach the LLM.
+"""
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.cache import LRUCache
+from src.circuit_breaker import CircuitOpenError
+from src.llm import call_llm_model, translate, DEFAULT_MODEL
+from src.tokens import estimate_tokens
+
+BATCH_MAX_TOKENS = int(os.environ.get('BATCH_TRANSLATE_MAX_TOKENS', '3000'))
+BATCH_MAX_TASKS = int(os.environ.get('BATCH_TRANSLATE_MAX_TASKS', '40'))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_TRANSLATE_CONCURRENCY', '4'))
+CACHE_TTL = int(os.environ.get('TRANSLATION_CACHE_TTL', '86400'))
+# ids, arrows and delimiters around every task
+TASK_OVERHEAD_TOKENS = 12
+
+BLOCK_RE = re.compile(r'^<<<(\d+)>>>[ \t]*$', re.MULTILINE)
+END_MARKER = '<<<end>>>'
+# anything a batch prompt or response could mistake for a delimiter
+MARKER_RE = re.compile(r'<<<(?:end|S?\d+)>>>')
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a helpful translator. The user sends numbered source segments and a list of "
+    "translation tasks of the form `<task id>: <segment id> -> <target language>`.\n"
+    "For every task, output a line `<<<task id>>>` followed by the translation of that segment "
+    "into that language. Output the tasks in the given order, one block per task, then a final "
+    f"line `{END_MARKER}`. Output nothing else: no commentary, no code fences, and never "
+    "translate or alter the `<<<...>>>` markers."
+)
+
+translation_cache = LRUCache(max_entries=int(os.environ.get('TRANSLATION_CACHE_SIZE', '4096')))
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='translate-batch')
+
+
+def _cache_key(text, lang):
+    return hashlib.sha256(f'{lang}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def has_markers(text):
+    """True if `text` contains a delimiter and so cannot share a batch."""
+    return MARKER_RE.search(text) is not None
+
+
+def _task_cost(text):
+    # the text's share of the prompt plus a translation of about the same length
+    return 2 * estimate_tokens(text) + TASK_OVERHEAD_TOKENS
+
+
+def pack_tasks(tasks, texts, max_tokens=BATCH_MAX_TOKENS, max_tasks=BATCH_MAX_TASKS):
+    """Split `tasks` ([(text index, lang)]) into batches under the token budget.
+
+    Tasks of the same text stay together where possible, so the text is sent
+    only once. A task that alone exceeds the budget gets a batch of its own.
+    """
+    batches, current, cost, sent = [], [], 0, set()
+    for index, lang in sorted(tasks):
+        extra = TASK_OVERHEAD_TOKENS + estimate_tokens(texts[index])
+        if index not in sent:
+            extra = _task_cost(texts[index])
+        if current and (cost + extra > max_tokens or len(current) >= max_tasks):
+            batches.append(current)
+            current, cost, sent = [], 0, set()
+            extra = _task_cost(texts[index])
+        current.append((index, lang))
+        cost += extra
+        sent.add(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_messages(batch, texts):
+    segments = sorted({index for index, _ in batch})
+    lines = ['Segments:']
+    for index in segments:
+        lines.append(f'<<<S{index}>>>')
+        lines.append(texts[index])
+    lines.append(END_MARKER)
+    lines.append('Tasks:')
+    for task_id, (index, lang) in enumerate(batch):
+        lines.append(f'{task_id}: S{index} -> {lang}')
+    return [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": '\n'.join(lines)},
+    ]
+
+
+def parse_batch_response(content, count):
+    """Return {task id: translation} for the well-formed blocks of `content`."""
+    content = (content or '').strip()
+    if content.startswith('```'):
+        content = content.strip('`').split('\n', 1)[-1]
+    end = content.rfind(END_MARKER)
+    if end != -1:
+        content = content[:end]
+    matches = list(BLOCK_RE.finditer(content))
+    parsed = {}
+    for i, match in enumerate(matches):
+        task_id = int(match.group(1))
+        stop = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        translation = content[match.end():stop].strip()
+        # a repeated id means the model lost track of the tasks; trust neither copy
+        if task_id in parsed:
+            parsed[task_id] = None
+        elif 0 <= task_id < count and translation:
+            parsed[task_id] = translation
+    return {task_id: value for task_id, value in parsed.items() if value is not None}
+
+
+class _BatchRun:
+    def __init__(self, texts):
+        self.texts = texts
+        self.results = {}  # (text index, lang) -> translation
+        self.errors = {}   # (text index, lang) -> message
+        self.llm_calls = 0
+        self.circuit_error = None  # set once the breaker rejects a call
+        self._lock = threading.Lock()
+
+    def _count_call(self):
+        with self._lock:
+            self.llm_calls += 1
+
+    def run(self, batch):
+        if self.circuit_error is not None:
+            for task in batch:
+                self.errors[task] = self.circuit_error
+            return
+        if len(batch) == 1:
+            self._single(batch[0])
+            return
+        self._count_call()
+        try:
+            content = call_llm_model(DEFAULT_MODEL, build_batch_messages(batch, self.texts), temperature=0.2,
+                                     endpoint='translate_batch')
+            parsed = parse_batch_response(content, len(batch))
+        except CircuitOpenError as e:
+            self.circuit_error = str(e)
+            for task in batch:
+                self.errors[task] = self.circuit_error
+            return
+        except Exception as e:
+            print(f"[WARN] Batch translation of {len(batch)} tasks failed, splitting: {e}")
+            parsed = {}
+        missing = []
+        for task_id, task in enumerate(batch):
+            if task_id in parsed:
+                self.results[task] = parsed[task_id]
+            else:
+                missing.append(task)
+        if missing:
+            half = (len(missing) + 1) // 2
+            self.run(missing[:half])
+            if missing[half:]:
+                self.run(missing[half:])
+
+    def _single(self, task):
+        index, lang = task
+        self._count_call()
+        try:
+            self.results[task] = translate(self.texts[index], lang)
+        except CircuitOpenError as e:
+            self.circuit_error = self.errors[task] = str(e)
+        except Exception as e:
+            self.errors[task] = str(e)
+
+
+def translate_batch(texts, langs):
+    """Translate every text into every language.
+
+    Returns (translations, errors, stats): translations[i][lang] is the
+    translation of texts[i] (missing on error), errors lists
+    {'index', 'lang', 'error'} and stats counts cache hits and LLM calls.
+
+    When the LLM circuit opens part way, the tasks done so far are still
+    returned, the rest are listed as errors and stats has `degraded` set.
+    Raises CircuitOpenError only if nothing could be translated at all.
+    """
+    translations = [{} for _ in texts]
+    pending = []
+    for index, text in enumerate(texts):
+        for lang in langs:
+            cached = translation_cache.get(_cache_key(text, lang))
+            if cached is not None:
+                translations[index][lang] = cached
+            else:
+                pending.append((index, lang))
+    cached_count = len(texts) * len(langs) - len(pending)
+
+    # identical texts are translated once
+    first_index = {}
+    unique = []
+    for index, lang in pending:
+        first = first_index.setdefault(texts[index], index)
+        if first == index:
+            unique.append((index, lang))
+
+    run = _BatchRun(texts)
+    batches = pack_tasks([task for task in unique if not has_markers(texts[task[0]])], texts)
+    batches += [[task] for task in unique if has_markers(texts[task[0]])]
+    futures = [_batch_executor.submit(run.run, batch) for batch in batches]
+    for future in futures:
+        future.result()
+
+    if run.circuit_error is not None and not run.results and not cached_count:
+        raise CircuitOpenError(run.circuit_error)
+    errors = []
+    for index, lang in pending:
+        source = (first_index[texts[index]], lang)
+        if source in run.results:
+            translations[index][lang] = run.results[source]
+            translation_cache.set(_cache_key(texts[index], lang), run.results[source], ttl=CACHE_TTL)
+        else:
+            errors.append({'index': index, 'lang': lang,
+                           'error': run.errors.get(source, 'Translation failed')})
+
+    stats = {'tasks': len(texts) * len(langs), 'cached': cached_count,
+             'batches': len(batches), 'llm_calls': run.llm_calls, 'degraded': run.circuit_error is not None}
+    return translations, errors, stats
@@ -0,0 +1,232 @@
+"""Read-through cache for note reads.
+
+Two backends share one small interface (get / set / incr / add):
+
+* `LRUCache` - in-process, bounded, per-key TTL.
+* `ExternalCache` - wraps a Redis-style client so every worker process
+  shares one cache. Used by default when CACHE_REDIS_URL is set. `LocalCacheClient` is an in-memory stand-in with the
+  same client API, for tests and single-process runs.
+
+Invalidation uses version keys: every cached note read of a user embeds
+that user's current version number in its key, and each write bumps the
+version. Stale entries are never deleted, they just stop being looked up
+and age out. With the external backend the version lives in the shared
+store, so a write in one worker invalidates the cache in all of them. The
+LRU backend only sees the writes of its own process, so other workers (or
+serverless instances) keep serving what they cached until it expires. It
+is therefore opt-in (`CACHE_BACKEND=lru`) and its entries live only
+CACHE_LRU_TTL seconds. Without a shared backend nothing is cached.
+
+Reads served by a lagging read replica are not stored: the version in their
+key may already include a write the replica has not seen yet.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.db_routing import served_from_replica
+
+DEFAULT_TTL = int(os.environ.get('CACHE_TTL', '300'))
+LRU_TTL = int(os.environ.get('CACHE_LRU_TTL', '5'))
+# Listings longer than this are streamed straight from the database and not cached
+LIST_MAX_ITEMS = int(os.environ.get('CACHE_LIST_MAX_ITEMS', '500'))
+
+
+class LRUCache:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] is not None and item[0] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            return item[1] if item else None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value):
+        """Set `key` only if it is missing. Returns True if it was set."""
+        with self._lock:
+            if self._alive(key, time.monotonic()) is not None:
+                return False
+            self._data[key] = (None, value)
+            return True
+
+    def incr(self, key):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            value = int(item[1]) + 1 if item else 1
+            self._data[key] = (item[0] if item else None, value)
+            return value
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalCacheClient:
+    """In-memory stand-in for a Redis client (get/set/incr subset)."""
+
+    def __init__(self):
+        self._lru = LRUCache(max_entries=100000)
+
+    def get(self, key):
+        return self._lru.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx:
+            return self._lru.add(key, value)
+        self._lru.set(key, value, ttl=ex)
+        return True
+
+    def incr(self, key):
+        return self._lru.incr(key)
+
+
+class ExternalCache:
+    def __init__(self, client, prefix='notetaker:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def add(self, key, value):
+        return bool(self.client.set(self.prefix + key, value, nx=True))
+
+    def incr(self, key):
+        return int(self.client.incr(self.prefix + key))
+
+
+class NoteCache:
+    def __init__(self, backend, ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _version(self, user_id):
+        key = f'ver:u{user_id}'
+        version = self.backend.get(key)
+        if version is None:
+            # Seed with a time-based value rather than 0, so a version key
+            # that was evicted can never come back to an already used value.
+            self.backend.add(key, str(time.time_ns()))
+            version = self.backend.get(key)
+        return version
+
+    def lookup(self, user_id, name):
+        """Return (key, value) for `name`; value is None on a miss.
+
+        The key pins the version current at lookup time, so a result stored
+        under it later can never shadow a write that happened in between.
+        """
+        if self.backend is None:
+            return None, None
+        try:
+            key = f'notes:u{user_id}:v{self._version(user_id)}:{name}'
+            cached = self.backend.get(key)
+        except Exception as e:
+            # a broken cache must never break reads
+            print(f"[WARN] cache read failed: {e}")
+            self._count('_errors')
+            return None, None
+        if cached is not None:
+            self._count('_hits')
+            return key, json.loads(cached)
+        self._count('_misses')
+        return key, None
+
+    def store(self, key, value):
+        if self.backend is None or key is None or served_from_replica():
+            return
+        try:
+            self.backend.set(key, json.dumps(value), ttl=self.ttl)
+        except Exception as e:
+            print(f"[WARN] cache write failed: {e}")
+            self._count('_errors')
+
+    def get_or_load(self, user_id, name, loader):
+        """Return the cached JSON-able value for `name`, calling `loader()` on a miss."""
+        key, value = self.lookup(user_id, name)
+        if value is not None:
+            return value
+        value = loader()
+        self.store(key, value)
+        return value
+
+    def invalidate_user(self, user_id):
+        """Drop every cached read of `user_id` by bumping their version."""
+        if self.backend is None:
+            return
+        key = f'ver:u{user_id}'
+        try:
+            if self.backend.incr(key) == 1:
+                # the version key had been evicted: move past every value it ever had
+                self.backend.set(key, str(time.time_ns()))
+        except Exception as e:
+            print(f"[WARN] cache invalidation failed: {e}")
+            self._count('_errors')
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': type(self.backend).__name__ if self.backend is not None else None,
+                'hits': self._hits,
+                'misses': self._misses,
+                'errors': self._errors,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'ttl': self.ttl,
+            }
+
+
+def _create_backend():
+    """(backend, ttl) for CACHE_BACKEND; defaults to Redis with CACHE_REDIS_URL set, else no cache."""
+    kind = os.environ.get('CACHE_BACKEND', 'redis' if os.environ.get('CACHE_REDIS_URL') else 'none').lower()
+    if kind == 'redis':
+        try:
+            import redis
+            client = redis.Redis.from_url(os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+            return ExternalCache(client), DEFAULT_TTL
+        except Exception as e:
+            print(f"[WARN] Redis cache unavailable, note reads are not cached: {e}")
+            return None, DEFAULT_TTL
+    if kind == 'local':
+        return ExternalCache(LocalCacheClient()), DEFAULT_TTL
+    if kind == 'lru':
+        return LRUCache(max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', '2048'))), min(DEFAULT_TTL, LRU_TTL)
+    return None, DEFAULT_TTL
+
+
+note_cache = NoteCache(*_create_backend())
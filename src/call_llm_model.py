@@ -2,16 +2,38 @@ import json
 import os
 import sys
 from datetime import datetime, date, time
+from functools import lru_cache
 from dateutil import parser
 from dateutil.relativedelta import relativedelta
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # Add the project root to sys.path so we can import src modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from src.llm import call_llm_model, DEFAULT_MODEL
+from src.circuit_breaker import llm_breaker, CircuitOpenError
+from src.llm_usage import usage_meter
+from src.tokens import notes_budget, TokenBudgetError
 
-# System prompt template for extracting structured notes
+# Per-request latency budget (seconds) for the LLM call in process_user_notes.
+# Once it is spent the user gets the local fallback result right away.
+LLM_LATENCY_BUDGET = float(os.environ.get('LLM_LATENCY_BUDGET', '8'))
+
+# Calls that outlive their budget keep running here so the breaker still
+# learns about their outcome, without holding up the request. At most
+# LLM_MAX_QUEUE calls wait for a worker; beyond that requests get the local
+# fallback right away instead of piling up behind a slow upstream.
+LLM_MAX_WORKERS = int(os.environ.get('LLM_MAX_WORKERS', '16'))
+LLM_MAX_QUEUE = int(os.environ.get('LLM_MAX_QUEUE', str(2 * LLM_MAX_WORKERS)))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='llm')
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_WORKERS + LLM_MAX_QUEUE)
+
+# System prompt template for extracting structured notes. It only depends on
+# the date, so it is formatted once per day and stays byte-identical between
+# requests: providers cache prompt prefixes, and the cached part is billed
+# (and answered) faster. The per-request language goes after it.
 system_prompt_template = '''
 Extract the user's notes into the following structured fields:
 1. Title: A concise title of the notes less than 5 words
@@ -22,8 +44,6 @@ Extract the user's notes into the following structured fields:
 
 Current date context: Today is {current_date_cn} ({current_date_en}).
 
-Output in JSON format without ```json. Output title and notes in the language: {lang}.
-
 Example (假设今天是{example_today}):
 Input: "今天下午5点去野餐".
 Output:
@@ -46,6 +66,10 @@ Output:
 }}
 '''
 
+system_prompt_language = '''
+Output in JSON format without ```json. Output title and notes in the language: {lang}.
+'''
+
 def parse_date_time_fallback(user_input):
     """
     Fallback function to parse common Chinese date/time expressions when LLM fails.
@@ -113,19 +137,9 @@ def parse_date_time_fallback(user_input):
     return parsed_date, parsed_time
 
 
-def process_user_notes(language, user_input):
-    """
-    Process user input and extract structured note fields using LLM.
-    
-    Args:
-        language (str): Target language for title and notes (e.g., "Chinese", "English")
-        user_input (str): Raw user input to be processed
-    
-    Returns:
-        dict: Structured note data with Title, Notes, Tags, Event_Date, Event_Time fields
-    """
-    # 获取当前日期信息
-    current_date = date.today()
+@lru_cache(maxsize=2)
+def system_prompt_prefix(current_date):
+    """The language-independent part of the note system prompt for `current_date`."""
     tomorrow_date = current_date + relativedelta(days=1)
     
     # 格式化日期信息
@@ -135,14 +149,18 @@ def process_user_notes(language, user_input):
     example_tomorrow = tomorrow_date.strftime('%Y-%m-%d')
     
     # 填充系统提示模板
-    system_prompt_filled = system_prompt_template.format(
-        lang=language,
+    return system_prompt_template.format(
         current_date_cn=current_date_cn,
         current_date_en=current_date_en,
         example_today=example_today,
         example_tomorrow=example_tomorrow
     )
-    
+
+
+def build_note_messages(language, user_input):
+    """Build the chat messages for extracting a structured note from `user_input`."""
+    system_prompt_filled = system_prompt_prefix(date.today()) + system_prompt_language.format(lang=language)
+
     messages = [
         {
             "role": "system",
@@ -153,9 +171,12 @@ def process_user_notes(language, user_input):
             "content": user_input,
         }
     ]
-    
+    return messages
+
+
+def parse_note_response(user_input, response_content):
+    """Parse the model's JSON answer, filling missing date/time via the fallback parser."""
     try:
-        response_content = call_llm_model(DEFAULT_MODEL, messages)
         # Try to parse JSON response
         parsed_result = json.loads(response_content.strip())
         
@@ -184,18 +205,109 @@ def process_user_notes(language, user_input):
             "error": "Failed to parse LLM response as JSON, used fallback parsing",
             "raw_response": response_content
         }
+
+
+def fit_note_input(user_input):
+    """(text to send, truncated) for `user_input` under the notes token budget.
+
+    Raises TokenBudgetError when it is over budget and LLM_NOTES_OVERFLOW is `reject`.
+    """
+    try:
+        pieces, action = notes_budget.fit(user_input)
+    except TokenBudgetError:
+        usage_meter.count('notes', 'rejected')
+        raise
+    if action:
+        usage_meter.count('notes', action)
+    return pieces[0], action == 'truncated'
+
+
+def degraded_result(user_input, reason, tag_suggester=None):
+    """Build the local fallback result used when the LLM is skipped or too slow.
+
+    `tag_suggester`, if given, is a callable text -> list of tag names used
+    to fill Tags locally.
+    """
+    fallback_date, fallback_time = parse_date_time_fallback(user_input)
+    tags = []
+    if tag_suggester is not None:
+        try:
+            tags = tag_suggester(user_input)
+        except Exception as e:
+            print(f"[WARN] Local tag suggestion failed: {e}")
+    return {
+        "Title": "Generated Note",
+        "Notes": user_input,
+        "Tags": tags,
+        "Event_Date": fallback_date,
+        "Event_Time": fallback_time,
+        "degraded": True,
+        "degraded_reason": reason,
+    }
+
+
+def process_user_notes(language, user_input, latency_budget=None, tag_suggester=None, use_llm=True):
+    """
+    Process user input and extract structured note fields using LLM.
+    
+    Args:
+        language (str): Target language for title and notes (e.g., "Chinese", "English")
+        user_input (str): Raw user input to be processed
+        latency_budget (float): Seconds to wait for the LLM before answering
+            with the local fallback (defaults to LLM_LATENCY_BUDGET)
+        tag_suggester (callable): Local text -> tags function used for the
+            fallback's Tags when the LLM is skipped or degraded
+        use_llm (bool): False skips the LLM entirely
+    
+    Returns:
+        dict: Structured note data with Title, Notes, Tags, Event_Date, Event_Time fields.
+            Results produced without the LLM carry "degraded": True. When
+            `user_input` was over the notes token budget, the LLM only saw
+            its beginning and end and the result carries "input_truncated": True.
+    """
+    if latency_budget is None:
+        latency_budget = LLM_LATENCY_BUDGET
+
+    if not use_llm:
+        return degraded_result(user_input, "LLM skipped", tag_suggester)
+    # Don't even queue the call while the circuit is open
+    if llm_breaker.state == llm_breaker.OPEN:
+        return degraded_result(user_input, "LLM circuit open", tag_suggester)
+
+    try:
+        llm_input, truncated = fit_note_input(user_input)
+    except TokenBudgetError as e:
+        return degraded_result(user_input, str(e), tag_suggester)
+    messages = build_note_messages(language, llm_input)
+
+    if not _llm_slots.acquire(blocking=False):
+        usage_meter.count('notes', 'rejected')
+        return degraded_result(user_input, "LLM queue full", tag_suggester)
+    try:
+        future = _llm_executor.submit(call_llm_model, DEFAULT_MODEL, messages, timeout=latency_budget,
+                                      endpoint='notes')
+    except BaseException:
+        _llm_slots.release()
+        raise
+    future.add_done_callback(lambda _: _llm_slots.release())
+    try:
+        response_content = future.result(timeout=latency_budget)
+    except FutureTimeoutError:
+        # drops the call if it is still queued; a running one finishes for the breaker
+        future.cancel()
+        return degraded_result(user_input, f"LLM latency budget of {latency_budget}s exceeded", tag_suggester)
+    except CircuitOpenError:
+        return degraded_result(user_input, "LLM circuit open", tag_suggester)
     except Exception as e:
         # If LLM call fails, try fallback parsing
-        fallback_date, fallback_time = parse_date_time_fallback(user_input)
-        
-        return {
-            "Title": "Generated Note", 
-            "Notes": user_input,
-            "Tags": [],
-            "Event_Date": fallback_date,
-            "Event_Time": fallback_time,
-            "error": f"LLM call failed: {str(e)}, used fallback parsing"
-        }
+        return degraded_result(user_input, f"LLM call failed: {str(e)}", tag_suggester)
+
+    result = parse_note_response(user_input, response_content)
+    if truncated:
+        result["input_truncated"] = True
+    return result
+
+
 # Run the main function if this script is executed
 if __name__ == "__main__":
     result = process_user_notes("Chinese", "Get up tomorrow 7am")
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker:
+    """A small thread-safe circuit breaker for the LLM transport.
+
+    The breaker keeps a rolling window of recent call outcomes. It trips
+    (goes ``open``) when either the failure rate or the slow-call rate over
+    that window crosses its threshold. While open, calls are rejected right
+    away with ``CircuitOpenError``. After ``reset_timeout`` seconds it goes
+    ``half_open`` and lets a few probe calls through: if they all succeed the
+    circuit closes again, any failure re-opens it.
+
+    What counts as slow can differ per endpoint (``slow_call_durations``), since
+    endpoints that share the upstream can have very different timeouts; other
+    endpoints use ``slow_call_duration``.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate_threshold=0.5, slow_call_rate_threshold=0.8,
+                 slow_call_duration=10.0, window_size=20, minimum_calls=5,
+                 reset_timeout=30.0, half_open_max_calls=1, slow_call_durations=None):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_durations = dict(slow_call_durations or {})
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window_size)  # (ok, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def allow_request(self):
+        """Return True if a call may proceed, reserving a probe slot when half-open."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        """Give back the slot of an allowed call that was abandoned without an outcome (e.g. cancelled)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def slow_threshold(self, endpoint=None):
+        return self.slow_call_durations.get(endpoint, self.slow_call_duration)
+
+    def record(self, ok, duration, endpoint=None):
+        """Record the outcome of a call that was allowed through."""
+        slow = duration >= self.slow_threshold(endpoint)
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if ok and not slow:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_max_calls:
+                        self._state = self.CLOSED
+                        self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            if self._state == self.OPEN:
+                return
+
+            self._outcomes.append((ok, slow))
+            total = len(self._outcomes)
+            if total < self.minimum_calls:
+                return
+            failures = sum(1 for o, _ in self._outcomes if not o)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if (failures / total >= self.failure_rate_threshold or
+                    slow_calls / total >= self.slow_call_rate_threshold):
+                self._trip()
+
+    def call(self, func, *args, endpoint=None, **kwargs):
+        """Run ``func`` through the breaker, raising CircuitOpenError when open.
+
+        ``endpoint`` picks the slow threshold and is not passed to ``func``.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open; skipping call")
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(False, time.monotonic() - start, endpoint)
+            raise
+        self.record(True, time.monotonic() - start, endpoint)
+        return result
+
+    def to_dict(self):
+        with self._lock:
+            self._maybe_half_open()
+            total = len(self._outcomes)
+            failures = sum(1 for o, _ in self._outcomes if not o)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_calls': total,
+                'window_failures': failures,
+                'failure_rate_threshold': self.failure_rate_threshold,
+                'slow_call_duration': self.slow_call_duration,
+                'slow_call_durations': dict(self.slow_call_durations),
+                'reset_timeout': self.reset_timeout,
+            }
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Note generation calls that outlast LLM_LATENCY_BUDGET (see
+# src/call_llm_model.py) time out and count as failures, so a slow threshold
+# at or above it never fires.
+_latency_budget = _env_float('LLM_LATENCY_BUDGET', 8.0)
+LLM_SLOW_CALL_SECONDS = _env_float('LLM_BREAKER_SLOW_SECONDS', 0.75 * _latency_budget)
+if LLM_SLOW_CALL_SECONDS >= _latency_budget:
+    print(f"[WARN] LLM_BREAKER_SLOW_SECONDS ({LLM_SLOW_CALL_SECONDS}s) is not below LLM_LATENCY_BUDGET "
+          f"({_latency_budget}s); the breaker will not trip on slow calls")
+# Every other call (translations) gets the full LLM timeout, the same as
+# src.llm.default_timeout(), and is only slow well into it.
+_call_timeout = 15.0 if os.environ.get('VERCEL') else 30.0
+LLM_TRANSLATE_SLOW_CALL_SECONDS = _env_float('LLM_BREAKER_TRANSLATE_SLOW_SECONDS', 0.75 * _call_timeout)
+
+# Shared breaker guarding every call to the LLM endpoint
+llm_breaker = CircuitBreaker(
+    'llm',
+    failure_rate_threshold=_env_float('LLM_BREAKER_FAILURE_RATE', 0.5),
+    slow_call_rate_threshold=_env_float('LLM_BREAKER_SLOW_RATE', 0.8),
+    slow_call_duration=LLM_TRANSLATE_SLOW_CALL_SECONDS,
+    slow_call_durations={'notes': LLM_SLOW_CALL_SECONDS},
+    window_size=int(_env_float('LLM_BREAKER_WINDOW', 20)),
+    minimum_calls=int(_env_float('LLM_BREAKER_MIN_CALLS', 5)),
+    reset_timeout=_env_float('LLM_BREAKER_RESET_SECONDS', 30.0),
+)
@@ -0,0 +1,200 @@
+"""Optional read-replica routing.
+
+With DATABASE_READ_URL set, the replica is registered as the `replica`
+bind and `RoutingSession` sends SELECTs of GET/HEAD requests to it, so
+listings, searches and tag statistics stay off the primary. Everything
+else goes to the primary:
+
+* any statement that is not a SELECT, and every statement after it in the
+  same request (so a GET that writes, e.g. flushing coalesced patches or
+  rehydrating an archived note, reads its own writes),
+* requests within DB_STICKY_SECONDS of a successful write by the same
+  client (`db_sticky_until` cookie) or the same user (tracked per process),
+* all requests while the replica is unreachable or lags more than
+  DB_REPLICA_MAX_LAG seconds. Lag is checked at most every
+  DB_REPLICA_CHECK_INTERVAL seconds; a replica connection error also
+  sends traffic to the primary until the next check.
+
+The response header `X-DB-Read` tells which side served the reads.
+Results read from the replica may lag behind the version keys of the note
+cache, so they are never cached (`served_from_replica()`).
+"""
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+
+READ_URL = os.environ.get('DATABASE_READ_URL')
+REPLICA_BIND = 'replica'
+STICKY_SECONDS = float(os.environ.get('DB_STICKY_SECONDS', '5'))
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', '2'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+STICKY_COOKIE = 'db_sticky_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+MAX_TRACKED_USERS = 10000
+
+PG_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def with_sslmode(url):
+    # Neon requires SSL; same default as DATABASE_URL
+    if url.startswith('postgres') and 'sslmode=' not in url:
+        sep = '&' if '?' in url else '?'
+        url = f"{url}{sep}sslmode=require"
+    return url
+
+
+class ReplicaMonitor:
+    def __init__(self, max_lag=REPLICA_MAX_LAG, interval=REPLICA_CHECK_INTERVAL):
+        self.max_lag = max_lag
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._healthy = False
+        self.lag = None
+        self.error = None
+
+    def healthy(self, engine):
+        if time.monotonic() - self._checked_at >= self.interval and self._lock.acquire(blocking=False):
+            try:
+                self._check(engine)
+            finally:
+                self._lock.release()
+        return self._healthy
+
+    def _check(self, engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(conn.execute(PG_LAG_QUERY).scalar() or 0)
+                else:
+                    conn.execute(text('SELECT 1'))
+                    lag = 0.0
+            self.lag = lag
+            self.error = None
+            self._healthy = lag <= self.max_lag
+        except Exception as e:
+            self.lag = None
+            self.error = str(e)
+            self._healthy = False
+            print(f"[WARN] Read replica unavailable, reading from primary: {e}")
+        self._checked_at = time.monotonic()
+
+    def mark_failed(self, error):
+        self.error = str(error)
+        self._healthy = False
+        self._checked_at = time.monotonic()
+
+    def to_dict(self):
+        return {'healthy': self._healthy, 'lag_seconds': self.lag, 'max_lag_seconds': self.max_lag,
+                'error': self.error, 'configured': bool(READ_URL)}
+
+
+replica_monitor = ReplicaMonitor()
+
+# user id -> monotonic time until which their reads go to the primary
+_recent_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _is_read(clause):
+    return isinstance(clause, Select) or bool(getattr(clause, 'is_select', False))
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get('db_read_replica'):
+            if self._flushing or not _is_read(clause):
+                # from the first write on, this request reads from the primary
+                g.db_read_replica = False
+            else:
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None:
+                    g.db_replica_used = True
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary():
+    """Send the rest of this request's reads to the primary (e.g. when they must not lag)."""
+    if has_request_context():
+        g.db_read_replica = False
+
+
+def served_from_replica():
+    """True if this request has read anything from the replica."""
+    return has_request_context() and bool(g.get('db_replica_used'))
+
+
+def configure_read_replica(app):
+    """Register DATABASE_READ_URL as the replica bind; call before `db.init_app(app)`."""
+    if READ_URL:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = with_sslmode(READ_URL)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _user_key():
+    # the raw credential is enough to tell writers apart; it is verified where it matters
+    return (request.headers.get('Authorization') or request.args.get('token')
+            or request.headers.get('X-User-Id') or request.args.get('user_id'))
+
+
+def _sticky():
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = _user_key()
+    if user:
+        with _writers_lock:
+            until = _recent_writers.get(user)
+        return until is not None and until > time.monotonic()
+    return False
+
+
+def _remember_write(response):
+    response.set_cookie(STICKY_COOKIE, f'{time.time() + STICKY_SECONDS:.3f}',
+                        max_age=int(STICKY_SECONDS) + 1, httponly=True, samesite='Lax')
+    user = _user_key()
+    if user:
+        with _writers_lock:
+            if len(_recent_writers) >= MAX_TRACKED_USERS:
+                now = time.monotonic()
+                for key in [k for k, until in _recent_writers.items() if until <= now]:
+                    del _recent_writers[key]
+            _recent_writers[user] = time.monotonic() + STICKY_SECONDS
+
+
+def init_read_routing(app, db):
+    """Install the per-request routing decision; must run after `db.init_app(app)` in an app context."""
+    if not READ_URL:
+        return
+    replica = db.engines[REPLICA_BIND]
+
+    @event.listens_for(replica, 'handle_error')
+    def _replica_failed(context):
+        if context.is_disconnect or context.connection is None:
+            replica_monitor.mark_failed(context.original_exception)
+
+    @app.before_request
+    def choose_read_bind():
+        g.db_read_replica = (request.method in ('GET', 'HEAD') and not _sticky()
+                             and replica_monitor.healthy(replica))
+
+    @app.after_request
+    def note_read_bind(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            _remember_write(response)
+        if request.method in ('GET', 'HEAD'):
+            response.headers['X-DB-Read'] = 'replica' if g.get('db_read_replica') else 'primary'
+        return response
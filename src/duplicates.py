@@ -0,0 +1,281 @@
+"""Near-duplicate note detection with SimHash.
+
+Every note gets a 64-bit SimHash over the same character n-grams the
+fuzzy search uses (so it works for CJK text and ignores case, width and
+traditional/simplified differences). Similar notes get fingerprints that
+differ in few bits. Fingerprints live in the `note_fingerprint` side table,
+kept current by mapper events on every write, split into seven bands with
+one index each: notes within MAX_DISTANCE (6) bits of each other share at
+least one band, so a lookup is seven index probes plus a Hamming check on
+the few candidates. Short notes that differ by a word or two typically
+land 3-7 bits apart, hence more and narrower bands than the classic four
+16-bit ones.
+
+`cluster_duplicates()` groups near-duplicates across the whole corpus. It
+first joins notes with identical fingerprints, then buckets the distinct
+fingerprints by (owner, band), compares only within buckets and merges
+matches with union-find, which is roughly linear in the number of notes.
+`duplicate_job` runs it in a background thread.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, inspect
+
+from src.models.note import Note
+from src.models.note_fingerprint import NoteFingerprint
+from src.models.user import db
+from src.search_index import note_ngrams
+
+BITS = 64
+BAND_WIDTHS = (10, 9, 9, 9, 9, 9, 9)
+BANDS = len(BAND_WIDTHS)
+# the largest distance the bands are guaranteed to find (pigeonhole)
+MAX_DISTANCE = BANDS - 1
+DEFAULT_DISTANCE = MAX_DISTANCE
+# buckets of more distinct fingerprints than this are a degenerate band value; skip them
+MAX_BUCKET = 500
+
+# SimHash sums +1/-1 per bit over all features. Instead of looping over 64
+# bits per feature, each bit gets a LANE-bit wide counter lane in one big
+# integer: a feature adds the precomputed "spread" of its hash bytes.
+LANE = 24
+LANE_MASK = (1 << LANE) - 1
+_SPREAD = [[sum(1 << (LANE * (8 * k + i)) for i in range(8) if byte >> i & 1) for byte in range(256)]
+           for k in range(8)]
+
+
+def _feature_hash(feature):
+    return hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+
+
+def simhash(features):
+    """64-bit SimHash (unsigned) of an iterable of string features."""
+    total = 0
+    count = 0
+    for feature in features:
+        for k, byte in enumerate(_feature_hash(feature)):
+            total += _SPREAD[k][byte]
+        count += 1
+    value = 0
+    for bit in range(BITS):
+        if 2 * ((total >> (LANE * bit)) & LANE_MASK) > count:
+            value |= 1 << bit
+    return value
+
+
+def note_simhash(title, content):
+    return simhash(note_ngrams(title, content))
+
+
+def to_signed(value):
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value & ((1 << BITS) - 1)
+
+
+def bands(value):
+    result = []
+    for width in BAND_WIDTHS:
+        result.append(value & ((1 << width) - 1))
+        value >>= width
+    return result
+
+
+def hamming(a, b):
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count('1')
+
+
+def fingerprint_row(note_id, user_id, title, content):
+    value = note_simhash(title, content)
+    row = {'note_id': note_id, 'user_id': user_id, 'simhash': to_signed(value)}
+    for i, band in enumerate(bands(value)):
+        row[f'band{i}'] = band
+    return row
+
+
+# --- index maintenance -------------------------------------------------
+
+def _store_fingerprint(connection, note_id, user_id, title, content):
+    table = NoteFingerprint.__table__
+    connection.execute(table.delete().where(table.c.note_id == note_id))
+    connection.execute(table.insert(), [fingerprint_row(note_id, user_id, title, content)])
+
+
+@event.listens_for(Note, 'after_insert')
+def _fingerprint_inserted_note(mapper, connection, target):
+    _store_fingerprint(connection, target.id, target.user_id, target.title, target.content)
+
+
+@event.listens_for(Note, 'after_update')
+def _fingerprint_updated_note(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('title', 'content', 'user_id')):
+        _store_fingerprint(connection, target.id, target.user_id, target.title, target.content)
+
+
+@event.listens_for(Note, 'after_delete')
+def _drop_fingerprint(mapper, connection, target):
+    table = NoteFingerprint.__table__
+    connection.execute(table.delete().where(table.c.note_id == target.id))
+
+
+def rebuild_fingerprints(batch_size=500):
+    """(Re)compute the fingerprint of every note."""
+    table = NoteFingerprint.__table__
+    db.session.execute(table.delete())
+    rows = []
+    query = db.session.query(Note.id, Note.user_id, Note.title, Note.content).yield_per(batch_size)
+    for note_id, user_id, title, content in query:
+        rows.append(fingerprint_row(note_id, user_id, title, content))
+        if len(rows) >= batch_size:
+            db.session.execute(table.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def init_duplicate_index(app):
+    """Backfill fingerprints for existing notes.
+
+    Must be called inside an app context after `db.create_all()`.
+    """
+    has_notes = db.session.query(Note.id).first() is not None
+    has_fingerprints = db.session.query(NoteFingerprint.note_id).first() is not None
+    if has_notes and not has_fingerprints:
+        rebuild_fingerprints()
+
+
+# --- querying ----------------------------------------------------------
+
+def find_duplicates(note_id, user_id=None, max_distance=DEFAULT_DISTANCE, limit=20):
+    """Return [(note, distance)] of `user_id`'s notes near-identical to `note_id`, closest first.
+
+    Returns None if the note has no fingerprint.
+    """
+    max_distance = min(max_distance, MAX_DISTANCE)
+    own = db.session.get(NoteFingerprint, note_id)
+    if own is None:
+        return None
+    owner = NoteFingerprint.user_id.is_(None) if user_id is None else NoteFingerprint.user_id == user_id
+    same_band = db.or_(*(getattr(NoteFingerprint, f'band{i}') == getattr(own, f'band{i}') for i in range(BANDS)))
+    candidates = (db.session.query(NoteFingerprint.note_id, NoteFingerprint.simhash)
+                  .filter(owner, same_band, NoteFingerprint.note_id != note_id)
+                  .all())
+    close = {}
+    for candidate_id, value in candidates:
+        distance = hamming(own.simhash, value)
+        if distance <= max_distance:
+            close[candidate_id] = distance
+    if not close:
+        return []
+    notes = Note.owned_by(user_id).filter(Note.id.in_(close)).all()
+    ranked = sorted(notes, key=lambda n: (close[n.id], -n.id))
+    return [(note, close[note.id]) for note in ranked[:limit]]
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = self.parent.setdefault(item, item)
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # keep the oldest note as the representative
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+
+def cluster_duplicates(max_distance=DEFAULT_DISTANCE, batch_size=2000):
+    """Group near-duplicate notes; returns clusters as sorted lists of note ids (largest first).
+
+    Only notes of the same owner are ever grouped together.
+    """
+    max_distance = min(max_distance, MAX_DISTANCE)
+    query = db.session.query(NoteFingerprint.note_id, NoteFingerprint.user_id, NoteFingerprint.simhash)
+    # Notes with the same fingerprint are one cluster already: join them up
+    # front and band only one representative per distinct fingerprint, so
+    # a large group of identical notes cannot overflow a bucket.
+    uf = _UnionFind()
+    representatives = {}
+    for note_id, owner, value in query.yield_per(batch_size):
+        first = representatives.setdefault((owner, to_unsigned(value)), note_id)
+        if first != note_id:
+            uf.union(first, note_id)
+    buckets = defaultdict(list)
+    for (owner, value), note_id in representatives.items():
+        for i, band in enumerate(bands(value)):
+            buckets[(owner, i, band)].append((note_id, value))
+
+    # A pair sharing several bands is checked once per shared band; that is
+    # cheaper than remembering which pairs were already compared.
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > MAX_BUCKET:
+            continue
+        for x, (a, hash_a) in enumerate(members):
+            for b, hash_b in members[x + 1:]:
+                if bin(hash_a ^ hash_b).count('1') <= max_distance:
+                    uf.union(a, b)
+
+    clusters = defaultdict(list)
+    for note_id in uf.parent:
+        clusters[uf.find(note_id)].append(note_id)
+    result = [sorted(ids) for ids in clusters.values() if len(ids) > 1]
+    result.sort(key=lambda ids: (-len(ids), ids[0]))
+    return result
+
+
+class DuplicateJob:
+    """Runs `cluster_duplicates()` in a background thread and keeps the last result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {'state': 'idle'}
+
+    def start(self, app, max_distance=DEFAULT_DISTANCE):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {'state': 'running', 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            self._thread = threading.Thread(target=self._run, args=(app, max_distance),
+                                            name='duplicate-clustering', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, app, max_distance):
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                clusters = cluster_duplicates(max_distance=max_distance)
+                db.session.remove()
+            status = {
+                'state': 'done',
+                'clusters': clusters,
+                'cluster_count': len(clusters),
+                'duplicate_notes': sum(len(c) - 1 for c in clusters),
+            }
+        except Exception as e:
+            print(f"[WARN] Duplicate clustering failed: {e}")
+            status = {'state': 'failed', 'error': str(e)}
+        status['started_at'] = self.status.get('started_at')
+        status['took_s'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self.status = status
+
+
+duplicate_job = DuplicateJob()
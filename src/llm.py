@@ -1,4 +1,6 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
 from dotenv import load_dotenv
 from typing import List, Dict, Any
 
@@ -6,6 +8,10 @@ from typing import List, Dict, Any
 # generic so you can replace the client with the official SDK if desired.
 import requests
 
+from src.circuit_breaker import llm_breaker, CircuitOpenError
+from src.llm_usage import usage_meter
+from src.tokens import translate_budget, TokenBudgetError
+
 
 load_dotenv()  # Loads environment variables from .env
 
@@ -13,32 +19,66 @@ load_dotenv()  # Loads environment variables from .env
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
 ENDPOINT = os.environ.get("GITHUB_MODELS_ENDPOINT", "https://models.github.ai/inference")
 DEFAULT_MODEL = os.environ.get("GITHUB_MODEL", "openai/gpt-4.1-mini")
+TRANSLATE_CONCURRENCY = int(os.environ.get("LLM_TRANSLATE_CONCURRENCY", "4"))
+
+_chunk_executor = ThreadPoolExecutor(max_workers=TRANSLATE_CONCURRENCY, thread_name_prefix='translate-chunk')
+
+
+def default_timeout() -> float:
+    # Use shorter timeout for Vercel serverless environment
+    return 15 if os.environ.get('VERCEL') else 30
 
 
-def call_llm_model(model: str, messages: List[Dict[str, Any]], temperature: float = 1.0, top_p: float = 1.0) -> str:
+def call_llm_model(model: str, messages: List[Dict[str, Any]], temperature: float = 1.0, top_p: float = 1.0,
+                   timeout: float = None, endpoint: str = 'other') -> str:
     """Call an LLM model via a simple HTTP API. Returns the assistant text.
 
     This function assumes the endpoint accepts a POST with JSON like:
     {"model": model, "messages": messages, ...}
     and returns a JSON where choices[0].message.content holds the text.
+
+    Calls go through the shared `llm_breaker`; while the endpoint is failing
+    or slow the breaker rejects calls immediately with CircuitOpenError
+    instead of waiting out another timeout. `timeout` bounds the whole call
+    (SDK attempt plus HTTP fallback). Latency and token usage are metered
+    under `endpoint` (see src/llm_usage.py).
     """
     if not GITHUB_TOKEN:
         raise RuntimeError("GITHUB_TOKEN is not set in environment")
 
+    start = time.monotonic()
+    try:
+        content, usage = llm_breaker.call(_call_llm_transport, model, messages, temperature, top_p,
+                                          timeout or default_timeout(), endpoint=endpoint)
+    except CircuitOpenError:
+        usage_meter.count(endpoint, 'rejected')
+        raise
+    except Exception:
+        usage_meter.record_error(endpoint, time.monotonic() - start)
+        raise
+    usage_meter.record(endpoint, messages, content, usage, time.monotonic() - start)
+    return content
+
+
+def _call_llm_transport(model, messages, temperature, top_p, timeout):
+    deadline = time.monotonic() + timeout
+
     # If a GitHub Models endpoint is configured, try to use the OpenAI-compatible
     # client (the user's `test.py` uses `from openai import OpenAI` with base_url).
     github_endpoint = os.environ.get("GITHUB_MODELS_ENDPOINT") or ENDPOINT
     # Try OpenAI-compatible SDK with the GitHub models endpoint (or default ENDPOINT)
     try:
         from openai import OpenAI
-        client = OpenAI(base_url=github_endpoint, api_key=GITHUB_TOKEN)
+        # No SDK retries: the breaker and the caller's budget decide what to do on failure
+        client = OpenAI(base_url=github_endpoint, api_key=GITHUB_TOKEN, timeout=timeout, max_retries=0)
         resp = client.chat.completions.create(model=model, messages=messages, temperature=temperature, top_p=top_p)
         # response shape may contain choices[0].message.content or choices[0].text
+        usage = getattr(resp, 'usage', None)
         try:
-            return resp.choices[0].message.content
+            return resp.choices[0].message.content, usage
         except Exception:
             try:
-                return resp.choices[0].text
+                return resp.choices[0].text, usage
             except Exception:
                 raise RuntimeError(f"Unexpected SDK response shape: {resp}")
     except Exception as e:
@@ -58,11 +98,13 @@ def call_llm_model(model: str, messages: List[Dict[str, Any]], temperature: floa
         "top_p": top_p,
     }
 
-    # Use shorter timeout for Vercel serverless environment
-    timeout = 15 if os.environ.get('VERCEL') else 30
-    
+    # Only spend what is left of the overall timeout on the fallback
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise RuntimeError(f"LLM call timed out after {timeout}s: {sdk_err}")
+
     try:
-        resp = requests.post(ENDPOINT, headers=headers, json=payload, timeout=timeout)
+        resp = requests.post(ENDPOINT, headers=headers, json=payload, timeout=remaining)
     except Exception as e:
         raise RuntimeError(f"Failed to contact LLM endpoint {ENDPOINT}: {e}")
 
@@ -79,32 +121,92 @@ def call_llm_model(model: str, messages: List[Dict[str, Any]], temperature: floa
 
     # Try common response shapes
     try:
-        return data["choices"][0]["message"]["content"]
+        return data["choices"][0]["message"]["content"], data.get("usage")
     except Exception:
         # fallback: try other keys
         if "choices" in data and len(data["choices"]) > 0:
             c = data["choices"][0]
             if isinstance(c, dict) and "text" in c:
-                return c["text"]
+                return c["text"], data.get("usage")
         raise RuntimeError("Unexpected LLM response format: %r" % (data,))
 
 
-def translate(text: str, target_lang: str = "zh-CN") -> str:
-    """Translate `text` into `target_lang` using the configured LLM model.
-
-    Returns translated string. This is a simple wrapper that sends a system
-    instruction + user message to the model.
-    """
+def build_translate_messages(text: str, target_lang: str) -> List[Dict[str, Any]]:
     system_prompt = (
         f"You are a helpful translator. Translate the user's text into {target_lang}. "
         "Return only the translation without extra commentary."
     )
 
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": text},
     ]
 
+
+def fit_translation(text: str) -> List[str]:
+    """Pieces of `text` to translate separately, per the translate token budget.
+
+    Raises TokenBudgetError when `text` is over budget and cannot be chunked.
+    """
+    try:
+        pieces, action = translate_budget.fit(text)
+    except TokenBudgetError:
+        usage_meter.count('translate', 'rejected')
+        raise
+    if action:
+        usage_meter.count('translate', action)
+    return pieces
+
+
+def split_whitespace(piece: str):
+    """(leading whitespace, text, trailing whitespace), so chunk layout survives translation."""
+    core = piece.strip()
+    if not core:
+        return piece, '', ''
+    start = piece.index(core)
+    return piece[:start], core, piece[start + len(core):]
+
+
+def translate(text: str, target_lang: str = "zh-CN") -> str:
+    """Translate `text` into `target_lang` using the configured LLM model.
+
+    Returns translated string. This is a simple wrapper that sends a system
+    instruction + user message to the model. Text over the translate token
+    budget is translated in chunks (or truncated or rejected, depending on
+    LLM_TRANSLATE_OVERFLOW). Chunks are translated LLM_TRANSLATE_CONCURRENCY
+    at a time and share one `default_timeout()`; the first failure fails
+    the whole text and cancels the chunks that have not started yet.
+    """
+    pieces = fit_translation(text)
+    if len(pieces) == 1:
+        return _translate_piece(pieces[0], target_lang)
+    timeout = default_timeout()
+    deadline = time.monotonic() + timeout
+    futures = [_chunk_executor.submit(_translate_chunk, piece, target_lang, deadline) for piece in pieces]
+    done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    for future in pending:
+        future.cancel()
+    for future in futures:
+        if future in done and future.exception() is not None:
+            raise future.exception()
+    if pending:
+        raise RuntimeError(f"Translation timed out after {timeout}s")
+    return ''.join(future.result() for future in futures)
+
+
+def _translate_chunk(piece: str, target_lang: str, deadline: float) -> str:
+    before, core, after = split_whitespace(piece)
+    if not core:
+        return piece
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise RuntimeError("Translation timed out")
+    return before + _translate_piece(core, target_lang, timeout=remaining) + after
+
+
+def _translate_piece(text: str, target_lang: str, timeout: float = None) -> str:
+    messages = build_translate_messages(text, target_lang)
+
     # If OPENAI_API_KEY is provided and openai package is available, prefer that SDK path
     openai_key = os.environ.get("OPENAI_API_KEY")
     if openai_key:
@@ -112,13 +214,16 @@ def translate(text: str, target_lang: str = "zh-CN") -> str:
             import openai
             openai.api_key = openai_key
             # Use ChatCompletion (classic interface)
+            start = time.monotonic()
             completion = openai.ChatCompletion.create(model=DEFAULT_MODEL, messages=messages, temperature=1.0)
-            return completion.choices[0].message.content if hasattr(completion.choices[0], 'message') else completion.choices[0].text
+            content = completion.choices[0].message.content if hasattr(completion.choices[0], 'message') else completion.choices[0].text
+            usage_meter.record('translate', messages, content, completion.get('usage'), time.monotonic() - start)
+            return content
         except Exception:
             # fall back to HTTP call below if SDK not available or fails
             pass
 
-    return call_llm_model(DEFAULT_MODEL, messages)
+    return call_llm_model(DEFAULT_MODEL, messages, timeout=timeout, endpoint='translate')
 
 
 def main():
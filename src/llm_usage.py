@@ -0,0 +1,134 @@
+"""Per-endpoint metering of LLM calls (`GET /api/admin/llm/usage`).
+
+Every call made through `call_llm_model` / `acall_llm_model` is recorded
+under its endpoint label with its latency and token usage. Token counts
+come from the provider's `usage` object. When a response has none, they
+are estimated locally and the call is counted as `estimated`.
+`cached_prompt_tokens` is what the provider reports as served from its
+prompt cache. Latency percentiles cover the last LLM_USAGE_WINDOW calls
+of each endpoint.
+"""
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from src.tokens import count_message_tokens, estimate_tokens
+
+LLM_USAGE_WINDOW = int(os.environ.get('LLM_USAGE_WINDOW', '500'))
+
+
+def _field(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def parse_usage(usage):
+    """(prompt, completion, cached prompt) tokens from an SDK object or JSON dict, or None."""
+    prompt = _field(usage, 'prompt_tokens')
+    completion = _field(usage, 'completion_tokens')
+    if not isinstance(prompt, int) or not isinstance(completion, int) or prompt + completion <= 0:
+        return None
+    cached = _field(_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+    return prompt, completion, cached if isinstance(cached, int) else 0
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _EndpointUsage:
+    def __init__(self, window):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.estimated = 0
+        self.truncated = 0
+        self.chunked = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.latency_total = 0.0
+        self.latencies = deque(maxlen=window)
+
+    def to_dict(self):
+        ordered = sorted(self.latencies)
+        latency = {'avg_ms': round(1000 * self.latency_total / self.calls, 1) if self.calls else None}
+        for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95), ('max_ms', 1.0)):
+            latency[name] = round(1000 * _percentile(ordered, fraction), 1) if ordered else None
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'estimated': self.estimated,
+            'truncated': self.truncated,
+            'chunked': self.chunked,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cached_prompt_tokens': self.cached_prompt_tokens,
+            'latency': latency,
+        }
+
+
+class UsageMeter:
+    def __init__(self, window=LLM_USAGE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._since = datetime.utcnow()
+
+    def _get(self, endpoint):
+        usage = self._endpoints.get(endpoint)
+        if usage is None:
+            usage = self._endpoints[endpoint] = _EndpointUsage(self.window)
+        return usage
+
+    def record(self, endpoint, messages, content, usage, latency):
+        """Record a successful call; `usage` is the provider's usage object or dict, if any."""
+        tokens = parse_usage(usage)
+        estimated = tokens is None
+        if estimated:
+            tokens = (count_message_tokens(messages), estimate_tokens(content or ''), 0)
+        with self._lock:
+            stats = self._get(endpoint)
+            stats.calls += 1
+            stats.estimated += estimated
+            stats.prompt_tokens += tokens[0]
+            stats.completion_tokens += tokens[1]
+            stats.cached_prompt_tokens += tokens[2]
+            stats.latency_total += latency
+            stats.latencies.append(latency)
+
+    def record_error(self, endpoint, latency):
+        with self._lock:
+            stats = self._get(endpoint)
+            stats.calls += 1
+            stats.errors += 1
+            stats.latency_total += latency
+            stats.latencies.append(latency)
+
+    def count(self, endpoint, name):
+        """Bump a plain counter: 'rejected' (breaker open or over budget), 'truncated' or 'chunked'."""
+        with self._lock:
+            stats = self._get(endpoint)
+            setattr(stats, name, getattr(stats, name) + 1)
+
+    def summary(self):
+        with self._lock:
+            endpoints = {name: stats.to_dict() for name, stats in sorted(self._endpoints.items())}
+            since = self._since
+        totals = {key: sum(e[key] for e in endpoints.values())
+                  for key in ('calls', 'errors', 'rejected', 'prompt_tokens', 'completion_tokens',
+                              'cached_prompt_tokens')}
+        return {'since': since.isoformat(), 'window': self.window, 'totals': totals, 'endpoints': endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._since = datetime.utcnow()
+
+
+usage_meter = UsageMeter()
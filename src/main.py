@@ -3,7 +3,7 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
@@ -11,10 +11,24 @@ from src.routes.note import note_bp
 from src.routes.translate import translate_bp
 from src.routes.generate import generate_bp
 from src.routes.tags import tags_bp
+from src.routes.admin import admin_bp
 from src.models.note import Note
+from src.models.schema import ensure_schema
+from src.search_index import init_search_index
+from src.duplicates import init_duplicate_index
+from src.archive import init_archive
+from src.revisions import init_revisions
+from src.note_events import init_note_events
+from src.static_assets import register_static_routes
+from src.streaming import init_compression
+from src.profiling import init_profiling
+from src.db_routing import configure_read_replica, init_read_routing
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+# also signs user tokens (src/auth.py); without it no tokens are issued or accepted
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+if not app.config['SECRET_KEY']:
+    print("[WARN] SECRET_KEY is not set; user tokens are disabled")
 
 # Enable CORS for all routes
 CORS(app)
@@ -25,6 +39,7 @@ app.register_blueprint(note_bp, url_prefix='/api')
 app.register_blueprint(translate_bp, url_prefix='/api')
 app.register_blueprint(generate_bp, url_prefix='/api')
 app.register_blueprint(tags_bp)
+app.register_blueprint(admin_bp, url_prefix='/api')
 # Configure database: prefer DATABASE_URL (e.g. Neon Postgres), fallback to local SQLite
 database_url = os.environ.get('DATABASE_URL')
 if database_url:
@@ -41,25 +56,22 @@ else:
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_PATH}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Optional read replica for GET requests (DATABASE_READ_URL)
+configure_read_replica(app)
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    ensure_schema()
+    init_search_index(app)
+    init_duplicate_index(app)
+    init_archive(app)
+    init_revisions(app)
+    init_note_events(app)
+    init_profiling(app, db)
+    init_read_routing(app, db)
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+register_static_routes(app)
+init_compression(app)
 
 
 if __name__ == '__main__':
@@ -5,7 +5,15 @@ from src.models.user import db
 
 
 class Note(db.Model):
+    # Per-user listings and calendar lookups are served from these composite indexes
+    __table_args__ = (
+        db.Index('ix_note_user_updated_at', 'user_id', 'updated_at'),
+        db.Index('ix_note_user_event_date', 'user_id', 'event_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    # owner; NULL for notes created without a user (the anonymous bucket)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     # store tags as JSON string in text column for compatibility
@@ -14,26 +22,46 @@ class Note(db.Model):
     event_time = db.Column(db.Time, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # optimistic concurrency: every UPDATE is guarded by the version it was read at
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # normalised title and content behind the pg_trgm fuzzy search; NULL
+    # with the n-gram side table (see src/search_index.py)
+    search_text = db.Column(db.Text, nullable=True)
+
+    # Versions are bumped by the application (see bump_version) so coalesced
+    # saves can jump several versions in a single commit.
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
 
     def __repr__(self):
         return f'<Note {self.title}>'
 
-    def get_tags(self):
-        if not self.tags:
+    @classmethod
+    def owned_by(cls, user_id):
+        """Query restricted to the notes of `user_id` (None = anonymous notes)."""
+        if user_id is None:
+            return cls.query.filter(cls.user_id.is_(None))
+        return cls.query.filter(cls.user_id == user_id)
+
+    @staticmethod
+    def parse_tags(raw):
+        if not raw:
             return []
         try:
             # 如果已经是列表，直接返回
-            if isinstance(self.tags, list):
-                return self.tags
+            if isinstance(raw, list):
+                return raw
             # 如果是字符串，尝试解析JSON
-            return json.loads(self.tags)
+            return json.loads(raw)
         except Exception:
             # fallback: comma separated string
-            if isinstance(self.tags, str):
-                return [t.strip() for t in self.tags.split(',') if t.strip()]
+            if isinstance(raw, str):
+                return [t.strip() for t in raw.split(',') if t.strip()]
             else:
                 return []
 
+    def get_tags(self):
+        return self.parse_tags(self.tags)
+
     def set_tags(self, tags_list):
         try:
             if tags_list is None:
@@ -46,15 +74,47 @@ class Note(db.Model):
         except Exception:
             self.tags = None
 
+    def set_event_date(self, value):
+        """Accept YYYY-MM-DD; anything empty or unparsable clears the date."""
+        if not value:
+            self.event_date = None
+            return
+        try:
+            self.event_date = date.fromisoformat(value)
+        except Exception:
+            self.event_date = None
+
+    def set_event_time(self, value):
+        """Accept HH:MM[:SS] (or an ISO datetime); anything else clears the time."""
+        if not value:
+            self.event_time = None
+            return
+        try:
+            self.event_time = datetime.fromisoformat(value).time()
+        except Exception:
+            try:
+                # fallback parse HH:MM[:SS]
+                parts = value.split(':')
+                h, m = int(parts[0]), int(parts[1])
+                s = int(parts[2]) if len(parts) > 2 else 0
+                self.event_time = time(hour=h, minute=m, second=s)
+            except Exception:
+                self.event_time = None
+
+    def bump_version(self, to=None):
+        self.version = to if to is not None else (self.version or 0) + 1
+
     def to_dict(self):
         return {
             'id': self.id,
+            'user_id': self.user_id,
             'title': self.title,
             'content': self.content,
             'tags': self.get_tags(),
             'event_date': self.event_date.isoformat() if self.event_date else None,
             'event_time': self.event_time.isoformat() if self.event_time else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
 
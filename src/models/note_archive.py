@@ -0,0 +1,67 @@
+import zlib
+from datetime import datetime
+
+from src.models.note import Note
+from src.models.user import db
+
+
+class NoteArchive(db.Model):
+    """Cold storage for notes nobody has touched in a long time.
+
+    Rows keep the note's id, owner, version and timestamps so a note can be
+    moved back into `note` unchanged. The content is zlib-compressed; title
+    and tags stay plain so archived notes can still be listed and filtered
+    by tag without decompressing anything.
+    """
+    __tablename__ = 'note_archive'
+    __table_args__ = (
+        db.Index('ix_note_archive_user_updated_at', 'user_id', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    content_z = db.Column(db.LargeBinary, nullable=False)
+    tags = db.Column(db.Text, nullable=True)
+    event_date = db.Column(db.Date, nullable=True)
+    event_time = db.Column(db.Time, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NoteArchive {self.id}>'
+
+    @classmethod
+    def owned_by(cls, user_id):
+        """Query restricted to the archived notes of `user_id` (None = anonymous notes)."""
+        if user_id is None:
+            return cls.query.filter(cls.user_id.is_(None))
+        return cls.query.filter(cls.user_id == user_id)
+
+    @staticmethod
+    def compress(content):
+        return zlib.compress((content or '').encode('utf-8'), 6)
+
+    @property
+    def content(self):
+        return zlib.decompress(self.content_z).decode('utf-8')
+
+    def get_tags(self):
+        return Note.parse_tags(self.tags)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'title': self.title,
+            'content': self.content,
+            'tags': self.get_tags(),
+            'event_date': self.event_date.isoformat() if self.event_date else None,
+            'event_time': self.event_time.isoformat() if self.event_time else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version,
+            'archived': True
+        }
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from src.models.user import db
+
+
+class NoteEvent(db.Model):
+    """Change feed behind `/api/notes/stream`.
+
+    One row per created, updated or deleted note, written in the same
+    transaction as the change itself, so an event becomes visible exactly
+    when the change commits. The id doubles as the SSE event id. Rows are
+    pruned after NOTES_STREAM_RETENTION seconds; see src/note_events.py.
+    """
+    __tablename__ = 'note_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    note_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    version = db.Column(db.Integer, nullable=True)
+    # JSON: just the note's id and version; the note is loaded when the event is sent
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<NoteEvent {self.id} {self.kind} {self.note_id}>'
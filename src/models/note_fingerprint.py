@@ -0,0 +1,30 @@
+from src.models.user import db
+
+
+class NoteFingerprint(db.Model):
+    """SimHash fingerprint of a note, for near-duplicate lookups.
+
+    The 64-bit hash is also stored as seven bands of 9-10 bits. Two
+    fingerprints within Hamming distance 6 must agree on at least one band,
+    so candidate duplicates are found with seven indexed equality lookups
+    instead of a scan over every note.
+    """
+    __tablename__ = 'note_fingerprint'
+    __table_args__ = tuple(
+        db.Index(f'ix_note_fingerprint_user_band{i}', 'user_id', f'band{i}') for i in range(7)
+    )
+
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    # stored signed so it fits a BIGINT column
+    simhash = db.Column(db.BigInteger, nullable=False)
+    band0 = db.Column(db.Integer, nullable=False)
+    band1 = db.Column(db.Integer, nullable=False)
+    band2 = db.Column(db.Integer, nullable=False)
+    band3 = db.Column(db.Integer, nullable=False)
+    band4 = db.Column(db.Integer, nullable=False)
+    band5 = db.Column(db.Integer, nullable=False)
+    band6 = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<NoteFingerprint {self.note_id} {self.simhash & 0xFFFFFFFFFFFFFFFF:016x}>'
@@ -0,0 +1,21 @@
+from src.models.user import db
+
+
+class NoteNgram(db.Model):
+    """Side-table n-gram index used for fuzzy search when pg_trgm is unavailable.
+
+    One row per distinct n-gram per note; the (gram, note_id) primary key
+    doubles as the posting-list index. The owner is denormalised into the
+    table so per-user lookups only touch that user's postings.
+    """
+    __tablename__ = 'note_ngram'
+    __table_args__ = (
+        db.Index('ix_note_ngram_user_gram', 'user_id', 'gram'),
+    )
+
+    gram = db.Column(db.String(8), primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True, index=True)
+    user_id = db.Column(db.Integer, nullable=True)
+
+    def __repr__(self):
+        return f'<NoteNgram {self.gram!r} -> {self.note_id}>'
@@ -0,0 +1,55 @@
+import json
+import zlib
+from datetime import datetime
+
+from src.models.user import db
+
+
+class NoteRevision(db.Model):
+    """One earlier version of a note.
+
+    Rows are either keyframes (the full state) or reverse deltas that turn
+    the next newer revision of the same note (or the live note, for the
+    newest row) back into this version. `data` is zlib-compressed JSON;
+    `size` is its length, so storage can be summed without reading it.
+    Revisions are ordered by `id`, oldest first; see src/revisions.py.
+    """
+    __tablename__ = 'note_revision'
+    __table_args__ = (
+        db.Index('ix_note_revision_note_id_id', 'note_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # no foreign key: revisions of archived notes stay while the note row is gone
+    note_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    version = db.Column(db.Integer, nullable=False)
+    keyframe = db.Column(db.Boolean, nullable=False, default=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    # when this version was saved, and when the next save replaced it
+    saved_at = db.Column(db.DateTime, nullable=True)
+    replaced_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # set when compaction re-encodes the row, so incremental snapshots pick it up
+    compacted_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<NoteRevision {self.note_id}@{self.version}>'
+
+    @staticmethod
+    def pack(payload):
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+
+    def payload(self):
+        return json.loads(zlib.decompress(self.data).decode('utf-8'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'note_id': self.note_id,
+            'version': self.version,
+            'keyframe': self.keyframe,
+            'size': self.size,
+            'saved_at': self.saved_at.isoformat() if self.saved_at else None,
+            'replaced_at': self.replaced_at.isoformat() if self.replaced_at else None,
+        }
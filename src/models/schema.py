@@ -0,0 +1,78 @@
+from sqlalchemy import inspect, text
+
+from src.models.user import db
+
+
+def ensure_schema():
+    """Bring an existing database up to date with the models.
+
+    `db.create_all()` only creates missing tables. For tables that already
+    exist this adds any new nullable (or server-defaulted) columns, any
+    missing indexes and, except on SQLite, any missing foreign keys (e.g.
+    `note.user_id`), which is all the schema changes so far have needed.
+    SQLite cannot add constraints to an existing table (and does not
+    enforce them unless `PRAGMA foreign_keys` is on), so there they only
+    exist on tables created since. Must be called inside an app context
+    after `db.create_all()`.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    # e.g. `user` is reserved on Postgres
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {col_type}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+            if engine.dialect.name == 'sqlite':
+                continue
+            existing_fks = {tuple(fk['constrained_columns']) for fk in inspector.get_foreign_keys(table.name)}
+            for constraint in table.foreign_key_constraints:
+                if tuple(constraint.column_keys) not in existing_fks:
+                    _add_foreign_key(conn, constraint)
+
+
+def foreign_key_ddl(constraint, dialect):
+    """`ALTER TABLE ... ADD CONSTRAINT` for `constraint`; NOT VALID on Postgres, so existing rows are not checked."""
+    quote = dialect.identifier_preparer.quote
+    table = constraint.parent
+    name = constraint.name or f"fk_{table.name}_{'_'.join(constraint.column_keys)}"
+    columns = ', '.join(quote(c) for c in constraint.column_keys)
+    referred = ', '.join(quote(element.column.name) for element in constraint.elements)
+    ddl = (f'ALTER TABLE {quote(table.name)} ADD CONSTRAINT {quote(name)} FOREIGN KEY ({columns}) '
+           f'REFERENCES {quote(constraint.referred_table.name)} ({referred})')
+    if constraint.ondelete:
+        ddl += f' ON DELETE {constraint.ondelete}'
+    if dialect.name == 'postgresql':
+        ddl += ' NOT VALID'
+    return ddl, name
+
+
+def _add_foreign_key(conn, constraint):
+    ddl, name = foreign_key_ddl(constraint, conn.dialect)
+    table = constraint.parent.name
+    try:
+        with conn.begin_nested():
+            conn.execute(text(ddl))
+    except Exception as e:
+        print(f"[WARN] Could not add foreign key {name} to {table}: {e}")
+        return
+    if conn.dialect.name != 'postgresql':
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    try:
+        with conn.begin_nested():
+            conn.execute(text(f'ALTER TABLE {quote(table)} VALIDATE CONSTRAINT {quote(name)}'))
+    except Exception as e:
+        # enforced for new rows already; older ones point at rows that are gone
+        print(f"[WARN] Foreign key {name} holds for new rows only, existing rows violate it: {e}")
@@ -1,11 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from src.db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    # part of every user token (src/auth.py); rotating it revokes them
+    token_secret = db.Column(db.String(32), nullable=True)
 
     def __repr__(self):
         return f'<User {self.username}>'
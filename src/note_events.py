@@ -0,0 +1,371 @@
+"""Server-sent change notifications for notes (`GET /api/notes/stream`).
+
+Mapper events write a `note_event` row for every created, updated or
+deleted note inside the transaction that changes it, so an event is
+visible exactly when the note route commits. A row only holds the note's
+id, the kind of change and the version; the note itself is loaded when
+the event is delivered, so `created` / `updated` events carry the note as
+it is then. Writers also delete rows older than NOTES_STREAM_RETENTION
+(at most every PRUNE_INTERVAL seconds per process), whether or not
+anybody is subscribed. That table is the broadcast channel between worker
+processes. Each process runs one poller thread that reads new rows every
+NOTES_STREAM_POLL seconds, with a single primary-key range query no
+matter how many clients are connected. It then hands SSE frames to the
+local subscribers of the note's owner.
+
+Clients resume with the standard `Last-Event-ID` header (or
+`?last_event_id=`). Missed events are replayed from the table. When they
+are older than NOTES_STREAM_RETENTION or too many, a `reset` event tells
+the client to reload its list instead. A `reset` is also sent before
+closing a subscriber that falls too far behind. Idle connections only get
+a comment line every NOTES_STREAM_HEARTBEAT seconds. Under the ASGI
+entry point they cost one queue on the event loop, not a thread.
+
+Ids committed out of order (possible with concurrent Postgres
+transactions) are still delivered. Every missing id below the newest one
+seen is waited for up to GAP_TIMEOUT seconds from when the gap was first
+noticed, then skipped; ids of rolled-back transactions never arrive.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from src.models.note import Note
+from src.models.note_event import NoteEvent
+from src.models.user import db
+
+NOTES_STREAM_POLL = float(os.environ.get('NOTES_STREAM_POLL', '0.5'))
+NOTES_STREAM_HEARTBEAT = float(os.environ.get('NOTES_STREAM_HEARTBEAT', '15'))
+NOTES_STREAM_RETENTION = float(os.environ.get('NOTES_STREAM_RETENTION', '3600'))
+NOTES_STREAM_MAX_SECONDS = float(os.environ.get('NOTES_STREAM_MAX_SECONDS', '600'))
+NOTES_STREAM_QUEUE_SIZE = int(os.environ.get('NOTES_STREAM_QUEUE_SIZE', '256'))
+REPLAY_LIMIT = 500
+POLL_BATCH = 1000
+GAP_TIMEOUT = 5.0
+# larger jumps in the id sequence are skipped without waiting
+MAX_TRACKED_GAPS = 10000
+PRUNE_INTERVAL = 60.0
+RETRY_MS = 3000
+
+RETRY_FRAME = f'retry: {RETRY_MS}\n\n'
+RESET_FRAME = 'event: reset\ndata: {}\n\n'
+HEARTBEAT_FRAME = ': ping\n\n'
+
+StreamEvent = namedtuple('StreamEvent', 'id user_id frame')
+
+
+def format_event(event_id, kind, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {data}\n\n'
+
+
+# --- recording ---------------------------------------------------------
+
+_prune_lock = threading.Lock()
+_pruned_at = [float('-inf')]
+
+
+def prune_events(connection):
+    """Delete events older than NOTES_STREAM_RETENTION."""
+    table = NoteEvent.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=NOTES_STREAM_RETENTION)
+    connection.execute(table.delete().where(table.c.created_at < cutoff))
+
+
+def _record(connection, kind, target):
+    connection.execute(NoteEvent.__table__.insert(), [{
+        'user_id': target.user_id, 'note_id': target.id, 'kind': kind, 'version': target.version,
+        'data': json.dumps({'id': target.id, 'version': target.version}), 'created_at': datetime.utcnow(),
+    }])
+    with _prune_lock:
+        due = time.monotonic() - _pruned_at[0] >= PRUNE_INTERVAL
+        if due:
+            _pruned_at[0] = time.monotonic()
+    if due:
+        prune_events(connection)
+
+
+@event.listens_for(Note, 'after_insert')
+def _note_created(mapper, connection, target):
+    _record(connection, 'created', target)
+
+
+@event.listens_for(Note, 'after_update')
+def _note_updated(mapper, connection, target):
+    _record(connection, 'updated', target)
+
+
+@event.listens_for(Note, 'after_delete')
+def _note_deleted(mapper, connection, target):
+    _record(connection, 'deleted', target)
+
+
+def _stream_events(session, rows):
+    """StreamEvents for note_event rows, loading the notes of created / updated ones in one query.
+
+    A note deleted since keeps the stored id and version; its `deleted` event follows.
+    """
+    ids = {row.note_id for row in rows if row.kind != 'deleted'}
+    notes = {}
+    if ids:
+        notes = {note.id: note for note in session.scalars(select(Note).where(Note.id.in_(ids)))}
+    events = []
+    for row in rows:
+        note = notes.get(row.note_id) if row.kind != 'deleted' else None
+        data = json.dumps(note.to_dict(), ensure_ascii=False) if note is not None else row.data
+        events.append(StreamEvent(row.id, row.user_id, format_event(row.id, row.kind, data)))
+    return events
+
+
+# --- subscribers -------------------------------------------------------
+
+class ThreadSubscription:
+    """Subscriber read by a blocking (WSGI) response generator."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=NOTES_STREAM_QUEUE_SIZE)
+
+    def push(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription:
+    """Subscriber read by a coroutine on `loop` (the ASGI endpoint)."""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.overflowed = False
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def push(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self._queue.qsize() >= NOTES_STREAM_QUEUE_SIZE:
+            self.overflowed = True
+            # wake the reader so it notices
+            self._queue.put_nowait(None)
+        else:
+            self._queue.put_nowait(event)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class NoteEventBroadcaster:
+    def __init__(self, poll_interval=NOTES_STREAM_POLL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user id -> set of subscriptions
+        self._app = None
+        self._thread = None
+        self._cursor = 0        # every id up to here is delivered or skipped
+        self._high = 0          # highest id delivered
+        self._seen = set()      # delivered ids above the cursor
+        self._gaps = {}         # missing id between cursor and high -> when it was first missed
+        self.delivered = 0
+
+    def init_app(self, app):
+        self._app = app
+
+    def subscribe(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+            if self._thread is None and self._app is not None:
+                # start at the newest event, not at whatever was newest when the process started
+                with self._app.app_context():
+                    engine = db.engine
+                self.reset(engine)
+                self._thread = threading.Thread(target=self._run, name='note-event-poller', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def reset(self, engine):
+        """Continue after the newest event in the table, forgetting pending gaps."""
+        with engine.connect() as conn:
+            newest = conn.execute(select(func.max(NoteEvent.__table__.c.id))).scalar() or 0
+        self._cursor = self._high = newest
+        self._seen.clear()
+        self._gaps.clear()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def _run(self):
+        with self._app.app_context():
+            engine = db.engine
+        while True:
+            try:
+                self.poll(engine)
+            except Exception as e:
+                print(f"[WARN] Note event polling failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def poll(self, engine):
+        table = NoteEvent.__table__
+        columns = select(table.c.id, table.c.user_id, table.c.note_id, table.c.kind, table.c.data)
+        with engine.connect() as conn:
+            # only rows not delivered yet: new ones, and late ones filling a gap
+            rows = conn.execute(columns.where(table.c.id > self._high).order_by(table.c.id).limit(POLL_BATCH)).all()
+            if self._gaps:
+                waiting = sorted(self._gaps)[:POLL_BATCH]
+                rows += conn.execute(columns.where(table.c.id.in_(waiting))).all()
+            now = time.monotonic()
+            fresh = []
+            for row in sorted(rows, key=lambda r: r.id):
+                if row.id <= self._cursor or row.id in self._seen:
+                    continue
+                self._seen.add(row.id)
+                self._gaps.pop(row.id, None)
+                if row.id > self._high:
+                    if row.id - self._high - 1 <= MAX_TRACKED_GAPS:
+                        for missing in range(self._high + 1, row.id):
+                            self._gaps[missing] = now
+                    self._high = row.id
+                fresh.append(row)
+            with self._lock:
+                watched = set(self._subscribers)
+            # notes are only loaded for users somebody here is listening to
+            wanted = [row for row in fresh if row.user_id in watched]
+            if wanted:
+                with Session(bind=conn) as session:
+                    events = _stream_events(session, wanted)
+                for stream_event in events:
+                    self.publish(stream_event)
+        self._advance(now)
+
+    def _advance(self, now):
+        # gaps are noticed in id order, so every expired one sits below the first live one
+        while self._cursor < self._high:
+            missing = self._cursor + 1
+            if missing in self._seen:
+                self._seen.discard(missing)
+            elif missing in self._gaps:
+                if now - self._gaps[missing] < GAP_TIMEOUT:
+                    break
+                # rolled back, or never coming
+                del self._gaps[missing]
+            self._cursor = missing
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.user_id, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+        self.delivered += len(subscribers)
+
+
+broadcaster = NoteEventBroadcaster()
+
+
+def replay(user_id, last_event_id):
+    """Events of `user_id` after `last_event_id`: (events, reset).
+
+    `reset` is True when events the client missed are no longer (or too
+    many to be) replayed; the client should reload instead.
+    """
+    owner = NoteEvent.user_id.is_(None) if user_id is None else NoteEvent.user_id == user_id
+    oldest = db.session.query(func.min(NoteEvent.id)).scalar()
+    if oldest is not None and oldest > last_event_id + 1:
+        return [], True
+    rows = (db.session.query(NoteEvent.id, NoteEvent.user_id, NoteEvent.note_id, NoteEvent.kind, NoteEvent.data)
+            .filter(owner, NoteEvent.id > last_event_id)
+            .order_by(NoteEvent.id)
+            .limit(REPLAY_LIMIT + 1)
+            .all())
+    if len(rows) > REPLAY_LIMIT:
+        return [], True
+    return _stream_events(db.session, rows), False
+
+
+def parse_last_event_id(header_value, query_value=None):
+    raw = header_value or query_value
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def event_stream(subscription, replayed=(), reset=False, last_event_id=None):
+    """SSE frames for a ThreadSubscription until it overflows or NOTES_STREAM_MAX_SECONDS pass."""
+    deadline = time.monotonic() + NOTES_STREAM_MAX_SECONDS
+    last = last_event_id or 0
+    try:
+        yield RETRY_FRAME
+        if reset:
+            yield RESET_FRAME
+        for event in replayed:
+            yield event.frame
+            last = event.id
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                yield RESET_FRAME
+                return
+            event = subscription.get(NOTES_STREAM_HEARTBEAT)
+            if event is None:
+                yield HEARTBEAT_FRAME
+            elif event.id > last:
+                yield event.frame
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def aevent_stream(subscription, replayed=(), reset=False, last_event_id=None, disconnected=None):
+    """Async counterpart of `event_stream()` for an AsyncSubscription; stops once `disconnected` is set."""
+    deadline = time.monotonic() + NOTES_STREAM_MAX_SECONDS
+    last = last_event_id or 0
+    try:
+        yield RETRY_FRAME
+        if reset:
+            yield RESET_FRAME
+        for event in replayed:
+            yield event.frame
+            last = event.id
+        while time.monotonic() < deadline and not (disconnected and disconnected.is_set()):
+            if subscription.overflowed:
+                yield RESET_FRAME
+                return
+            event = await subscription.get(NOTES_STREAM_HEARTBEAT)
+            if event is None:
+                if not (disconnected and disconnected.is_set()):
+                    yield HEARTBEAT_FRAME
+            elif event.id > last:
+                yield event.frame
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def init_note_events(app):
+    """Register the app; the poller starts at the newest event when the first client subscribes."""
+    broadcaster.init_app(app)
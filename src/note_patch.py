@@ -0,0 +1,349 @@
+"""Partial (PATCH) note updates for autosave traffic.
+
+A PATCH body carries the version it was based on plus only what changed:
+
+    {
+        "base_version": 7,
+        "title": "new title",                      # optional field updates
+        "tags": ["a"], "event_date": null, ...
+        "content_ops": [                           # optional text diff
+            {"op": "insert", "offset": 120, "text": "more words"},
+            {"op": "delete", "offset": 40, "length": 6}
+        ]
+    }
+
+Ops are applied in order, each against the result of the previous one.
+With "coalesce": true (or an `X-Coalesce: 1` header) rapid consecutive
+patches are merged in memory and written in a single commit once the note
+has been quiet for COALESCE_WINDOW seconds (or after COALESCE_MAX_DELAY at
+the latest). Pending changes live in the worker that received them; any
+read or full update of the note, and any listing or search of its owner's
+notes, through this worker flushes them first. Because of that,
+coalescing needs one long-lived process: set PATCH_COALESCE=0 when several
+workers serve the same notes. The serverless entry point (api/index.py)
+turns it off, since nothing outlives the request there. Patches asking to
+be coalesced are then committed right away.
+
+If the note was changed by someone else in the meantime, the pending edits
+are rebased onto the current row: title and content changes are merged
+three-way against the version they were based on. Edits that touch the
+same text (or the same field) cannot be merged. They are kept as a
+conflict that the next GET of the note shows as `unsaved_changes` and the
+next PATCH answers with 409, so an acknowledged autosave is never dropped
+silently.
+"""
+import atexit
+import difflib
+import os
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy.orm.exc import StaleDataError
+
+from src.models.note import db
+from src.archive import load_note
+from src.cache import note_cache
+from src.db_routing import use_primary
+
+COALESCE_WINDOW = float(os.environ.get('COALESCE_WINDOW', '2'))
+COALESCE_MAX_DELAY = float(os.environ.get('COALESCE_MAX_DELAY', '10'))
+# how long a failed flush is reported to the client
+CONFLICT_TTL = float(os.environ.get('COALESCE_CONFLICT_TTL', '3600'))
+COMMIT_ATTEMPTS = 3
+# default for app.config['PATCH_COALESCE']
+PATCH_COALESCE = os.environ.get('PATCH_COALESCE', '1') != '0'
+
+EXTRA_FIELDS = ('tags', 'event_date', 'event_time')
+
+
+class PatchError(ValueError):
+    """The patch body is malformed or its ops do not fit the text."""
+
+
+class VersionConflict(Exception):
+    def __init__(self, current_version):
+        super().__init__(f'Note has changed (current version {current_version})')
+        self.current_version = current_version
+
+
+def _is_int(value):
+    # bool is an int subclass, but `true` is not an offset
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def coalescing_enabled():
+    """Whether this app may hold patches in memory; needs an app context."""
+    return current_app.config.get('PATCH_COALESCE', PATCH_COALESCE)
+
+
+def apply_text_ops(text, ops):
+    """Apply insert/delete ops to `text` in order and return the result."""
+    if not isinstance(ops, list):
+        raise PatchError('content_ops must be a list')
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError('each content op must be an object')
+        kind = op.get('op')
+        offset = op.get('offset')
+        if not _is_int(offset) or offset < 0 or offset > len(text):
+            raise PatchError(f'offset {offset!r} is outside the text (length {len(text)})')
+        if kind == 'insert':
+            value = op.get('text')
+            if not isinstance(value, str):
+                raise PatchError('insert op needs a text string')
+            text = text[:offset] + value + text[offset:]
+        elif kind == 'delete':
+            length = op.get('length')
+            if not _is_int(length) or length < 0 or offset + length > len(text):
+                raise PatchError(f'delete of {length!r} chars at {offset} runs past the text')
+            text = text[:offset] + text[offset + length:]
+        else:
+            raise PatchError(f'unknown content op {kind!r}')
+    return text
+
+
+def note_state(note):
+    return {'title': note.title, 'content': note.content, 'extra': {}}
+
+
+def _extra_values(note):
+    return {'tags': note.tags, 'event_date': note.event_date, 'event_time': note.event_time}
+
+
+def merge_text(base, ours, theirs):
+    """Three-way merge of two edits of `base`; None when they change the same place."""
+    if ours == base or ours == theirs:
+        return theirs
+    if theirs == base:
+        return ours
+    hunks = []
+    for text in (ours, theirs):
+        matcher = difflib.SequenceMatcher(None, base, text, autojunk=False)
+        hunks.extend((i1, i2, text[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
+    hunks.sort(key=lambda hunk: (hunk[0], hunk[1]))
+    merged, position, last_start = [], 0, None
+    for start, end, replacement in hunks:
+        # overlapping, or both sides inserting at the same spot
+        if start < position or start == last_start:
+            return None
+        merged.append(base[position:start])
+        merged.append(replacement)
+        position, last_start = end, start
+    merged.append(base[position:])
+    return ''.join(merged)
+
+
+def rebase_state(pending, note):
+    """The pending edits replayed onto the current `note`; None if they conflict with its changes."""
+    base = pending['base']
+    state = pending['state']
+    merged = {'title': note.title, 'content': note.content, 'extra': dict(state['extra'])}
+    if state['title'] != base['title']:
+        if note.title not in (base['title'], state['title']):
+            return None
+        merged['title'] = state['title']
+    merged['content'] = merge_text(base['content'], state['content'], note.content)
+    if merged['content'] is None:
+        return None
+    current = _extra_values(note)
+    if any(current[field] != pending['base_extra'][field] for field in state['extra']):
+        return None
+    return merged
+
+
+def merge_patch(state, data):
+    """Return `state` with the changes of one PATCH body applied."""
+    state = {'title': state['title'], 'content': state['content'], 'extra': dict(state['extra'])}
+    if 'title' in data:
+        if not isinstance(data['title'], str) or not data['title']:
+            raise PatchError('title must be a non-empty string')
+        state['title'] = data['title']
+    if 'content' in data:
+        if not isinstance(data['content'], str):
+            raise PatchError('content must be a string')
+        state['content'] = data['content']
+    if 'content_ops' in data:
+        state['content'] = apply_text_ops(state['content'], data['content_ops'])
+    for field in EXTRA_FIELDS:
+        if field in data:
+            state['extra'][field] = data[field]
+    return state
+
+
+def write_state(note, state):
+    note.title = state['title']
+    note.content = state['content']
+    extra = state['extra']
+    if 'tags' in extra:
+        note.set_tags(extra['tags'])
+    if 'event_date' in extra:
+        note.set_event_date(extra['event_date'])
+    if 'event_time' in extra:
+        note.set_event_time(extra['event_time'])
+
+
+def patch_summary(note_id, version, updated_at=None, pending=False):
+    # Autosave clients already hold the text; answer with the new version only
+    summary = {'id': note_id, 'version': version, 'pending': pending}
+    if updated_at is not None:
+        summary['updated_at'] = updated_at.isoformat()
+    return summary
+
+
+class PatchCoalescer:
+    def __init__(self, window=COALESCE_WINDOW, max_delay=COALESCE_MAX_DELAY):
+        self.window = window
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._note_locks = {}
+        self._pending = {}  # note_id -> dict
+        self._conflicts = {}  # note_id -> changes that could not be saved
+        self._app = None
+
+    def _note_lock(self, note_id):
+        with self._lock:
+            return self._note_locks.setdefault(note_id, threading.Lock())
+
+    def submit(self, user_id, note_id, base_version, data):
+        """Merge a patch into the pending state of `note_id`.
+
+        Returns the summary dict; raises VersionConflict / PatchError.
+        Must be called with an app context.
+        """
+        self._app = current_app._get_current_object()
+        with self._note_lock(note_id):
+            pending = self._pending.get(note_id)
+            if pending is None:
+                note = load_note(user_id, note_id)
+                if note is None:
+                    return None
+                if note.version != base_version:
+                    raise VersionConflict(note.version)
+                pending = {
+                    'user_id': note.user_id,
+                    'db_version': note.version,
+                    'version': note.version,
+                    'base': note_state(note),
+                    'base_extra': _extra_values(note),
+                    'state': note_state(note),
+                    'first_at': time.monotonic(),
+                    'timer': None,
+                }
+            elif pending['user_id'] != user_id:
+                return None
+            elif pending['version'] != base_version:
+                raise VersionConflict(pending['version'])
+
+            pending['state'] = merge_patch(pending['state'], data)
+            pending['version'] += 1
+            self._pending[note_id] = pending
+            version = pending['version']
+
+            if pending['timer'] is not None:
+                pending['timer'].cancel()
+                pending['timer'] = None
+            if time.monotonic() - pending['first_at'] >= self.max_delay:
+                self._flush_locked(note_id)
+                return patch_summary(note_id, version)
+            timer = threading.Timer(self.window, self.flush, args=(note_id,))
+            timer.daemon = True
+            pending['timer'] = timer
+            timer.start()
+        return patch_summary(note_id, version, pending=True)
+
+    def flush(self, note_id):
+        """Commit pending changes of `note_id`, if any."""
+        if note_id not in self._pending:
+            return
+        with self._note_lock(note_id):
+            self._flush_locked(note_id)
+
+    def flush_all(self):
+        for note_id in list(self._pending):
+            self.flush(note_id)
+
+    def flush_user(self, user_id):
+        """Commit pending changes of every note of `user_id` (before listing or searching them)."""
+        for note_id, pending in list(self._pending.items()):
+            if pending['user_id'] == user_id:
+                self.flush(note_id)
+
+    def conflict(self, user_id, note_id, pop=False):
+        """Coalesced changes of `note_id` that could not be saved, if any (forgotten with `pop`)."""
+        with self._lock:
+            conflict = self._conflicts.get(note_id)
+            if conflict is None or conflict['user_id'] != user_id:
+                return None
+            expired = time.time() - conflict['at'] > CONFLICT_TTL
+            if expired or pop:
+                del self._conflicts[note_id]
+            if expired:
+                return None
+        return {key: conflict[key] for key in ('reason', 'current_version', 'versions', 'changes')}
+
+    def _record_conflict(self, note_id, pending, reason, current_version):
+        print(f"[WARN] Coalesced changes for note {note_id} could not be saved: {reason}")
+        state = pending['state']
+        conflict = {
+            'user_id': pending['user_id'],
+            'reason': reason,
+            'current_version': current_version,
+            'versions': [pending['db_version'] + 1, pending['version']],
+            'changes': dict(state['extra'], title=state['title'], content=state['content']),
+            'at': time.time(),
+        }
+        with self._lock:
+            now = time.time()
+            for stale in [k for k, c in self._conflicts.items() if now - c['at'] > CONFLICT_TTL]:
+                del self._conflicts[stale]
+            self._conflicts[note_id] = conflict
+
+    def _flush_locked(self, note_id):
+        pending = self._pending.pop(note_id, None)
+        if pending is None:
+            return
+        if pending['timer'] is not None:
+            pending['timer'].cancel()
+        if has_app_context():
+            self._commit(note_id, pending)
+        elif self._app is not None:
+            with self._app.app_context():
+                self._commit(note_id, pending)
+
+    def _commit(self, note_id, pending):
+        # the version check must not read from a lagging replica
+        use_primary()
+        error = None
+        for _ in range(COMMIT_ATTEMPTS):
+            try:
+                note = load_note(pending['user_id'], note_id)
+                if note is None:
+                    self._record_conflict(note_id, pending, 'Note was deleted', None)
+                    return
+                state, version = pending['state'], pending['version']
+                if note.version != pending['db_version']:
+                    state = rebase_state(pending, note)
+                    if state is None:
+                        db.session.rollback()
+                        self._record_conflict(note_id, pending, 'Note was changed elsewhere', note.version)
+                        return
+                    version = note.version + pending['version'] - pending['db_version']
+                write_state(note, state)
+                note.bump_version(to=version)
+                db.session.commit()
+                note_cache.invalidate_user(note.user_id)
+                return
+            except StaleDataError as e:
+                # changed between reading and writing it: rebase again
+                db.session.rollback()
+                error = e
+            except Exception as e:
+                db.session.rollback()
+                error = e
+                print(f"[ERROR] Failed to flush coalesced changes for note {note_id}: {e}")
+        self._record_conflict(note_id, pending, f'Save failed: {error}', None)
+
+
+patch_coalescer = PatchCoalescer()
+atexit.register(patch_coalescer.flush_all)
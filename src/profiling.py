@@ -0,0 +1,349 @@
+"""Opt-in request profiling and a slow-query log.
+
+Sampling profiler: a request is profiled when an admin sends
+`X-Profile: 1` (together with a valid `X-Admin-Token`) or when it is picked
+by PROFILE_SAMPLE_RATE. While at least one request is being profiled, a
+single background thread wakes every PROFILE_INTERVAL seconds, grabs the
+stack of each profiled request thread from `sys._current_frames()` and
+counts it. When the response is closed the stacks are appended in folded
+format (`frame;frame;frame count`, as read by flamegraph.pl and
+speedscope) to one file per route under PROFILE_DIR. Requests that are
+not profiled only pay for a header lookup and, with a sample rate set, a
+random number.
+
+Slow-query log: SQLAlchemy cursor events time every statement; those
+slower than SLOW_QUERY_MS are kept in a bounded ring buffer together with
+their parameters, the route that ran them, the engine (primary or read
+replica) and an EXPLAIN plan. It is off unless SLOW_QUERY_MS is set; at
+the default of 0 the engines get no listeners at all.
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from src.auth import is_admin_request
+from src.db_routing import REPLICA_BIND
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'notetaker-profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.005'))
+PROFILE_MAX_DEPTH = 64
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+MAX_PARAM_LENGTH = 200
+
+
+def route_slug(method, rule):
+    """File-name-safe name for a route, e.g. `GET_api_notes_int_note_id`."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', f'{method} {rule}').strip('_')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def fold_stack(frame):
+    """Return the stack of `frame` as a folded string, outermost frame first."""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfileSession:
+    def __init__(self, thread_id, slug):
+        self.thread_id = thread_id
+        self.slug = slug
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self.duration = None
+
+
+class SamplingProfiler:
+    """One sampler thread shared by every request currently being profiled."""
+
+    def __init__(self, directory=PROFILE_DIR, interval=PROFILE_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sessions = {}  # thread id -> ProfileSession
+        self._thread = None
+        self._routes = {}  # slug -> {'requests', 'samples', 'last_ms', 'max_ms'}
+
+    def start(self, slug):
+        session = ProfileSession(threading.get_ident(), slug)
+        with self._lock:
+            self._sessions[session.thread_id] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session):
+        session.duration = time.perf_counter() - session.started
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+        self._write(session)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                sessions = list(self._sessions.values())
+            frames = sys._current_frames()
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is not None and session.thread_id != own:
+                    session.stacks[fold_stack(frame)] += 1
+            del frames
+
+    def path_for(self, slug):
+        return os.path.join(self.directory, f'{slug}.folded')
+
+    def _write(self, session):
+        samples = sum(session.stacks.values())
+        ms = round(session.duration * 1000, 2)
+        try:
+            with self._write_lock:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self.path_for(session.slug), 'a', encoding='utf-8') as f:
+                    for stack, count in session.stacks.items():
+                        f.write(f'{stack} {count}\n')
+                info = self._routes.setdefault(session.slug, {'requests': 0, 'samples': 0, 'last_ms': 0, 'max_ms': 0})
+                info['requests'] += 1
+                info['samples'] += samples
+                info['last_ms'] = ms
+                info['max_ms'] = max(info['max_ms'], ms)
+        except OSError as e:
+            print(f"[WARN] Could not write profile for {session.slug}: {e}")
+
+    def routes(self):
+        """Profiled routes: those seen by this process plus any files left on disk."""
+        with self._write_lock:
+            listed = {slug: dict(info) for slug, info in self._routes.items()}
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.folded'):
+                    listed.setdefault(filename[:-len('.folded')], {})
+        for slug, info in listed.items():
+            path = self.path_for(slug)
+            info['bytes'] = os.path.getsize(path) if os.path.exists(path) else 0
+        return listed
+
+    def load(self, slug):
+        """Return the aggregated folded stacks of `slug`, or None if there is no profile."""
+        if not re.fullmatch(r'[A-Za-z0-9_]+', slug):
+            return None
+        path = self.path_for(slug)
+        if not os.path.exists(path):
+            return None
+        stacks = Counter()
+        with self._write_lock, open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+        return stacks
+
+    def summary(self, slug, limit=20):
+        stacks = self.load(slug)
+        if stacks is None:
+            return None
+        total = sum(stacks.values())
+        self_time = Counter()
+        inclusive = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            self_time[frames[-1]] += count
+            for name in set(frames):
+                inclusive[name] += count
+
+        def top(counter):
+            return [{'frame': name, 'samples': n, 'share': round(n / total, 4) if total else 0.0}
+                    for name, n in counter.most_common(limit)]
+
+        return {
+            'route': slug,
+            'samples': total,
+            'top_self': top(self_time),
+            'top_inclusive': top(inclusive),
+            'top_stacks': top(stacks),
+        }
+
+    def clear(self):
+        with self._write_lock:
+            self._routes.clear()
+            if os.path.isdir(self.directory):
+                for filename in os.listdir(self.directory):
+                    if filename.endswith('.folded'):
+                        os.remove(os.path.join(self.directory, filename))
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_LOG_SIZE, explain=SLOW_QUERY_EXPLAIN):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._engines = {}  # id(engine) -> name
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def attach(self, engine, name='primary'):
+        if not self.enabled or id(engine) in self._engines:
+            return
+        self._engines[id(engine)] = name
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        if duration < self.threshold:
+            return
+        entry = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration_ms': round(duration * 1000, 2),
+            'statement': statement,
+            'parameters': self._format_parameters(parameters, executemany),
+            'route': f'{request.method} {request.path}' if has_request_context() else None,
+            'engine': self._engines.get(id(conn.engine)),
+            'plan': None,
+        }
+        if self.explain and not executemany:
+            entry['plan'] = self._explain(conn, cursor, statement, parameters)
+        with self._lock:
+            self._seen += 1
+            self._entries.append(entry)
+
+    @staticmethod
+    def _format_parameters(parameters, executemany):
+        if executemany:
+            return f'<{len(parameters)} parameter sets>'
+        text = repr(parameters)
+        return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+    @staticmethod
+    def _explain(conn, cursor, statement, parameters):
+        """EXPLAIN a read statement on the same DBAPI connection (bypassing the events).
+
+        On Postgres a failed statement aborts the whole transaction, so the
+        EXPLAIN runs inside a savepoint that is rolled back if it fails.
+        """
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        dialect = conn.dialect.name
+        if dialect == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        elif dialect in ('postgresql', 'mysql'):
+            prefix = 'EXPLAIN '
+        else:
+            return None
+        savepoint = dialect != 'sqlite'
+        try:
+            raw = cursor.connection.cursor()
+            try:
+                if savepoint:
+                    raw.execute('SAVEPOINT slow_query_explain')
+                try:
+                    raw.execute(prefix + statement, parameters)
+                    rows = raw.fetchall()
+                except Exception:
+                    if savepoint:
+                        raw.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    raise
+                if savepoint:
+                    raw.execute('RELEASE SAVEPOINT slow_query_explain')
+            finally:
+                raw.close()
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        if dialect == 'sqlite':
+            # (id, parent, notused, detail)
+            return '\n'.join(str(row[-1]) for row in rows)
+        return '\n'.join(' | '.join(str(col) for col in row) for row in rows)
+
+    def entries(self, limit=50):
+        with self._lock:
+            return list(self._entries)[-limit:][::-1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'threshold_ms': round(self.threshold * 1000, 2),
+                'captured': self._seen,
+                'kept': len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+profiler = SamplingProfiler()
+slow_query_log = SlowQueryLog()
+
+
+def _wants_profile():
+    if request.headers.get('X-Profile') == '1':
+        return is_admin_request()
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def init_profiling(app, db):
+    """Install the per-request profiler hooks on `app` and slow-query capture on `db`'s engines.
+
+    Must run after `db.init_app(app)` in an app context.
+    """
+    slow_query_log.attach(db.engine)
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is not None:
+        slow_query_log.attach(replica, 'replica')
+
+    @app.before_request
+    def start_profile():
+        if _wants_profile():
+            rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            g.profile_session = profiler.start(route_slug(request.method, rule))
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            response.headers['X-Profile-Route'] = session.slug
+            # streamed bodies are produced after this hook, so stop on close
+            response.call_on_close(lambda: profiler.stop(session))
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # after_request is skipped when the request fails hard; never leave a session behind
+        session = g.pop('profile_session', None)
+        if session is not None:
+            profiler.stop(session)
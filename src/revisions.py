@@ -0,0 +1,360 @@
+"""Note revision history with reverse deltas.
+
+Every update that changes a note's title, content, tags or event date/time
+records the state it replaces in `note_revision`. A revision is stored as a
+reverse delta: the word-level diff (difflib) that turns the next newer
+state, i.e. the next revision or the live note, back into it, plus any other
+fields that differed. Autosave-sized edits therefore cost a few dozen bytes
+each. Reading revision r starts from the nearest newer keyframe (or the
+live note) and applies the deltas down to r. Every REVISION_KEYFRAME_INTERVAL-th
+revision is stored in full, so no read applies more than that many deltas.
+
+Older history is thinned by `compact_revisions()`: everything from the last
+REVISION_KEEP_ALL_HOURS is kept, then the newest revision per hour up to
+REVISION_HOURLY_DAYS, then one per day (dropped after REVISION_MAX_AGE_DAYS,
+if set). Surviving revisions are re-diffed against each other in place, so
+storage follows how much a note changed rather than how often it was saved.
+The job runs on demand (`POST /api/admin/revisions/compact`) and, when
+REVISION_COMPACT_INTERVAL_HOURS is set, periodically.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import defer
+
+from src.models.note import Note
+from src.models.note_archive import NoteArchive
+from src.models.note_revision import NoteRevision
+from src.models.user import db
+
+REVISION_KEYFRAME_INTERVAL = max(1, int(os.environ.get('REVISION_KEYFRAME_INTERVAL', '20')))
+REVISION_KEEP_ALL_HOURS = float(os.environ.get('REVISION_KEEP_ALL_HOURS', '24'))
+REVISION_HOURLY_DAYS = float(os.environ.get('REVISION_HOURLY_DAYS', '7'))
+REVISION_MAX_AGE_DAYS = float(os.environ.get('REVISION_MAX_AGE_DAYS', '0'))
+REVISION_COMPACT_INTERVAL_HOURS = float(os.environ.get('REVISION_COMPACT_INTERVAL_HOURS', '0'))
+
+FIELDS = ('title', 'content', 'tags', 'event_date', 'event_time')
+# words with their trailing whitespace (plus leading whitespace); ''.join() restores the text
+_TOKEN_RE = re.compile(r'\S+\s*|\s+')
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text or '')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def note_state(note):
+    """The versioned fields of a live note, as stored in revisions."""
+    return {'title': note.title, 'content': note.content, 'tags': note.tags,
+            'event_date': _isoformat(note.event_date), 'event_time': _isoformat(note.event_time)}
+
+
+def make_delta(newer, older):
+    """Reverse delta turning state `newer` into state `older`.
+
+    Content is a list of `[start, end]` token ranges copied from `newer` and
+    literal strings; other fields are only included when they differ.
+    """
+    a, b = _tokens(newer['content']), _tokens(older['content'])
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    fields = {name: older[name] for name in FIELDS if name != 'content' and older[name] != newer[name]}
+    return {'ops': ops, 'fields': fields}
+
+
+def apply_delta(newer, delta):
+    a = _tokens(newer['content'])
+    content = ''.join(op if isinstance(op, str) else ''.join(a[op[0]:op[1]]) for op in delta['ops'])
+    state = dict(newer, content=content)
+    state.update(delta['fields'])
+    return state
+
+
+def _payload(newer, older, keyframe):
+    return NoteRevision.pack({'state': older} if keyframe else make_delta(newer, older))
+
+
+def _step(state, revision):
+    payload = revision.payload()
+    return payload['state'] if revision.keyframe else apply_delta(state, payload)
+
+
+# --- recording ---------------------------------------------------------
+
+def _previous_values(connection, target):
+    """Values of `target` before this flush: (state, version, updated_at)."""
+    attrs = inspect(target).attrs
+    old = {}
+    for name in FIELDS + ('version', 'updated_at'):
+        history = attrs[name].history
+        if history.deleted:
+            old[name] = history.deleted[0]
+        elif history.added:
+            # the old value was never loaded; read it before it is overwritten
+            table = Note.__table__
+            row = connection.execute(select(table).where(table.c.id == target.id)).mappings().first()
+            if row is None:
+                return None
+            old = dict(row)
+            break
+        else:
+            old[name] = getattr(target, name)
+    state = {name: old[name] for name in FIELDS}
+    state['event_date'] = _isoformat(state['event_date'])
+    state['event_time'] = _isoformat(state['event_time'])
+    return state, old['version'], old['updated_at']
+
+
+def _deltas_since_keyframe(connection, note_id):
+    table = NoteRevision.__table__
+    last_keyframe = (select(func.max(table.c.id))
+                     .where(table.c.note_id == note_id, table.c.keyframe.is_(True))
+                     .scalar_subquery())
+    return connection.execute(
+        select(func.count()).where(table.c.note_id == note_id, table.c.id > func.coalesce(last_keyframe, 0))
+    ).scalar()
+
+
+@event.listens_for(Note, 'before_update')
+def _record_revision(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[name].history.has_changes() for name in FIELDS):
+        return
+    previous = _previous_values(connection, target)
+    if previous is None:
+        return
+    older, version, saved_at = previous
+    newer = note_state(target)
+    if older == newer:
+        return
+    keyframe = _deltas_since_keyframe(connection, target.id) >= REVISION_KEYFRAME_INTERVAL - 1
+    data = _payload(newer, older, keyframe)
+    connection.execute(NoteRevision.__table__.insert(), [{
+        'note_id': target.id, 'user_id': target.user_id, 'version': version or 0,
+        'keyframe': keyframe, 'data': data, 'size': len(data),
+        'saved_at': saved_at, 'replaced_at': datetime.utcnow(),
+    }])
+
+
+@event.listens_for(Note, 'after_delete')
+def _drop_revisions(mapper, connection, target):
+    table = NoteRevision.__table__
+    connection.execute(table.delete().where(table.c.note_id == target.id))
+
+
+# --- reading -----------------------------------------------------------
+
+def list_revisions(note_id, limit=50, offset=0):
+    """Revisions of `note_id`, newest first (metadata only)."""
+    return (NoteRevision.query.filter_by(note_id=note_id)
+            .options(defer(NoteRevision.data))
+            .order_by(NoteRevision.id.desc())
+            .offset(offset).limit(limit).all())
+
+
+def revision_state(note, revision_id):
+    """Full state of revision `revision_id` of the live `note`, or None if it has no such revision."""
+    revision = db.session.get(NoteRevision, revision_id)
+    if revision is None or revision.note_id != note.id:
+        return None
+    keyframe_id = (db.session.query(func.min(NoteRevision.id))
+                   .filter(NoteRevision.note_id == note.id, NoteRevision.keyframe.is_(True),
+                           NoteRevision.id >= revision_id)
+                   .scalar())
+    chain = NoteRevision.query.filter(NoteRevision.note_id == note.id, NoteRevision.id >= revision_id)
+    if keyframe_id is not None:
+        chain = chain.filter(NoteRevision.id <= keyframe_id)
+    state = note_state(note)
+    for row in chain.order_by(NoteRevision.id.desc()):
+        state = _step(state, row)
+    return state
+
+
+def restore_state(note, state):
+    """Write a revision state back onto `note` (the caller bumps the version and commits)."""
+    note.title = state['title']
+    note.content = state['content']
+    note.tags = state['tags']
+    note.set_event_date(state['event_date'])
+    note.set_event_time(state['event_time'])
+
+
+# --- retention and compaction ------------------------------------------
+
+def _retained(revisions, now):
+    """Ids of `revisions` (newest first) the retention policy keeps."""
+    keep = set()
+    buckets = set()
+    for revision in revisions:
+        stamp = revision.saved_at or revision.replaced_at
+        age = now - stamp
+        if age <= timedelta(hours=REVISION_KEEP_ALL_HOURS):
+            keep.add(revision.id)
+            continue
+        if REVISION_MAX_AGE_DAYS and age > timedelta(days=REVISION_MAX_AGE_DAYS):
+            continue
+        if age <= timedelta(days=REVISION_HOURLY_DAYS):
+            bucket = ('hour', stamp.replace(minute=0, second=0, microsecond=0))
+        else:
+            bucket = ('day', stamp.date())
+        if bucket not in buckets:
+            buckets.add(bucket)
+            keep.add(revision.id)
+    return keep
+
+
+def compact_note(note, now=None):
+    """Apply the retention policy to one live note's history; returns (before, after) row counts.
+
+    Kept rows keep their ids (and so their order) and are re-encoded
+    against the next kept newer state. Nothing is committed.
+    """
+    now = now or datetime.utcnow()
+    revisions = NoteRevision.query.filter_by(note_id=note.id).order_by(NoteRevision.id.desc()).all()
+    if not revisions:
+        return 0, 0
+    keep = _retained(revisions, now)
+    table = NoteRevision.__table__
+    newer = note_state(note)
+    states = []
+    state = newer
+    for revision in revisions:
+        state = _step(state, revision)
+        states.append(state)
+    drop = []
+    kept_state = newer
+    for revision, state in zip(revisions, states):
+        if revision.id not in keep or state == kept_state:
+            drop.append(revision.id)
+        else:
+            kept_state = state
+    if not drop:
+        # nothing to remove; the chain as recorded is already bounded
+        return len(revisions), len(revisions)
+    dropped = set(drop)
+    deltas = 0
+    for revision, state in zip(revisions, states):
+        if revision.id in dropped:
+            continue
+        keyframe = deltas >= REVISION_KEYFRAME_INTERVAL - 1
+        deltas = 0 if keyframe else deltas + 1
+        data = _payload(newer, state, keyframe)
+        if data != revision.data or keyframe != revision.keyframe:
+            db.session.execute(table.update().where(table.c.id == revision.id)
+                               .values(data=data, size=len(data), keyframe=keyframe, compacted_at=now))
+        newer = state
+    db.session.execute(table.delete().where(table.c.id.in_(drop)))
+    return len(revisions), len(revisions) - len(drop)
+
+
+def compact_revisions(batch_size=100):
+    """Compact the history of every live note; returns {'notes', 'before', 'after', 'orphans'}.
+
+    Revisions of archived notes are left alone; those of notes that no
+    longer exist anywhere are deleted.
+    """
+    now = datetime.utcnow()
+    totals = {'notes': 0, 'before': 0, 'after': 0, 'orphans': 0}
+    table = NoteRevision.__table__
+    note_ids = [i for (i,) in db.session.execute(select(table.c.note_id).distinct().order_by(table.c.note_id))]
+    for start in range(0, len(note_ids), batch_size):
+        chunk = note_ids[start:start + batch_size]
+        # lock the notes so no save slips in between reading a note and its history
+        notes = {note.id: note for note in Note.query.filter(Note.id.in_(chunk)).with_for_update()}
+        archived = {i for (i,) in db.session.query(NoteArchive.id).filter(NoteArchive.id.in_(chunk))}
+        orphans = [i for i in chunk if i not in notes and i not in archived]
+        if orphans:
+            totals['orphans'] += db.session.execute(table.delete().where(table.c.note_id.in_(orphans))).rowcount
+        for note in notes.values():
+            before, after = compact_note(note, now)
+            totals['notes'] += 1
+            totals['before'] += before
+            totals['after'] += after
+        db.session.commit()
+        db.session.expunge_all()
+    return totals
+
+
+def revision_stats():
+    count, keyframes, size, notes = db.session.query(
+        func.count(NoteRevision.id),
+        func.sum(case((NoteRevision.keyframe.is_(True), 1), else_=0)),
+        func.sum(NoteRevision.size),
+        func.count(func.distinct(NoteRevision.note_id)),
+    ).one()
+    return {
+        'revisions': count,
+        'keyframes': keyframes or 0,
+        'bytes': size or 0,
+        'notes': notes,
+        'keyframe_interval': REVISION_KEYFRAME_INTERVAL,
+        'keep_all_hours': REVISION_KEEP_ALL_HOURS,
+        'hourly_days': REVISION_HOURLY_DAYS,
+        'max_age_days': REVISION_MAX_AGE_DAYS,
+    }
+
+
+class RevisionCompactionJob:
+    """Runs `compact_revisions()` in a background thread, on demand or every REVISION_COMPACT_INTERVAL_HOURS."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._scheduler = None
+        self.status = {'state': 'idle'}
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {'state': 'running', 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            self._thread = threading.Thread(target=self._run, args=(app,), name='revision-compaction', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, app):
+        started = time.perf_counter()
+        status = dict(self.status)
+        try:
+            with app.app_context():
+                status.update(compact_revisions())
+                db.session.remove()
+            status['state'] = 'done'
+        except Exception as e:
+            print(f"[WARN] Revision compaction failed: {e}")
+            status.update(state='failed', error=str(e))
+        status['took_s'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self.status = status
+
+    def schedule(self, app, interval_hours=REVISION_COMPACT_INTERVAL_HOURS):
+        """Run the job every `interval_hours` (no-op when it is 0)."""
+        if interval_hours <= 0 or self._scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_hours * 3600)
+                self.start(app)
+
+        self._scheduler = threading.Thread(target=loop, name='revision-compaction-schedule', daemon=True)
+        self._scheduler.start()
+
+
+revision_job = RevisionCompactionJob()
+
+
+def init_revisions(app):
+    revision_job.schedule(app)
@@ -0,0 +1,203 @@
+from functools import wraps
+from flask import Blueprint, current_app, jsonify, request, Response
+from src.auth import AuthError, is_admin_request, issue_user_token, revoke_user_tokens
+from src.cache import note_cache
+from src.circuit_breaker import llm_breaker
+from src.llm_usage import usage_meter
+from src.tokens import notes_budget, translate_budget
+from src.profiling import profiler, slow_query_log
+from src.duplicates import duplicate_job, DEFAULT_DISTANCE, MAX_DISTANCE
+from src.archive import archive_job, archive_stats, ARCHIVE_AFTER_DAYS
+from src.db_routing import replica_monitor
+from src.revisions import revision_job, revision_stats
+from src.models.user import User, db
+
+admin_bp = Blueprint('admin', __name__)
+
+
+def require_admin(view):
+    """Allow the request only with `X-Admin-Token` matching ADMIN_TOKEN.
+
+    Admin endpoints are disabled entirely while ADMIN_TOKEN is unset.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return jsonify({'error': 'Admin token required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/admin/cache', methods=['GET'])
+@require_admin
+def cache_stats():
+    """Hit/miss counters of the note read cache"""
+    return jsonify(note_cache.stats())
+
+
+@admin_bp.route('/admin/llm/breaker', methods=['GET'])
+@require_admin
+def llm_breaker_state():
+    """Current state of the LLM circuit breaker"""
+    return jsonify(llm_breaker.to_dict())
+
+
+@admin_bp.route('/admin/llm/usage', methods=['GET'])
+@require_admin
+def llm_usage():
+    """LLM calls, tokens and latency per endpoint since the last reset, with the input budgets"""
+    return jsonify({**usage_meter.summary(),
+                    'budgets': {'notes': notes_budget.to_dict(), 'translate': translate_budget.to_dict()}})
+
+
+@admin_bp.route('/admin/llm/usage', methods=['DELETE'])
+@require_admin
+def reset_llm_usage():
+    usage_meter.reset()
+    return '', 204
+
+
+@admin_bp.route('/admin/users/<int:user_id>/token', methods=['POST'])
+@require_admin
+def user_token(user_id):
+    """Issue a token for an existing user (e.g. one created before tokens existed)"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    try:
+        token = issue_user_token(user)
+    except AuthError as e:
+        return jsonify({'error': str(e)}), 503
+    db.session.commit()
+    return jsonify({'user_id': user_id, 'token': token})
+
+
+@admin_bp.route('/admin/users/<int:user_id>/token', methods=['DELETE'])
+@require_admin
+def revoke_user_token(user_id):
+    """Revoke every token issued for a user"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    revoke_user_tokens(user)
+    db.session.commit()
+    return '', 204
+
+
+@admin_bp.route('/admin/db/replica', methods=['GET'])
+@require_admin
+def replica_state():
+    """Health and lag of the read replica as of its last check"""
+    return jsonify(replica_monitor.to_dict())
+
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+@require_admin
+def list_profiles():
+    """Routes with captured request profiles"""
+    return jsonify({'directory': profiler.directory, 'routes': profiler.routes()})
+
+
+@admin_bp.route('/admin/profiles', methods=['DELETE'])
+@require_admin
+def clear_profiles():
+    profiler.clear()
+    return '', 204
+
+
+@admin_bp.route('/admin/profiles/<slug>', methods=['GET'])
+@require_admin
+def get_profile(slug):
+    """Hottest frames and stacks of one route; ?format=folded returns the raw folded stacks"""
+    if request.args.get('format') == 'folded':
+        stacks = profiler.load(slug)
+        if stacks is None:
+            return jsonify({'error': 'No profile for this route'}), 404
+        body = ''.join(f'{stack} {count}\n' for stack, count in stacks.items())
+        return Response(body, mimetype='text/plain')
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    summary = profiler.summary(slug, limit=limit)
+    if summary is None:
+        return jsonify({'error': 'No profile for this route'}), 404
+    return jsonify(summary)
+
+
+@admin_bp.route('/admin/slow-queries', methods=['GET'])
+@require_admin
+def slow_queries():
+    """Most recent statements slower than SLOW_QUERY_MS, newest first"""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    return jsonify({**slow_query_log.stats(), 'queries': slow_query_log.entries(limit)})
+
+
+@admin_bp.route('/admin/slow-queries', methods=['DELETE'])
+@require_admin
+def clear_slow_queries():
+    slow_query_log.clear()
+    return '', 204
+
+
+@admin_bp.route('/admin/duplicates/cluster', methods=['POST'])
+@require_admin
+def start_duplicate_clustering():
+    """Start clustering near-duplicate notes across the whole corpus in the background"""
+    data = request.get_json(silent=True) or {}
+    try:
+        max_distance = min(int(data.get('max_distance', DEFAULT_DISTANCE)), MAX_DISTANCE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_distance must be a number'}), 400
+    if not duplicate_job.start(current_app._get_current_object(), max_distance=max_distance):
+        return jsonify({'error': 'Clustering is already running'}), 409
+    return jsonify(duplicate_job.status), 202
+
+
+@admin_bp.route('/admin/duplicates', methods=['GET'])
+@require_admin
+def duplicate_clusters():
+    """State and result of the last clustering run"""
+    return jsonify(duplicate_job.status)
+
+
+@admin_bp.route('/admin/archive/run', methods=['POST'])
+@require_admin
+def run_archive_job():
+    """Move notes untouched for `days` (default ARCHIVE_AFTER_DAYS) to the archive in the background"""
+    data = request.get_json(silent=True) or {}
+    try:
+        days = float(data.get('days', ARCHIVE_AFTER_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'days must be a number'}), 400
+    if days < 0:
+        return jsonify({'error': 'days must not be negative'}), 400
+    if not archive_job.start(current_app._get_current_object(), days=days):
+        return jsonify({'error': 'Archiving is already running'}), 409
+    return jsonify(archive_job.status), 202
+
+
+@admin_bp.route('/admin/archive', methods=['GET'])
+@require_admin
+def archive_state():
+    """Hot/archived note counts and the last archiving run"""
+    return jsonify({**archive_stats(), 'job': archive_job.status})
+
+
+@admin_bp.route('/admin/revisions/compact', methods=['POST'])
+@require_admin
+def run_revision_compaction():
+    """Thin out and re-encode note revision history in the background"""
+    if not revision_job.start(current_app._get_current_object()):
+        return jsonify({'error': 'Revision compaction is already running'}), 409
+    return jsonify(revision_job.status), 202
+
+
+@admin_bp.route('/admin/revisions', methods=['GET'])
+@require_admin
+def revisions_state():
+    """Revision counts and storage, retention settings and the last compaction run"""
+    return jsonify({**revision_stats(), 'job': revision_job.status})
@@ -1,4 +1,5 @@
 from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import HTTPException
 import os
 import sys
 
@@ -6,6 +7,8 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from src.call_llm_model import process_user_notes
+from src.tag_suggest import tag_suggester
+from src.auth import current_user_id
 
 generate_bp = Blueprint('generate', __name__)
 
@@ -18,7 +21,8 @@ def generate_notes():
     Expected JSON body:
     {
         "user_input": "natural language input",
-        "language": "Chinese" or "English" (optional, defaults to "English")
+        "language": "Chinese" or "English" (optional, defaults to "English"),
+        "use_llm": false (optional, skip the LLM and answer locally)
     }
     
     Returns:
@@ -27,6 +31,10 @@ def generate_notes():
         "content": "structured notes content", 
         "tags": ["tag1", "tag2", "tag3"]
     }
+
+    When the LLM is down or slower than its latency budget the locally parsed
+    fallback is returned with "degraded": true and a "degraded_reason"; its
+    tags then come from the local TF-IDF suggester.
     """
     data = request.json or {}
     user_input = data.get('user_input')
@@ -36,23 +44,39 @@ def generate_notes():
         return jsonify({'error': 'No user_input provided'}), 400
 
     try:
-        result = process_user_notes(language, user_input)
-        
-        # Check if there was an error in processing
-        if 'error' in result:
-            return jsonify(result), 500
-        
-        # Convert the result format to match frontend expectations    
-        # The process_user_notes returns: {"Title": "...", "Notes": "...", "Tags": [...], "Event_Date": "...", "Event_Time": "..."}
-        # Frontend expects: {"title": "...", "content": "...", "tags": [...], "event_date": "...", "event_time": "..."}
-        response = {
-            "title": result.get("Title", ""),
-            "content": result.get("Notes", ""),
-            "tags": result.get("Tags", []),
-            "event_date": result.get("Event_Date", None),
-            "event_time": result.get("Event_Time", None)
-        }
-            
-        return jsonify(response)
+        user_id = current_user_id()
+        result = process_user_notes(
+            language, user_input,
+            tag_suggester=lambda text: tag_suggester.suggest_names(text, user_id),
+            use_llm=data.get('use_llm', True) is not False,
+        )
+        payload, status = format_generate_response(result)
+        return jsonify(payload), status
+    except HTTPException:
+        raise
     except Exception as e:
-        return jsonify({'error': f'Note generation failed: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Note generation failed: {str(e)}'}), 500
+
+
+def format_generate_response(result):
+    """Map a process_user_notes result to the (payload, status) the frontend expects."""
+    # Check if there was an error in processing
+    if 'error' in result:
+        return result, 500
+
+    # Convert the result format to match frontend expectations    
+    # The process_user_notes returns: {"Title": "...", "Notes": "...", "Tags": [...], "Event_Date": "...", "Event_Time": "..."}
+    # Frontend expects: {"title": "...", "content": "...", "tags": [...], "event_date": "...", "event_time": "..."}
+    response = {
+        "title": result.get("Title", ""),
+        "content": result.get("Notes", ""),
+        "tags": result.get("Tags", []),
+        "event_date": result.get("Event_Date", None),
+        "event_time": result.get("Event_Time", None)
+    }
+    if result.get("degraded"):
+        response["degraded"] = True
+        response["degraded_reason"] = result.get("degraded_reason")
+    if result.get("input_truncated"):
+        response["input_truncated"] = True
+    return response, 200
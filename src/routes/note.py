@@ -1,14 +1,51 @@
-from flask import Blueprint, jsonify, request
-from datetime import datetime, time, date
+from itertools import chain
+from flask import Blueprint, Response, abort, jsonify, request
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import HTTPException
 from src.models.note import Note, db
+from src.models.user import User
+from src.auth import current_user_id
+from src.cache import note_cache, LIST_MAX_ITEMS
+from src.streaming import keyset_pages, stream_json_list, stream_query
+from src.search_index import fuzzy_search, DEFAULT_THRESHOLD, DEFAULT_LIMIT
+from src.duplicates import find_duplicates, DEFAULT_DISTANCE, MAX_DISTANCE
+from src.archive import load_note, archived_notes, include_archived_requested
+from src.revisions import list_revisions, revision_state, restore_state
+from src.models.note_revision import NoteRevision
+from src.note_events import broadcaster, ThreadSubscription, event_stream, parse_last_event_id, replay
+from src.db_routing import use_primary
+from src.note_patch import (patch_coalescer, coalescing_enabled, merge_patch, note_state, write_state,
+                            patch_summary, PatchError, VersionConflict)
 
 note_bp = Blueprint('note', __name__)
 
+# listing order, as keyset columns (see src/streaming.py)
+NEWEST_FIRST = ((Note.updated_at, True), (Note.id, True))
+
 @note_bp.route('/notes', methods=['GET'])
 def get_notes():
-    """Get all notes, ordered by most recently updated"""
-    notes = Note.query.order_by(Note.updated_at.desc()).all()
-    return jsonify([note.to_dict() for note in notes])
+    """Get the requesting user's notes, ordered by most recently updated
+
+    Served from the cache when possible, otherwise streamed from the
+    database (JSON array, or NDJSON with `?format=ndjson`). Archived notes
+    are left out unless `include_archived=1`; they follow the hot ones.
+    """
+    user_id = current_user_id()
+    patch_coalescer.flush_user(user_id)
+    include_archived = include_archived_requested(request.args)
+    key, cached = note_cache.lookup(user_id, 'list:all' if include_archived else 'list')
+    if cached is not None:
+        return stream_json_list(cached, lambda item: item)
+
+    def fill_cache(items):
+        if items is not None:
+            note_cache.store(key, items)
+
+    query = Note.owned_by(user_id)
+    if include_archived:
+        rows = chain(keyset_pages(query, NEWEST_FIRST), archived_notes(user_id))
+        return stream_json_list(rows, _to_dict, on_complete=fill_cache, collect_limit=LIST_MAX_ITEMS)
+    return stream_query(query, Note.to_dict, NEWEST_FIRST, on_complete=fill_cache, collect_limit=LIST_MAX_ITEMS)
 
 @note_bp.route('/notes', methods=['POST'])
 def create_note():
@@ -17,49 +54,80 @@ def create_note():
         data = request.json
         if not data or 'title' not in data or 'content' not in data:
             return jsonify({'error': 'Title and content are required'}), 400
+        user_id = current_user_id()
+        if user_id is not None and db.session.get(User, user_id) is None:
+            return jsonify({'error': 'Unknown user'}), 400
         # optional fields: tags (list or comma string), event_date (YYYY-MM-DD), event_time (HH:MM[:SS])
-        tags = data.get('tags')
-        event_date = data.get('event_date')
-        event_time = data.get('event_time')
-
-        note = Note(title=data['title'], content=data['content'])
-        note.set_tags(tags)
-        if event_date:
-            try:
-                # Accept plain YYYY-MM-DD
-                note.event_date = date.fromisoformat(event_date)
-            except Exception:
-                note.event_date = None
-        if event_time:
-            try:
-                note.event_time = datetime.fromisoformat(event_time).time()
-            except Exception:
-                try:
-                    # fallback parse HH:MM[:SS]
-                    parts = event_time.split(':')
-                    h, m = int(parts[0]), int(parts[1])
-                    s = int(parts[2]) if len(parts) > 2 else 0
-                    note.event_time = time(hour=h, minute=m, second=s)
-                except Exception:
-                    note.event_time = None
+        note = Note(title=data['title'], content=data['content'], user_id=user_id, version=1)
+        note.set_tags(data.get('tags'))
+        note.set_event_date(data.get('event_date'))
+        note.set_event_time(data.get('event_time'))
         db.session.add(note)
         db.session.commit()
+        note_cache.invalidate_user(user_id)
         return jsonify(note.to_dict()), 201
+    except HTTPException:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@note_bp.route('/notes/stream', methods=['GET'])
+def stream_note_events():
+    """Server-Sent Events feed of the user's note changes
+
+    Events are `created`, `updated` (data: the note) and `deleted` (data:
+    id and version), plus `reset` when the client must reload its list.
+    Send `Last-Event-ID` (or `?last_event_id=`) to resume. EventSource
+    cannot set headers, so browsers pass `?user_id=`.
+    """
+    user_id = current_user_id()
+    last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID'), request.args.get('last_event_id'))
+    # subscribe before replaying so nothing committed in between is missed
+    subscription = broadcaster.subscribe(ThreadSubscription(user_id))
+    try:
+        replayed, reset = [], False
+        if last_event_id is not None:
+            # a lagging replica could miss events the live feed has already passed
+            use_primary()
+            replayed, reset = replay(user_id, last_event_id)
+    except Exception:
+        broadcaster.unsubscribe(subscription)
+        raise
+    response = Response(event_stream(subscription, replayed, reset, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @note_bp.route('/notes/<int:note_id>', methods=['GET'])
 def get_note(note_id):
-    """Get a specific note by ID"""
-    note = Note.query.get_or_404(note_id)
-    return jsonify(note.to_dict())
+    """Get a specific note by ID
+
+    Coalesced autosaves that could not be saved are included as
+    `unsaved_changes` until the next PATCH.
+    """
+    user_id = current_user_id()
+    patch_coalescer.flush(note_id)
+
+    def load():
+        note = load_note(user_id, note_id)
+        if note is None:
+            abort(404)
+        return note.to_dict()
+
+    note = note_cache.get_or_load(user_id, f'note:{note_id}', load)
+    conflict = patch_coalescer.conflict(user_id, note_id)
+    if conflict is not None:
+        note = dict(note, unsaved_changes=conflict)
+    return jsonify(note)
 
 @note_bp.route('/notes/<int:note_id>', methods=['PUT'])
 def update_note(note_id):
     """Update a specific note"""
     try:
-        note = Note.query.get_or_404(note_id)
+        patch_coalescer.flush(note_id)
+        note = load_note(current_user_id(), note_id) or abort(404)
         data = request.json
         
         if not data:
@@ -71,31 +139,16 @@ def update_note(note_id):
         if 'tags' in data:
             note.set_tags(data.get('tags'))
         if 'event_date' in data:
-            ed = data.get('event_date')
-            if ed:
-                try:
-                    note.event_date = date.fromisoformat(ed)
-                except Exception:
-                    note.event_date = None
-            else:
-                note.event_date = None
+            note.set_event_date(data.get('event_date'))
         if 'event_time' in data:
-            et = data.get('event_time')
-            if et:
-                try:
-                    note.event_time = datetime.fromisoformat(et).time()
-                except Exception:
-                    try:
-                        parts = et.split(':')
-                        h, m = int(parts[0]), int(parts[1])
-                        s = int(parts[2]) if len(parts) > 2 else 0
-                        note.event_time = time(hour=h, minute=m, second=s)
-                    except Exception:
-                        note.event_time = None
-            else:
-                note.event_time = None
+            note.set_event_time(data.get('event_time'))
+        note.bump_version()
         db.session.commit()
+        note_cache.invalidate_user(note.user_id)
         return jsonify(note.to_dict())
+    except HTTPException:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -104,24 +157,204 @@ def update_note(note_id):
 def delete_note(note_id):
     """Delete a specific note"""
     try:
-        note = Note.query.get_or_404(note_id)
+        patch_coalescer.flush(note_id)
+        note = load_note(current_user_id(), note_id) or abort(404)
         db.session.delete(note)
         db.session.commit()
+        note_cache.invalidate_user(note.user_id)
         return '', 204
+    except HTTPException:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@note_bp.route('/notes/<int:note_id>', methods=['PATCH'])
+def patch_note(note_id):
+    """Apply a partial update (changed fields and/or content ops) to a note
+
+    Requires `base_version`; answers 409 with `current_version` when the note
+    has moved on, and once with `unsaved_changes` after earlier coalesced
+    changes could not be saved. See src/note_patch.py for the body format.
+    """
+    data = request.json
+    base_version = data.get('base_version') if isinstance(data, dict) else None
+    if not isinstance(base_version, int) or isinstance(base_version, bool):
+        return jsonify({'error': 'base_version is required'}), 400
+    user_id = current_user_id()
+    conflict = patch_coalescer.conflict(user_id, note_id, pop=True)
+    if conflict is not None:
+        return jsonify({'error': 'Earlier changes could not be saved', 'current_version': conflict['current_version'],
+                        'unsaved_changes': conflict}), 409
+    coalesce = ((bool(data.get('coalesce')) or request.headers.get('X-Coalesce') == '1')
+                and coalescing_enabled())
+    try:
+        if coalesce:
+            summary = patch_coalescer.submit(user_id, note_id, base_version, data)
+            if summary is None:
+                return jsonify({'error': 'Note not found'}), 404
+            return jsonify(summary), 202 if summary['pending'] else 200
+
+        patch_coalescer.flush(note_id)
+        note = load_note(user_id, note_id)
+        if note is None:
+            return jsonify({'error': 'Note not found'}), 404
+        if note.version != base_version:
+            raise VersionConflict(note.version)
+        write_state(note, merge_patch(note_state(note), data))
+        note.bump_version()
+        db.session.commit()
+        note_cache.invalidate_user(note.user_id)
+        return jsonify(patch_summary(note.id, note.version, note.updated_at))
+    except PatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'current_version': e.current_version}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Note was modified concurrently'}), 409
+    except HTTPException:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@note_bp.route('/notes/<int:note_id>/duplicates', methods=['GET'])
+def get_note_duplicates(note_id):
+    """Find the user's notes that are near-identical to this one (SimHash distance)
+
+    `max_distance` is the number of differing fingerprint bits (0-6, default 6).
+    """
+    user_id = current_user_id()
+    patch_coalescer.flush(note_id)
+    load_note(user_id, note_id) or abort(404)
+    try:
+        max_distance = int(request.args.get('max_distance', DEFAULT_DISTANCE))
+        limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+    except ValueError:
+        return jsonify({'error': 'max_distance and limit must be numbers'}), 400
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        return jsonify({'error': f'max_distance must be between 0 and {MAX_DISTANCE}'}), 400
+
+    matches = find_duplicates(note_id, user_id, max_distance=max_distance, limit=limit)
+    if matches is None:
+        return jsonify({'error': 'Note has no fingerprint yet'}), 404
+    return jsonify({
+        'note_id': note_id,
+        'duplicates': [dict(note.to_dict(), distance=distance) for note, distance in matches],
+    })
+
+@note_bp.route('/notes/<int:note_id>/revisions', methods=['GET'])
+def get_note_revisions(note_id):
+    """List earlier versions of a note, newest first (`limit` up to 200, `offset`)"""
+    user_id = current_user_id()
+    patch_coalescer.flush(note_id)
+    note = load_note(user_id, note_id) or abort(404)
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be numbers'}), 400
+    return jsonify({
+        'note_id': note_id,
+        'version': note.version,
+        'revisions': [r.to_dict() for r in list_revisions(note_id, limit=limit, offset=offset)],
+    })
+
+@note_bp.route('/notes/<int:note_id>/revisions/<int:revision_id>', methods=['GET'])
+def get_note_revision(note_id, revision_id):
+    """Get the full title, content, tags and event date/time of one revision"""
+    user_id = current_user_id()
+    patch_coalescer.flush(note_id)
+    note = load_note(user_id, note_id) or abort(404)
+    state = revision_state(note, revision_id)
+    if state is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    revision = db.session.get(NoteRevision, revision_id)
+    return jsonify({**revision.to_dict(), **state, 'tags': Note.parse_tags(state['tags'])})
+
+@note_bp.route('/notes/<int:note_id>/revisions/<int:revision_id>/restore', methods=['POST'])
+def restore_note_revision(note_id, revision_id):
+    """Make a revision the current version of the note
+
+    The replaced version becomes a revision itself, so a restore can be
+    undone. An optional `base_version` answers 409 if the note has moved on.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        patch_coalescer.flush(note_id)
+        note = load_note(current_user_id(), note_id) or abort(404)
+        base_version = data.get('base_version')
+        if base_version is not None and note.version != base_version:
+            raise VersionConflict(note.version)
+        state = revision_state(note, revision_id)
+        if state is None:
+            return jsonify({'error': 'Revision not found'}), 404
+        restore_state(note, state)
+        note.bump_version()
+        db.session.commit()
+        note_cache.invalidate_user(note.user_id)
+        return jsonify(dict(note.to_dict(), restored_from=revision_id))
+    except VersionConflict as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'current_version': e.current_version}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Note was modified concurrently'}), 409
+    except HTTPException:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @note_bp.route('/notes/search', methods=['GET'])
 def search_notes():
-    """Search notes by title or content"""
+    """Search notes by title or content
+
+    `mode=fuzzy` switches to typo-tolerant trigram search, ranked by
+    similarity; `threshold` (0-1) and `limit` tune it. `include_archived=1`
+    also scans the archive (plain search only).
+    """
     query = request.args.get('q', '')
     if not query:
         return jsonify([])
+    patch_coalescer.flush_user(current_user_id())
+
+    if request.args.get('mode') == 'fuzzy':
+        try:
+            threshold = float(request.args.get('threshold', DEFAULT_THRESHOLD))
+            limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'threshold and limit must be numbers'}), 400
+        threshold = min(max(threshold, 0.0), 1.0)
+        limit = min(max(limit, 1), 500)
+
+        def with_similarity(result):
+            note, similarity = result
+            item = note.to_dict()
+            item['similarity'] = similarity
+            return item
+
+        results = fuzzy_search(query, current_user_id(), threshold=threshold, limit=limit)
+        return stream_json_list(results, with_similarity)
     
-    notes = Note.query.filter(
+    user_id = current_user_id()
+    notes = Note.owned_by(user_id).filter(
         (Note.title.contains(query)) | (Note.content.contains(query))
-    ).order_by(Note.updated_at.desc()).all()
-    
-    return jsonify([note.to_dict() for note in notes])
+    )
+
+    if include_archived_requested(request.args):
+        # archived content is compressed, so it is matched after decompressing
+        archived = (n for n in archived_notes(user_id) if query in n.title or query in n.content)
+        return stream_json_list(chain(keyset_pages(notes, NEWEST_FIRST), archived), _to_dict)
+    return stream_query(notes, Note.to_dict, NEWEST_FIRST)
+
+
+def _to_dict(row):
+    return row.to_dict()
 
@@ -1,69 +1,120 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import HTTPException
+import time
 from collections import Counter
+from itertools import chain
 from src.models.note import Note
+from src.models.note_archive import NoteArchive
+from src.archive import archived_notes, include_archived_requested
+from src.auth import current_user_id, is_admin_request
+from src.cache import note_cache
+from src.streaming import keyset_pages, stream_json_list
+from src.tag_suggest import tag_suggester
 import json
 
 tags_bp = Blueprint('tags', __name__)
 
 @tags_bp.route('/api/tags/statistics', methods=['GET'])
 def get_tags_statistics():
-    """获取所有笔记中标签的使用统计信息"""
+    """获取当前用户笔记中标签的使用统计信息（include_archived=1 时包含归档笔记）"""
+    return _tag_statistics(current_user_id(), include_archived_requested(request.args))
+
+
+@tags_bp.route('/api/users/<int:user_id>/tags/statistics', methods=['GET'])
+def get_user_tags_statistics(user_id):
+    """获取指定用户笔记中标签的使用统计信息（仅限本人或管理员）"""
+    if user_id != current_user_id() and not is_admin_request():
+        return jsonify({'error': 'Not allowed'}), 403
+    return _tag_statistics(user_id, include_archived_requested(request.args))
+
+
+def _tag_statistics(user_id, include_archived=False):
     try:
-        # 获取所有笔记
-        notes = Note.query.all()
-        
-        # 收集所有标签
-        all_tags = []
-        for note in notes:
-            tags = note.get_tags()
-            if tags:
-                all_tags.extend(tags)
-        
-        if not all_tags:
-            return jsonify({
-                'tag_counts': [],
-                'total_tags': 0,
-                'unique_tags': 0,
-                'most_popular': None
-            })
-        
-        # 统计标签频次
-        tag_counter = Counter(all_tags)
-        
-        # 准备返回数据
-        tag_counts = []
-        max_count = max(tag_counter.values()) if tag_counter else 0
-        min_count = min(tag_counter.values()) if tag_counter else 0
-        
-        for tag, count in tag_counter.most_common():
-            # 计算标签的权重（相对于最大使用频次）
-            weight = count / max_count if max_count > 0 else 1
-            
-            tag_counts.append({
-                'tag': tag,
-                'count': count,
-                'weight': weight,
-                'percentage': round((count / len(all_tags)) * 100, 1) if all_tags else 0
-            })
-        
-        # 统计信息
-        statistics = {
-            'tag_counts': tag_counts,
-            'total_tags': len(all_tags),  # 总标签数（包括重复）
-            'unique_tags': len(tag_counter),  # 唯一标签数
-            'most_popular': tag_counter.most_common(1)[0] if tag_counter else None,
-            'distribution': {
-                'max_count': max_count,
-                'min_count': min_count,
-                'avg_count': round(sum(tag_counter.values()) / len(tag_counter), 2) if tag_counter else 0
-            }
-        }
-        
-        return jsonify(statistics)
-        
+        name = 'tagstats:all' if include_archived else 'tagstats'
+        return jsonify(note_cache.get_or_load(user_id, name,
+                                              lambda: _build_tag_statistics(user_id, include_archived)))
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': f'Failed to get tag statistics: {str(e)}'}), 500
 
+
+def _build_tag_statistics(user_id, include_archived=False):
+    # 只读取该用户笔记的标签列，走 user_id 索引
+    rows = Note.owned_by(user_id).with_entities(Note.tags).all()
+    if include_archived:
+        rows += NoteArchive.owned_by(user_id).with_entities(NoteArchive.tags).all()
+    
+    # 收集所有标签
+    all_tags = []
+    for (raw_tags,) in rows:
+        tags = Note.parse_tags(raw_tags)
+        if tags:
+            all_tags.extend(tags)
+    
+    if not all_tags:
+        return {
+            'tag_counts': [],
+            'total_tags': 0,
+            'unique_tags': 0,
+            'most_popular': None
+        }
+    
+    # 统计标签频次
+    tag_counter = Counter(all_tags)
+    
+    # 准备返回数据
+    tag_counts = []
+    max_count = max(tag_counter.values()) if tag_counter else 0
+    min_count = min(tag_counter.values()) if tag_counter else 0
+    
+    for tag, count in tag_counter.most_common():
+        # 计算标签的权重（相对于最大使用频次）
+        weight = count / max_count if max_count > 0 else 1
+        
+        tag_counts.append({
+            'tag': tag,
+            'count': count,
+            'weight': weight,
+            'percentage': round((count / len(all_tags)) * 100, 1) if all_tags else 0
+        })
+    
+    # 统计信息
+    statistics = {
+        'tag_counts': tag_counts,
+        'total_tags': len(all_tags),  # 总标签数（包括重复）
+        'unique_tags': len(tag_counter),  # 唯一标签数
+        'most_popular': tag_counter.most_common(1)[0] if tag_counter else None,
+        'distribution': {
+            'max_count': max_count,
+            'min_count': min_count,
+            'avg_count': round(sum(tag_counter.values()) / len(tag_counter), 2) if tag_counter else 0
+        }
+    }
+    
+    return statistics
+
+
+@tags_bp.route('/api/tags/suggest-for-text', methods=['POST'])
+def suggest_tags_for_text():
+    """根据文本内容在本地推荐标签（TF-IDF，无需调用 LLM）"""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    if not text:
+        return jsonify({'error': 'Missing text in request body'}), 400
+    try:
+        limit = min(max(int(data.get('limit', 3)), 1), 20)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be a number'}), 400
+    exclude = data.get('exclude') or []
+
+    start = time.perf_counter()
+    suggestions = tag_suggester.suggest(text, current_user_id(), limit=limit, exclude=exclude)
+    return jsonify({
+        'suggestions': suggestions,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+
 @tags_bp.route('/api/tags/search/<path:tag_name>', methods=['GET'])
 def search_notes_by_tag(tag_name):
     """根据标签搜索相关笔记"""
@@ -81,27 +132,12 @@ def search_notes_by_tag(tag_name):
         print(f"[DEBUG] Original tag_name: {tag_name}")
         print(f"[DEBUG] Decoded tag: {decoded_tag}")
         
-        notes = Note.query.all()
-        matching_notes = []
-        
-        for note in notes:
-            tags = note.get_tags()
-            if tags:
-                # 支持精确匹配和大小写不敏感匹配
-                for tag in tags:
-                    if (tag.lower() == decoded_tag.lower() or 
-                        tag == decoded_tag or
-                        tag.strip().lower() == decoded_tag.strip().lower()):
-                        matching_notes.append(note.to_dict())
-                        break
-        
-        return jsonify({
-            'tag': decoded_tag,
-            'original_param': tag_name,
-            'count': len(matching_notes),
-            'notes': matching_notes
-        })
+        # 逐行从数据库游标读取并流式输出匹配的笔记
+        return stream_json_list(_notes_with_tag(decoded_tag, include_archived_requested(request.args)),
+                                _to_dict, envelope={'tag': decoded_tag, 'original_param': tag_name})
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] Tag search failed: {str(e)}")
         return jsonify({
@@ -126,26 +162,12 @@ def search_notes_by_tag_post():
         tag_name = data['tag']
         print(f"[DEBUG] POST search for tag: {tag_name}")
         
-        notes = Note.query.all()
-        matching_notes = []
-        
-        for note in notes:
-            tags = note.get_tags()
-            if tags:
-                # 支持精确匹配和大小写不敏感匹配
-                for tag in tags:
-                    if (tag.lower() == tag_name.lower() or 
-                        tag == tag_name or
-                        tag.strip().lower() == tag_name.strip().lower()):
-                        matching_notes.append(note.to_dict())
-                        break
-        
-        return jsonify({
-            'tag': tag_name,
-            'count': len(matching_notes),
-            'notes': matching_notes
-        })
+        include_archived = bool(data.get('include_archived')) or include_archived_requested(request.args)
+        return stream_json_list(_notes_with_tag(tag_name, include_archived), _to_dict,
+                                envelope={'tag': tag_name})
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] POST tag search failed: {str(e)}")
         return jsonify({
@@ -154,4 +176,26 @@ def search_notes_by_tag_post():
                 'error_type': type(e).__name__,
                 'error_message': str(e)
             }
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+def _tag_matches(tag, wanted):
+    # 支持精确匹配和大小写不敏感匹配
+    return (tag.lower() == wanted.lower() or
+            tag == wanted or
+            tag.strip().lower() == wanted.strip().lower())
+
+
+def _notes_with_tag(wanted, include_archived=False):
+    """Yield the requesting user's notes carrying `wanted`, reading rows in batches."""
+    user_id = current_user_id()
+    notes = keyset_pages(Note.owned_by(user_id), ((Note.id, False),))
+    if include_archived:
+        notes = chain(notes, archived_notes(user_id))
+    for note in notes:
+        if any(_tag_matches(tag, wanted) for tag in note.get_tags()):
+            yield note
+
+
+def _to_dict(note):
+    return note.to_dict()
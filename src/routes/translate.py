@@ -1,8 +1,15 @@
+import time
 from flask import Blueprint, jsonify, request
 from src.llm import translate
+from src.batch_translate import translate_batch
+from src.circuit_breaker import CircuitOpenError
+from src.tokens import TokenBudgetError
 
 translate_bp = Blueprint('translate', __name__)
 
+BATCH_MAX_TEXTS = 100
+BATCH_MAX_LANGS = 10
+
 
 @translate_bp.route('/translate', methods=['POST'])
 def translate_text():
@@ -15,5 +22,50 @@ def translate_text():
     try:
         translated = translate(text, lang)
         return jsonify({'translation': translated})
+    except TokenBudgetError as e:
+        return jsonify({'error': str(e)}), 413
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e), 'degraded': True}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _string_list(data, plural, singular):
+    value = data.get(plural)
+    if value is None and data.get(singular) is not None:
+        value = [data.get(singular)]
+    if not isinstance(value, list) or not value or not all(isinstance(v, str) and v for v in value):
+        return None
+    return value
+
+
+@translate_bp.route('/translate/batch', methods=['POST'])
+def translate_texts_batch():
+    """Translate several texts into one or more languages with as few LLM calls as possible.
+
+    Body: {"texts": [...], "langs": ["zh-CN", "fr"]} (or "text" / "lang" for a single one)
+    """
+    data = request.get_json(silent=True) or {}
+    texts = _string_list(data, 'texts', 'text')
+    if texts is None:
+        return jsonify({'error': 'texts must be a non-empty list of strings'}), 400
+    langs = _string_list(data, 'langs', 'lang') if ('langs' in data or 'lang' in data) else ['zh-CN']
+    if langs is None:
+        return jsonify({'error': 'langs must be a non-empty list of strings'}), 400
+    if len(texts) > BATCH_MAX_TEXTS or len(langs) > BATCH_MAX_LANGS:
+        return jsonify({'error': f'At most {BATCH_MAX_TEXTS} texts and {BATCH_MAX_LANGS} languages per request'}), 400
+    langs = list(dict.fromkeys(langs))
+
+    start = time.perf_counter()
+    try:
+        translations, errors, stats = translate_batch(texts, langs)
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e), 'degraded': True}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'translations': translations,
+        'errors': errors,
+        **stats,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
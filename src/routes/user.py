@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
+from src.models.note import Note
+from src.cache import note_cache
+from src.auth import AuthError, current_user_id, is_admin_request, issue_user_token
 
 user_bp = Blueprint('user', __name__)
 
@@ -14,8 +17,15 @@ def create_user():
     data = request.json
     user = User(username=data['username'], email=data['email'])
     db.session.add(user)
+    db.session.flush()
+    try:
+        # the token is what identifies the user to the notes API from now on
+        token = issue_user_token(user)
+    except AuthError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503
     db.session.commit()
-    return jsonify(user.to_dict()), 201
+    return jsonify(dict(user.to_dict(), token=token)), 201
 
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
@@ -24,6 +34,8 @@ def get_user(user_id):
 
 @user_bp.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
+    if user_id != current_user_id() and not is_admin_request():
+        return jsonify({'error': 'Not allowed'}), 403
     user = User.query.get_or_404(user_id)
     data = request.json
     user.username = data.get('username', user.username)
@@ -33,7 +45,13 @@ def update_user(user_id):
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
+    if user_id != current_user_id() and not is_admin_request():
+        return jsonify({'error': 'Not allowed'}), 403
     user = User.query.get_or_404(user_id)
+    # notes are owned by the user; delete them one by one so per-note hooks run
+    for note in Note.owned_by(user_id).all():
+        db.session.delete(note)
     db.session.delete(user)
     db.session.commit()
+    note_cache.invalidate_user(user_id)
     return '', 204
@@ -0,0 +1,313 @@
+"""Typo-tolerant fuzzy search over notes.
+
+On Postgres the `pg_trgm` extension provides a trigram GIN index and
+`word_similarity()` ranking over `note.search_text`, the normalised title
+and content kept up to date by mapper events. Everywhere else (the local SQLite fallback, or
+a Postgres role that cannot create extensions) notes are indexed into the
+`note_ngram` side table, maintained by mapper events on every write.
+
+Text is normalised before n-grams are taken: NFKC, lower case and
+traditional -> simplified Chinese, so that "會議" finds "会议". Latin words
+produce padded trigrams the way pg_trgm does; CJK runs produce bigrams,
+since a single CJK character already carries most of a word.
+"""
+import math
+import unicodedata
+
+from sqlalchemy import bindparam, event, inspect, select, text
+
+from src.models.user import db
+from src.models.note import Note
+from src.models.note_ngram import NoteNgram
+
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_LIMIT = 50
+# Keep the IN (...) list of a query bounded for very long search strings
+MAX_QUERY_GRAMS = 64
+
+# Common traditional -> simplified pairs, used when OpenCC is not installed
+_T2S_PAIRS = (
+    '們们 個个 來来 時时 這这 會会 過过 說说 對对 還还 後后 從从 開开 關关 長长 見见 '
+    '問问 間间 門门 東东 車车 書书 學学 習习 體体 發发 現现 實实 點点 動动 頭头 電电 '
+    '話话 語语 認认 識识 記记 論论 議议 讀读 請请 謝谢 讓让 買买 賣卖 錢钱 貨货 費费 '
+    '資资 質质 員员 圖图 國国 園园 區区 場场 報报 處处 進进 運运 邊边 達达 遠远 選选 '
+    '連连 遊游 廣广 應应 廳厅 畫画 當当 為为 無无 熱热 愛爱 親亲 覺觉 觀观 視视 歲岁 '
+    '歷历 歡欢 樂乐 機机 樣样 標标 權权 極极 構构 樹树 橋桥 氣气 決决 沒没 漢汉 滿满 '
+    '濟济 燈灯 爭争 產产 畢毕 療疗 監监 盤盘 確确 礎础 種种 稱称 穩稳 窮穷 筆笔 節节 '
+    '範范 簡简 類类 級级 紀纪 約约 紅红 紙纸 組组 細细 終终 結结 給给 統统 經经 綠绿 '
+    '維维 網网 線线 練练 總总 績绩 編编 織织 續续 羅罗 義义 聽听 職职 聯联 腦脑 興兴 '
+    '舉举 舊旧 華华 萬万 葉叶 著着 蘭兰 號号 蟲虫 術术 衛卫 補补 裝装 複复 規规 計计 '
+    '訂订 訊讯 討讨 訓训 設设 訪访 許许 診诊 試试 詩诗 該该 詳详 誤误 課课 調调 談谈 '
+    '證证 變变 貝贝 負负 貢贡 財财 責责 貴贵 貼贴 賽赛 趕赶 趨趋 跡迹 躍跃 輕轻 輛辆 '
+    '輸输 轉转 辦办 農农 週周 鄉乡 醫医 針针 鐘钟 鐵铁 銀银 鋼钢 錄录 錯错 鍵键 鏡镜 '
+    '陣阵 陰阴 陽阳 隊队 際际 隨随 險险 雙双 雜杂 雞鸡 離离 難难 雲云 靜静 韓韩 頁页 '
+    '項项 順顺 須须 預预 領领 題题 顏颜 願愿 風风 飛飞 飯饭 館馆 馬马 驗验 驚惊 髮发 '
+    '鬥斗 魚鱼 鳥鸟 麗丽 麥麦 黃黄 齊齐 齒齿 龍龙 龜龟 擇择 擊击 據据 擔担 擁拥 擴扩 '
+    '攝摄 數数 斷断 於于 晝昼 暫暂 曆历 條条 棄弃 業业 榮荣 槍枪 歸归 殺杀 殼壳 態态 '
+    '慣惯 憶忆 戰战 戲戏 戶户 拋抛 掃扫 揮挥 換换 團团 圍围 壓压 備备 夢梦 奮奋 婦妇 '
+    '媽妈 孫孙 寫写 寶宝 專专 將将 導导 層层 屬属 島岛 師师 帶带 幫帮 幹干 廢废 張张 '
+    '彈弹 彙汇 徑径 復复 憂忧 飲饮 養养 餘余 寬宽 賬账 劃划 劇剧 勞劳 勢势 勵励 勝胜 '
+    '協协 單单 衝冲 傳传 價价 優优 債债 傷伤 僅仅 億亿 兒儿 內内 兩两 準准 劍剑 務务 '
+    '參参 雖虽 啟启 喚唤 營营 嚴严 檔档 檢检 藝艺 藥药 蘋苹 蔔卜 蘿萝 鬧闹 閱阅 闆板'
+)
+
+
+def _build_t2s():
+    table = {}
+    for pair in _T2S_PAIRS.split():
+        if len(pair) == 2 and pair[0] != pair[1]:
+            table[ord(pair[0])] = pair[1]
+    return table
+
+
+_T2S_TABLE = _build_t2s()
+
+try:
+    import opencc
+    _opencc = opencc.OpenCC('t2s')
+except Exception:
+    _opencc = None
+
+# 'pg_trgm' or 'ngram'; decided by init_search_index()
+_backend = {'mode': 'ngram'}
+
+
+def to_simplified(value):
+    if _opencc is not None:
+        try:
+            return _opencc.convert(value)
+        except Exception:
+            pass
+    return value.translate(_T2S_TABLE)
+
+
+def normalize(value):
+    """NFKC + lower case + traditional -> simplified."""
+    if not value:
+        return ''
+    return to_simplified(unicodedata.normalize('NFKC', value).lower())
+
+
+def _is_cjk(ch):
+    code = ord(ch)
+    return (0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or
+            0x3040 <= code <= 0x30FF or 0xAC00 <= code <= 0xD7AF or
+            0xF900 <= code <= 0xFAFF or 0x20000 <= code <= 0x2A6DF)
+
+
+def text_runs(value):
+    """Split normalised text into ('word', str) and ('cjk', str) runs."""
+    runs = []
+    current, kind = [], None
+    for ch in value:
+        if _is_cjk(ch):
+            k = 'cjk'
+        elif ch.isalnum():
+            k = 'word'
+        else:
+            k = None
+        if k != kind and current:
+            runs.append((kind, ''.join(current)))
+            current = []
+        kind = k
+        if k is not None:
+            current.append(ch)
+    if current and kind is not None:
+        runs.append((kind, ''.join(current)))
+    return runs
+
+
+def ngrams(value):
+    """Return the set of n-grams for `value` (already normalised or not)."""
+    grams = set()
+    for kind, run in text_runs(normalize(value)):
+        if kind == 'cjk':
+            if len(run) == 1:
+                grams.add(run)
+            for i in range(len(run) - 1):
+                grams.add(run[i:i + 2])
+        else:
+            padded = f'  {run} '
+            for i in range(len(padded) - 2):
+                grams.add(padded[i:i + 3])
+    return grams
+
+
+def note_ngrams(title, content):
+    return ngrams(title) | ngrams(content)
+
+
+def search_text(title, content):
+    """The normalised text the pg_trgm index covers."""
+    return f'{normalize(title)}\n{normalize(content)}'
+
+
+def search_mode():
+    return _backend['mode']
+
+
+# --- index maintenance -------------------------------------------------
+
+def _replace_grams(connection, note_id, user_id, title, content):
+    table = NoteNgram.__table__
+    connection.execute(table.delete().where(table.c.note_id == note_id))
+    rows = [{'gram': g, 'note_id': note_id, 'user_id': user_id} for g in note_ngrams(title, content)]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Note, 'before_insert')
+def _set_search_text(mapper, connection, target):
+    if _backend['mode'] == 'pg_trgm':
+        target.search_text = search_text(target.title, target.content)
+
+
+@event.listens_for(Note, 'before_update')
+def _update_search_text(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('title', 'content')):
+        # cleared under the n-gram backend so a later switch to pg_trgm backfills it
+        target.search_text = (search_text(target.title, target.content)
+                              if _backend['mode'] == 'pg_trgm' else None)
+
+
+@event.listens_for(Note, 'after_insert')
+def _index_inserted_note(mapper, connection, target):
+    if _backend['mode'] == 'ngram':
+        _replace_grams(connection, target.id, target.user_id, target.title, target.content)
+
+
+@event.listens_for(Note, 'after_update')
+def _index_updated_note(mapper, connection, target):
+    if _backend['mode'] != 'ngram':
+        return
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('title', 'content', 'user_id')):
+        _replace_grams(connection, target.id, target.user_id, target.title, target.content)
+
+
+@event.listens_for(Note, 'after_delete')
+def _unindex_deleted_note(mapper, connection, target):
+    if _backend['mode'] == 'ngram':
+        table = NoteNgram.__table__
+        connection.execute(table.delete().where(table.c.note_id == target.id))
+
+
+def rebuild_ngram_index(batch_size=500):
+    """(Re)build the whole side-table index from the note table."""
+    table = NoteNgram.__table__
+    db.session.execute(table.delete())
+    rows = []
+    query = db.session.query(Note.id, Note.user_id, Note.title, Note.content).yield_per(batch_size)
+    for note_id, user_id, title, content in query:
+        rows.extend({'gram': g, 'note_id': note_id, 'user_id': user_id}
+                    for g in note_ngrams(title, content))
+        if len(rows) >= batch_size * 50:
+            db.session.execute(table.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def backfill_search_text(batch_size=500):
+    """Fill `note.search_text` where it is missing; returns how many notes were updated."""
+    note = Note.__table__
+    # updated_at is kept: this is not an edit
+    update = (note.update().where(note.c.id == bindparam('b_id'))
+              .values(search_text=bindparam('b_text'), updated_at=note.c.updated_at))
+    done = 0
+    while True:
+        rows = db.session.execute(select(note.c.id, note.c.title, note.c.content)
+                                  .where(note.c.search_text.is_(None)).limit(batch_size)).all()
+        if not rows:
+            return done
+        db.session.execute(update, [{'b_id': row.id, 'b_text': search_text(row.title, row.content)}
+                                    for row in rows])
+        db.session.commit()
+        done += len(rows)
+
+
+def _enable_pg_trgm():
+    try:
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_note_search_text_trgm ON note USING gin (search_text gin_trgm_ops)'))
+        # superseded by ix_note_search_text_trgm
+        db.session.execute(text('DROP INDEX IF EXISTS ix_note_title_trgm'))
+        db.session.execute(text('DROP INDEX IF EXISTS ix_note_content_trgm'))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"[WARN] pg_trgm unavailable, using n-gram side table: {e}")
+        return False
+
+
+def init_search_index(app):
+    """Pick the fuzzy search backend and backfill the side table if needed.
+
+    Must be called inside an app context after `db.create_all()`.
+    """
+    if db.engine.dialect.name == 'postgresql' and _enable_pg_trgm():
+        _backend['mode'] = 'pg_trgm'
+        backfill_search_text()
+        return
+    _backend['mode'] = 'ngram'
+    has_notes = db.session.query(Note.id).first() is not None
+    has_grams = db.session.query(NoteNgram.note_id).first() is not None
+    if has_notes and not has_grams:
+        rebuild_ngram_index()
+
+
+# --- querying ----------------------------------------------------------
+
+def fuzzy_search(query, user_id=None, threshold=DEFAULT_THRESHOLD, limit=DEFAULT_LIMIT):
+    """Return [(note, similarity)] for `user_id`'s notes, best first."""
+    if _backend['mode'] == 'pg_trgm':
+        return _fuzzy_search_pg(query, user_id, threshold, limit)
+    return _fuzzy_search_ngram(query, user_id, threshold, limit)
+
+
+def _fuzzy_search_ngram(query, user_id, threshold, limit):
+    grams = sorted(ngrams(query))[:MAX_QUERY_GRAMS]
+    if not grams:
+        return []
+    # Similarity is the share of query n-grams found in the note, which
+    # (like pg_trgm's word_similarity) does not penalise long notes.
+    min_shared = max(1, math.ceil(threshold * len(grams)))
+    shared = db.func.count(NoteNgram.gram).label('shared')
+    owner = NoteNgram.user_id.is_(None) if user_id is None else NoteNgram.user_id == user_id
+    candidates = (db.session.query(NoteNgram.note_id, shared)
+                  .filter(owner, NoteNgram.gram.in_(grams))
+                  .group_by(NoteNgram.note_id)
+                  .having(db.func.count(NoteNgram.gram) >= min_shared)
+                  .subquery())
+    rows = (Note.owned_by(user_id)
+            .join(candidates, candidates.c.note_id == Note.id)
+            .with_entities(Note, candidates.c.shared)
+            .order_by(candidates.c.shared.desc(), Note.updated_at.desc())
+            .limit(limit)
+            .all())
+    return [(note, round(count / len(grams), 3)) for note, count in rows]
+
+
+def _pg_match(query):
+    """(condition, score) comparing the normalised query with `note.search_text`."""
+    v = db.literal(normalize(query))
+    return v.op('<%')(Note.search_text), db.func.word_similarity(v, Note.search_text)
+
+
+def _fuzzy_search_pg(query, user_id, threshold, limit):
+    if not normalize(query).strip():
+        return []
+    db.session.execute(text('SET LOCAL pg_trgm.word_similarity_threshold = :t'), {'t': threshold})
+    match, score = _pg_match(query)
+    score = score.label('similarity')
+    rows = (Note.owned_by(user_id)
+            .filter(match)
+            .with_entities(Note, score)
+            .order_by(score.desc(), Note.updated_at.desc())
+            .limit(limit)
+            .all())
+    return [(note, round(float(similarity), 3)) for note, similarity in rows]
@@ -0,0 +1,603 @@
+"""Consistent online snapshots of the database, and bulk restore.
+
+    python -m src.snapshot create [--full] [--dir DIR] [--database URL]
+    python -m src.snapshot list [--dir DIR]
+    python -m src.snapshot restore SNAPSHOT [--database URL] [--replace]
+
+`create` reads a consistent view of a live database. For SQLite it first
+copies the file with the online backup API. For Postgres it reads in one
+REPEATABLE READ, READ ONLY transaction with `COPY ... TO STDOUT`. The first
+snapshot in SNAPSHOT_DIR (and any `--full` one) holds every row. Later ones
+are incremental and only hold rows changed since their parent:
+
+* rows whose change column (`note.updated_at`, `note_archive.archived_at`,
+  `note_revision.compacted_at`) is at or after the parent's high-water
+  mark, minus SNAPSHOT_CLOCK_SKEW for clocks of different workers,
+* rows whose id is new since the parent (e.g. rehydrated archive notes,
+  which keep their old `updated_at`),
+* deletion records: ids the parent had that are gone now.
+
+Tables without a change column (`user`) are copied whole every time.
+Derived tables (n-grams, fingerprints, the SSE event feed) are skipped;
+the app rebuilds the first two at startup when they are empty.
+
+A snapshot is one gzip file of framed sections: a JSON header line, then
+per section a JSON line announcing `bytes` of payload. Rows are JSON arrays
+(or raw `COPY` CSV for Postgres), and id lists are delta-encoded.
+Files are written under a temporary name and renamed when complete.
+
+`restore` replays a snapshot's chain (full, then each incremental) into an
+empty database, or into a wiped one with `--replace`. It creates bare
+tables, loads rows in large batches (`COPY FROM STDIN` on Postgres), then
+builds indexes and foreign keys and resets sequences.
+"""
+import argparse
+import base64
+import glob
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Date, DateTime, LargeBinary, Time, create_engine, event, func, inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import AddConstraint, CreateTable
+
+from src.db_routing import with_sslmode
+from src.models.user import db
+# register every table on db.metadata
+import src.models.note  # noqa: E402,F401
+import src.models.note_archive  # noqa: E402,F401
+import src.models.note_event  # noqa: E402,F401
+import src.models.note_fingerprint  # noqa: E402,F401
+import src.models.note_ngram  # noqa: E402,F401
+import src.models.note_revision  # noqa: E402,F401
+
+ROOT_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(ROOT_DIR, 'database', 'snapshots'))
+SNAPSHOT_CLOCK_SKEW = timedelta(seconds=float(os.environ.get('SNAPSHOT_CLOCK_SKEW', '300')))
+
+FORMAT = 'notes-snapshot'
+FORMAT_VERSION = 1
+SKIP_TABLES = ('note_ngram', 'note_fingerprint', 'note_event')
+CHANGE_COLUMNS = {'note': 'updated_at', 'note_archive': 'archived_at', 'note_revision': 'compacted_at'}
+INSERT_BATCH = 5000
+# stay below SQLite's limit on bound parameters
+ID_CHUNK = 900
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def default_database_url():
+    """DATABASE_URL, or the local SQLite fallback the app uses."""
+    url = os.environ.get('DATABASE_URL')
+    if url:
+        return with_sslmode(url)
+    return f"sqlite:///{os.path.join(ROOT_DIR, 'database', 'app.db')}"
+
+
+def snapshot_tables():
+    return [t for t in db.metadata.sorted_tables if t.name not in SKIP_TABLES]
+
+
+def _pk(table):
+    (column,) = table.primary_key.columns
+    return column
+
+
+def _pack_ids(ids):
+    previous = 0
+    deltas = []
+    for value in sorted(ids):
+        deltas.append(value - previous)
+        previous = value
+    return json.dumps(deltas, separators=(',', ':')).encode('ascii')
+
+
+def _unpack_ids(payload):
+    ids = []
+    total = 0
+    for delta in json.loads(payload):
+        total += delta
+        ids.append(total)
+    return ids
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date, dtime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return value
+
+
+def _decoder(column):
+    kind = column.type
+    if isinstance(kind, DateTime):
+        return datetime.fromisoformat
+    if isinstance(kind, Date):
+        return date.fromisoformat
+    if isinstance(kind, Time):
+        return dtime.fromisoformat
+    if isinstance(kind, LargeBinary):
+        return base64.b64decode
+    return None
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# --- file format -------------------------------------------------------
+
+class _Section:
+    """Reads exactly `left` payload bytes of one section."""
+
+    def __init__(self, f, left):
+        self._f = f
+        self.left = left
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.left:
+            size = self.left
+        data = self._f.read(size) if size else b''
+        self.left -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if not self.left:
+            return b''
+        data = self._f.readline(self.left if size is None or size < 0 else min(size, self.left))
+        self.left -= len(data)
+        return data
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def skip(self):
+        while self.left:
+            self.read(1 << 20)
+
+
+class _Writer:
+    def __init__(self, path, header):
+        self.path = path
+        self._partial = path + '.part'
+        if os.path.exists(path):
+            raise SnapshotError(f'{path} already exists')
+        try:
+            self._f = gzip.open(self._partial, 'xb', compresslevel=6)
+        except FileExistsError:
+            raise SnapshotError(f'{path} is being written by another process')
+        self._line(header)
+
+    def _line(self, meta):
+        self._f.write(json.dumps(meta, separators=(',', ':')).encode('utf-8') + b'\n')
+
+    def section(self, meta, payload):
+        """Write a section; `payload` is bytes or a seekable binary file positioned at its end."""
+        if isinstance(payload, bytes):
+            self._line(dict(meta, bytes=len(payload)))
+            self._f.write(payload)
+        else:
+            size = payload.tell()
+            payload.seek(0)
+            self._line(dict(meta, bytes=size))
+            shutil.copyfileobj(payload, self._f, 1 << 20)
+
+    def close(self):
+        self._line({'section': 'end'})
+        self._f.close()
+        # link instead of rename, so an existing snapshot is never overwritten
+        try:
+            os.link(self._partial, self.path)
+        except FileExistsError:
+            raise SnapshotError(f'{self.path} already exists')
+        finally:
+            os.remove(self._partial)
+
+    def abort(self):
+        self._f.close()
+        os.remove(self._partial)
+
+
+def read_header(path):
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline())
+    if header.get('format') != FORMAT:
+        raise SnapshotError(f'{path} is not a snapshot')
+    if header.get('version', 0) > FORMAT_VERSION:
+        raise SnapshotError(f'{path} has format version {header["version"]}; this tool reads {FORMAT_VERSION}')
+    return header
+
+
+def read_sections(path):
+    """Yield (meta, section) for every section of the snapshot at `path`."""
+    with gzip.open(path, 'rb') as f:
+        f.readline()
+        while True:
+            meta = json.loads(f.readline())
+            if meta['section'] == 'end':
+                return
+            section = _Section(f, meta.get('bytes', 0))
+            yield meta, section
+            section.skip()
+
+
+def _snapshot_ids(path):
+    """{table: set(ids)} of a snapshot; the id sections come first."""
+    ids = {}
+    for meta, section in read_sections(path):
+        if meta['section'] != 'ids':
+            break
+        ids[meta['table']] = set(_unpack_ids(section.read()))
+    return ids
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    return sorted(glob.glob(os.path.join(directory, '*.snap')))
+
+
+def _resolve(name, directory):
+    if os.path.exists(name):
+        return name
+    path = os.path.join(directory, name if name.endswith('.snap') else f'{name}.snap')
+    if not os.path.exists(path):
+        raise SnapshotError(f'Snapshot {name} not found in {directory}')
+    return path
+
+
+def snapshot_chain(path):
+    """[full, incremental, ...] paths needed to restore the snapshot at `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    chain = [path]
+    seen = {os.path.abspath(path)}
+    header = read_header(path)
+    while header.get('parent'):
+        parent = _resolve(header['parent'], directory)
+        if os.path.abspath(parent) in seen:
+            raise SnapshotError(f'Snapshot chain of {path} loops at {header["parent"]}')
+        seen.add(os.path.abspath(parent))
+        chain.append(parent)
+        header = read_header(parent)
+    return chain[::-1]
+
+
+# --- sources -----------------------------------------------------------
+
+class _SqliteSource:
+    """Reads from an online backup copy, so the live file is never read half-written."""
+
+    def __init__(self, url):
+        path = make_url(url).database
+        if not path or path == ':memory:' or not os.path.exists(path):
+            raise SnapshotError(f'No SQLite database at {path}')
+        fd, self._copy = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        live, copy = sqlite3.connect(path), sqlite3.connect(self._copy)
+        try:
+            live.backup(copy)
+        finally:
+            live.close()
+            copy.close()
+        self.engine = create_engine(f'sqlite:///{self._copy}')
+        self._conn = self.engine.connect()
+        self.dialect = 'sqlite'
+        self.format = 'json'
+
+    def table_exists(self, table):
+        return inspect(self._conn).has_table(table.name)
+
+    def ids(self, table):
+        pk = _pk(table)
+        return [i for (i,) in self._conn.execute(select(pk).order_by(pk))]
+
+    def max_value(self, column):
+        return self._conn.execute(select(func.max(column))).scalar()
+
+    def ids_since(self, column, since):
+        pk = _pk(column.table)
+        return {i for (i,) in self._conn.execute(select(pk).where(column >= since))}
+
+    def copy_rows(self, table, ids, out):
+        """Write rows (all when `ids` is None) to `out` as JSON lines; returns the row count."""
+        def write(result):
+            n = 0
+            for row in result:
+                out.write(json.dumps([_encode(v) for v in row], ensure_ascii=False,
+                                     separators=(',', ':')).encode('utf-8') + b'\n')
+                n += 1
+            return n
+
+        if ids is None:
+            return write(self._conn.execution_options(yield_per=INSERT_BATCH).execute(select(table)))
+        pk = _pk(table)
+        return sum(write(self._conn.execute(select(table).where(pk.in_(chunk)).order_by(pk)))
+                   for chunk in _chunks(sorted(ids), ID_CHUNK))
+
+    def close(self):
+        self._conn.close()
+        self.engine.dispose()
+        os.remove(self._copy)
+
+
+class _PostgresSource:
+    """Reads everything inside one REPEATABLE READ, READ ONLY transaction."""
+
+    def __init__(self, url):
+        self.engine = create_engine(url)
+        self._raw = self.engine.raw_connection()
+        self._cur = self._raw.cursor()
+        self._cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        self._quote = self.engine.dialect.identifier_preparer.quote
+        self.dialect = 'postgresql'
+        self.format = 'pgcsv'
+
+    def table_exists(self, table):
+        self._cur.execute('SELECT to_regclass(%s) IS NOT NULL', (self._quote(table.name),))
+        return self._cur.fetchone()[0]
+
+    def ids(self, table):
+        pk = self._quote(_pk(table).name)
+        self._cur.execute(f'SELECT {pk} FROM {self._quote(table.name)} ORDER BY {pk}')
+        return [i for (i,) in self._cur.fetchall()]
+
+    def max_value(self, column):
+        self._cur.execute(f'SELECT max({self._quote(column.name)}) FROM {self._quote(column.table.name)}')
+        return self._cur.fetchone()[0]
+
+    def ids_since(self, column, since):
+        table = column.table
+        self._cur.execute(f'SELECT {self._quote(_pk(table).name)} FROM {self._quote(table.name)} '
+                          f'WHERE {self._quote(column.name)} >= %s', (since,))
+        return {i for (i,) in self._cur.fetchall()}
+
+    def copy_rows(self, table, ids, out):
+        columns = ', '.join(self._quote(c.name) for c in table.columns)
+        query = f'SELECT {columns} FROM {self._quote(table.name)}'
+        if ids is not None:
+            query = self._cur.mogrify(query + f' WHERE {self._quote(_pk(table).name)} = ANY(%s)',
+                                      (sorted(ids),)).decode('utf-8')
+        self._cur.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv)', out)
+        return self._cur.rowcount if self._cur.rowcount >= 0 else None
+
+    def close(self):
+        self._raw.rollback()
+        self._raw.close()
+        self.engine.dispose()
+
+
+def _open_source(url):
+    if url.startswith('sqlite'):
+        return _SqliteSource(url)
+    if url.startswith('postgres'):
+        return _PostgresSource(url)
+    raise SnapshotError(f'Unsupported database: {make_url(url).get_backend_name()}')
+
+
+# --- create ------------------------------------------------------------
+
+def create_snapshot(database_url=None, directory=SNAPSHOT_DIR, full=False):
+    """Write a snapshot (incremental when `directory` has one already); returns (path, header)."""
+    os.makedirs(directory, exist_ok=True)
+    existing = list_snapshots(directory)
+    parent_path = existing[-1] if existing and not full else None
+    parent = read_header(parent_path) if parent_path else None
+    previous_ids = _snapshot_ids(parent_path) if parent_path else {}
+
+    started = time.perf_counter()
+    source = _open_source(database_url or default_database_url())
+    try:
+        tables = [t for t in snapshot_tables() if source.table_exists(t)]
+        ids = {t.name: source.ids(t) for t in tables}
+        watermarks = dict(parent['watermarks']) if parent else {}
+        changed = {}
+        for table in tables:
+            marker = CHANGE_COLUMNS.get(table.name)
+            if parent is None or marker is None or table.name not in previous_ids:
+                changed[table.name] = None
+            else:
+                since = watermarks.get(table.name)
+                rows = source.ids_since(table.c[marker], datetime.fromisoformat(since)) if since else set()
+                changed[table.name] = rows | (set(ids[table.name]) - previous_ids[table.name])
+            if marker is not None:
+                newest = source.max_value(table.c[marker])
+                if newest is not None:
+                    watermarks[table.name] = (newest - SNAPSHOT_CLOCK_SKEW).isoformat()
+
+        kind = 'incremental' if parent else 'full'
+        # microseconds keep ids unique and in creation order
+        snapshot_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')}-{kind}"
+        header = {
+            'format': FORMAT, 'version': FORMAT_VERSION, 'id': snapshot_id, 'kind': kind,
+            'parent': parent['id'] if parent else None, 'dialect': source.dialect,
+            'created_at': datetime.utcnow().isoformat(), 'watermarks': watermarks,
+            'counts': {name: len(values) for name, values in ids.items()},
+            'changed': {name: (len(ids[name]) if rows is None else len(rows)) for name, rows in changed.items()},
+        }
+        writer = _Writer(os.path.join(directory, f'{snapshot_id}.snap'), header)
+        try:
+            for table in tables:
+                writer.section({'section': 'ids', 'table': table.name}, _pack_ids(ids[table.name]))
+            for table in tables:
+                rows = changed[table.name]
+                if parent is not None and rows is not None:
+                    gone = previous_ids[table.name] - set(ids[table.name])
+                    writer.section({'section': 'deleted', 'table': table.name}, _pack_ids(gone))
+                    writer.section({'section': 'changed', 'table': table.name}, _pack_ids(rows))
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as out:
+                    count = source.copy_rows(table, rows, out)
+                    if count is None:
+                        count = header['changed'][table.name]
+                    writer.section({'section': 'rows', 'table': table.name, 'format': source.format,
+                                    'columns': [c.name for c in table.columns], 'rows': count,
+                                    'replace': parent is not None and rows is None}, out)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+    finally:
+        source.close()
+    header['took_s'] = round(time.perf_counter() - started, 3)
+    return writer.path, header
+
+
+# --- restore -----------------------------------------------------------
+
+def _prepare_target(engine, replace):
+    inspector = inspect(engine)
+    present = [t for t in db.metadata.sorted_tables if inspector.has_table(t.name)]
+    if present and not replace:
+        with engine.connect() as conn:
+            if any(conn.execute(select(func.count()).select_from(t)).scalar() for t in present):
+                raise SnapshotError('Target database is not empty; use --replace to overwrite it')
+    db.metadata.drop_all(engine, tables=present)
+
+
+def _load_rows(conn, table, meta, section, dialect):
+    columns = [table.c[name] for name in meta['columns']]
+    if meta['format'] == 'pgcsv':
+        if dialect != 'postgresql':
+            raise SnapshotError(f'{table.name}: COPY data can only be restored into Postgres')
+        quote = conn.dialect.identifier_preparer.quote
+        cursor = conn.connection.cursor()
+        cursor.copy_expert(f'COPY {quote(table.name)} ({", ".join(quote(c.name) for c in columns)}) '
+                           f'FROM STDIN WITH (FORMAT csv)', section)
+        return meta['rows']
+    decoders = [(c.key, _decoder(c)) for c in columns]
+    batch = []
+    for line in section:
+        values = json.loads(line)
+        batch.append({key: (decode(v) if decode and v is not None else v)
+                      for (key, decode), v in zip(decoders, values)})
+        if len(batch) >= INSERT_BATCH:
+            conn.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(table.insert(), batch)
+    return meta['rows']
+
+
+def _delete_ids(conn, table, ids):
+    pk = _pk(table)
+    for chunk in _chunks(sorted(ids), ID_CHUNK):
+        conn.execute(table.delete().where(pk.in_(chunk)))
+
+
+def _fast_sqlite_load(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.execute('PRAGMA journal_mode=MEMORY')
+    cursor.close()
+
+
+def restore_snapshot(path, database_url=None, replace=False):
+    """Restore the snapshot at `path` (with its chain); returns {'snapshots', 'rows', 'took_s'}."""
+    chain = snapshot_chain(path)
+    url = database_url or default_database_url()
+    engine = create_engine(url)
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        event.listen(engine, 'connect', _fast_sqlite_load)
+    started = time.perf_counter()
+    _prepare_target(engine, replace)
+
+    tables = {t.name: t for t in snapshot_tables()}
+    defer_fks = dialect != 'sqlite'
+    loaded = {}
+    with engine.begin() as conn:
+        # bare tables first; indexes (and on Postgres foreign keys) once the rows are in
+        for table in tables.values():
+            conn.execute(CreateTable(table, include_foreign_key_constraints=[] if defer_fks else None))
+        for snapshot in chain:
+            for meta, section in read_sections(snapshot):
+                table = tables.get(meta.get('table'))
+                if table is None or meta['section'] == 'ids':
+                    continue
+                if meta['section'] in ('deleted', 'changed'):
+                    _delete_ids(conn, table, _unpack_ids(section.read()))
+                elif meta['section'] == 'rows':
+                    if meta.get('replace'):
+                        conn.execute(table.delete())
+                    loaded[table.name] = loaded.get(table.name, 0) + _load_rows(conn, table, meta, section, dialect)
+        for table in tables.values():
+            for index in table.indexes:
+                index.create(conn)
+            if defer_fks:
+                for constraint in table.foreign_key_constraints:
+                    conn.execute(AddConstraint(constraint))
+        if dialect == 'postgresql':
+            quote = conn.dialect.identifier_preparer.quote
+            for table in tables.values():
+                pk = _pk(table)
+                if pk.autoincrement is True or (pk.autoincrement == 'auto' and pk.type.python_type is int):
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence(:name, :column), "
+                        f"COALESCE((SELECT max({quote(pk.name)}) FROM {quote(table.name)}), 0) + 1, false)"
+                    ), {'name': quote(table.name), 'column': pk.name})
+    # derived tables stay empty; the app backfills them at startup
+    db.metadata.create_all(engine, tables=[t for t in db.metadata.sorted_tables if t.name in SKIP_TABLES])
+    engine.dispose()
+    return {'snapshots': [os.path.basename(p) for p in chain], 'rows': loaded,
+            'took_s': round(time.perf_counter() - started, 3)}
+
+
+# --- CLI ---------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='take a snapshot (incremental if the directory has one)')
+    create.add_argument('--full', action='store_true', help='start a new chain with a full snapshot')
+    create.add_argument('--dir', default=SNAPSHOT_DIR)
+    create.add_argument('--database', help='database URL (default: DATABASE_URL or database/app.db)')
+    listing = commands.add_parser('list', help='list snapshots')
+    listing.add_argument('--dir', default=SNAPSHOT_DIR)
+    restore = commands.add_parser('restore', help='restore a snapshot and the chain it is based on')
+    restore.add_argument('snapshot', help='snapshot file or id')
+    restore.add_argument('--dir', default=SNAPSHOT_DIR)
+    restore.add_argument('--database', help='target database URL (default: DATABASE_URL or database/app.db)')
+    restore.add_argument('--replace', action='store_true', help='drop existing tables in the target first')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'create':
+            path, header = create_snapshot(args.database, args.dir, full=args.full)
+            print(f"{header['kind']} snapshot {path} ({os.path.getsize(path)} bytes, {header['took_s']}s)")
+            for name, count in header['counts'].items():
+                print(f"  {name}: {count} rows, {header['changed'][name]} written")
+        elif args.command == 'list':
+            for path in list_snapshots(args.dir):
+                header = read_header(path)
+                rows = sum(header['counts'].values())
+                print(f"{header['id']}  {header['dialect']:<10} parent={header['parent'] or '-'}  "
+                      f"{rows} rows  {os.path.getsize(path)} bytes")
+        else:
+            result = restore_snapshot(_resolve(args.snapshot, args.dir), args.database, replace=args.replace)
+            print(f"restored {' -> '.join(result['snapshots'])} in {result['took_s']}s")
+            for name, count in result['rows'].items():
+                print(f"  {name}: {count} rows loaded")
+    except SnapshotError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Static asset pipeline for the single-page frontend.
+
+At startup every file under the static folder is read once into a
+manifest, so requests never touch the filesystem. Each asset gets:
+
+* a content-hash fingerprinted alias (`favicon.3f2a9c1d0b.ico`) served with
+  `Cache-Control: public, max-age=31536000, immutable`; `index.html` is
+  rewritten to reference those aliases,
+* gzip (and brotli, when the `brotli` package is installed) variants,
+  precompressed once and picked per request from Accept-Encoding,
+* a strong ETag, so `index.html` and unfingerprinted paths revalidate with
+  a cheap 304 instead of re-sending the body.
+
+Unknown paths fall back to `index.html` for client-side routing.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+INDEX = 'index.html'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# unfingerprinted URLs (e.g. /favicon.ico requested by the browser itself)
+SHORT_LIVED = 'public, max-age=3600'
+REVALIDATE = 'no-cache'
+COMPRESSIBLE_PREFIXES = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                         'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+MIN_COMPRESS_SIZE = 256
+
+
+class StaticAsset:
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = digest[:20]
+        root, ext = os.path.splitext(name)
+        self.fingerprinted = f'{root}.{digest[:10]}{ext}'
+        self.variants = {}  # encoding -> bytes
+        self._compress()
+
+    def _compress(self):
+        if len(self.body) < MIN_COMPRESS_SIZE or not self.mimetype.startswith(COMPRESSIBLE_PREFIXES):
+            return
+        candidates = {'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(self.body, quality=11)
+        for encoding, data in candidates.items():
+            # only keep variants that actually save bytes
+            if len(data) < len(self.body) * 0.9:
+                self.variants[encoding] = data
+
+
+def _accepted_encodings(header):
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def choose_encoding(available, header, preference=('br', 'zstd', 'gzip')):
+    """Pick the first encoding of `preference` that is in `available` and accepted, or None."""
+    accepted = _accepted_encodings(header)
+    for encoding in preference:
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def build_manifest(static_folder):
+    """Read and fingerprint every static file; returns {url path: (asset, cache_control)}."""
+    assets = {}
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            full = os.path.join(root, filename)
+            name = os.path.relpath(full, static_folder).replace(os.sep, '/')
+            with open(full, 'rb') as f:
+                assets[name] = StaticAsset(name, f.read())
+
+    index = assets.get(INDEX)
+    if index is not None and index.mimetype == 'text/html':
+        html = index.body.decode('utf-8')
+        for name, asset in assets.items():
+            if name != INDEX:
+                html = html.replace(f'"/{name}"', f'"/{asset.fingerprinted}"')
+        assets[INDEX] = StaticAsset(INDEX, html.encode('utf-8'))
+
+    manifest = {}
+    for name, asset in assets.items():
+        if name == INDEX:
+            manifest[name] = (asset, REVALIDATE)
+            continue
+        manifest[name] = (asset, SHORT_LIVED)
+        manifest[asset.fingerprinted] = (asset, IMMUTABLE)
+    return manifest
+
+
+def asset_response(asset, cache_control):
+    encoding = choose_encoding(asset.variants, request.headers.get('Accept-Encoding'))
+    etag = asset.etag if encoding is None else f'{asset.etag}-{encoding}'
+    headers = {'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    body = asset.body if encoding is None else asset.variants[encoding]
+    response = Response(body, mimetype=asset.mimetype, headers=headers)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
+
+
+def register_static_routes(app):
+    """Build the manifest for `app.static_folder` and add the catch-all route."""
+    static_folder_path = app.static_folder
+    manifest = {}
+    if static_folder_path is not None and os.path.isdir(static_folder_path):
+        manifest = build_manifest(static_folder_path)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        if static_folder_path is None:
+            return "Static folder not configured", 404
+
+        entry = manifest.get(path) if path != "" else None
+        if entry is None:
+            entry = manifest.get(INDEX)
+            if entry is None:
+                return "index.html not found", 404
+        return asset_response(*entry)
+
+    return manifest
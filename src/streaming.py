@@ -0,0 +1,223 @@
+"""Streamed and compressed JSON responses for large listings.
+
+`stream_json_list()` turns a row iterator (normally `keyset_pages()`, so
+rows are read a page at a time) into a response that is produced
+row by row, as a JSON array or, when the client asks for
+`application/x-ndjson` / `?format=ndjson`, one JSON object per line.
+Rows are buffered only up to COMPRESS_MIN_SIZE: if the whole result fits,
+it goes out as a plain response; otherwise it is streamed and compressed
+on the fly with the best encoding the client accepts (br, zstd or gzip).
+Peak memory per request is therefore bounded by the buffer size, not by
+the size of the result.
+
+`init_compression()` compresses ordinary JSON responses above the same
+threshold, which covers cached listings and everything else.
+"""
+import json
+import os
+import zlib
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import and_, or_
+
+from src.models.user import db
+from src.static_assets import choose_encoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+STREAM_CHUNK_SIZE = 16 * 1024
+YIELD_PER = 200
+NDJSON = 'application/x-ndjson'
+
+
+def available_encodings():
+    encodings = {'gzip'}
+    if brotli is not None:
+        encodings.add('br')
+    if zstandard is not None:
+        encodings.add('zstd')
+    return encodings
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=5)
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def finish(self):
+        return self._obj.finish() if self.encoding == 'br' else self._obj.flush()
+
+
+def compress_bytes(data, encoding):
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def wants_ndjson():
+    return request.args.get('format') == 'ndjson' or NDJSON in request.headers.get('Accept', '')
+
+
+def _json_chunks(rows, serialize, envelope, ndjson):
+    """Yield encoded pieces of the response body, one row at a time."""
+    count = 0
+    if ndjson:
+        for row in rows:
+            yield (dumps(serialize(row)) + '\n').encode('utf-8')
+        return
+    if envelope is not None:
+        head = dumps(envelope)[:-1]
+        yield (head + (',' if len(envelope) else '') + '"notes":[').encode('utf-8')
+    else:
+        yield b'['
+    for row in rows:
+        yield ((',' if count else '') + dumps(serialize(row))).encode('utf-8')
+        count += 1
+    if envelope is not None:
+        yield (f'],"count":{count}}}').encode('utf-8')
+    else:
+        yield b']'
+
+
+def stream_json_list(rows, serialize, envelope=None, on_complete=None, collect_limit=0):
+    """Build a response for `rows`, streaming and compressing large results.
+
+    `envelope` wraps the list as {...envelope, "notes": [...], "count": n}.
+    When `on_complete` is given, up to `collect_limit` serialized rows are
+    collected and passed to it once the full result has been produced
+    (e.g. to fill a cache); larger results pass None.
+    """
+    ndjson = wants_ndjson()
+    mimetype = NDJSON if ndjson else 'application/json'
+    collected = [] if on_complete is not None else None
+
+    def serialize_and_collect(row):
+        item = serialize(row)
+        if collected is not None and len(collected) <= collect_limit:
+            collected.append(item)
+        return item
+
+    def done():
+        if on_complete is not None:
+            on_complete(collected if len(collected) <= collect_limit else None)
+
+    chunks = _json_chunks(rows, serialize_and_collect, envelope, ndjson)
+
+    # Buffer up to the compression threshold; small results go out in one piece
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= COMPRESS_MIN_SIZE:
+            break
+    else:
+        done()
+        return Response(b''.join(buffered), mimetype=mimetype)
+
+    encoding = choose_encoding(available_encodings(), request.headers.get('Accept-Encoding'))
+
+    def generate():
+        compressor = _Compressor(encoding) if encoding else None
+        pending = list(buffered)
+        pending_size = size
+        for chunk in chunks:
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= STREAM_CHUNK_SIZE:
+                data = b''.join(pending)
+                pending, pending_size = [], 0
+                yield compressor.compress(data) if compressor else data
+        data = b''.join(pending)
+        if compressor:
+            yield compressor.compress(data) + compressor.finish()
+        elif data:
+            yield data
+        done()
+
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _after(order, values):
+    """Filter for rows that come after the row with key `values` in `order`."""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*[c == v for (c, _), v in zip(order[:i], values)], beyond))
+    return or_(*clauses)
+
+
+def keyset_pages(query, order, page_size=YIELD_PER):
+    """Yield the rows of `query` in `order`, reading `page_size` rows per statement.
+
+    `order` is a sequence of (column, descending) pairs whose last column is
+    unique (the id), e.g. `((Note.updated_at, True), (Note.id, True))`; none
+    of them may be NULL. Each page starts after the last row of the one
+    before, and the session's transaction is ended between pages, so a
+    large or slowly read stream holds neither a transaction nor a pooled
+    connection while the client reads. Pages are separate snapshots: a row
+    that changes mid-stream may move past the cursor and be left out.
+    """
+    ordered = query.order_by(None).order_by(*[c.desc() if d else c.asc() for c, d in order])
+    last = None
+    while True:
+        page = ordered if last is None else ordered.filter(_after(order, last))
+        rows = page.limit(page_size).all()
+        if rows:
+            last = [getattr(rows[-1], column.key) for column, _ in order]
+        yield from rows
+        # nothing to commit; just give the connection back until the next page
+        db.session.rollback()
+        if len(rows) < page_size:
+            return
+
+
+def stream_query(query, serialize, order, **kwargs):
+    """stream_json_list() over a query, read in keyset pages (see `keyset_pages()`)."""
+    return stream_json_list(keyset_pages(query, order), serialize, **kwargs)
+
+
+def init_compression(app):
+    """Compress buffered JSON responses above COMPRESS_MIN_SIZE."""
+    @app.after_request
+    def compress_json_response(response):
+        if (response.direct_passthrough or response.is_streamed or
+                response.status_code < 200 or response.status_code >= 300 or
+                'Content-Encoding' in response.headers or
+                response.mimetype not in ('application/json', NDJSON)):
+            return response
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        response.headers.add('Vary', 'Accept-Encoding')
+        encoding = choose_encoding(available_encodings(), request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        response.set_data(compress_bytes(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
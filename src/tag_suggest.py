@@ -0,0 +1,263 @@
+"""Local tag suggestions without an LLM round trip.
+
+For each user we keep corpus statistics over their notes: document
+frequencies of tokens, how often each token appears in notes carrying a
+given tag, and tag co-occurrence counts. Suggesting tags for a new text is
+then a TF-IDF weighted vote: every token of the text votes for the tags it
+has been seen with, weighted by idf(token) * P(token | tag). Tags that
+literally occur in the text get a bonus, and tags that usually co-occur
+with the best match get a smaller one.
+
+Tokens are lower-cased Latin words and CJK character bigrams (after the
+same normalisation as fuzzy search, so traditional and simplified forms
+agree). Statistics are loaded lazily per user, updated incrementally by
+mapper events on note writes, and rebuilt after STATS_MAX_AGE seconds so
+writes made by other worker processes are picked up eventually. The
+mapper events only queue their change on the session; it is applied once
+the transaction commits, so a rolled back write never shows up.
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import partial
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from src.models.note import Note
+from src.search_index import normalize, text_runs
+
+STATS_MAX_AGE = float(os.environ.get('TAG_STATS_MAX_AGE', '3600'))
+MAX_USERS = int(os.environ.get('TAG_STATS_MAX_USERS', '256'))
+DEFAULT_LIMIT = 3
+# tokens found in more than this share of notes carry no signal
+MAX_DF_RATIO = 0.5
+LITERAL_BONUS = 1.0
+COOCCURRENCE_WEIGHT = 0.3
+# session.info key of the changes waiting for the transaction to commit
+PENDING_KEY = 'tag_stats_pending'
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have', 'i',
+    'in', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or', 'our', 'so', 'that', 'the', 'this',
+    'to', 'was', 'we', 'will', 'with', 'you', 'your', 'today', 'tomorrow',
+    '今天', '明天', '我们', '一个', '可以', '需要', '然后', '已经', '没有', '什么', '这个', '那个',
+}
+
+
+def tokenize(value):
+    """Return a Counter of tokens for `value`."""
+    tokens = Counter()
+    for kind, run in text_runs(normalize(value)):
+        if kind == 'cjk':
+            if len(run) == 1:
+                tokens[run] += 1
+            for i in range(len(run) - 1):
+                tokens[run[i:i + 2]] += 1
+        elif len(run) > 1 and not run.isdigit():
+            tokens[run] += 1
+    for stop in STOPWORDS.intersection(tokens):
+        del tokens[stop]
+    return tokens
+
+
+def _note_terms(title, content):
+    return set(tokenize(title)) | set(tokenize(content))
+
+
+def _clean_tags(tags):
+    return {t.strip() for t in tags if isinstance(t, str) and t.strip()}
+
+
+class CorpusStats:
+    def __init__(self):
+        self.n_docs = 0
+        self.df = Counter()            # token -> notes containing it
+        self.tag_docs = Counter()      # tag -> notes carrying it
+        self.token_tags = {}           # token -> Counter(tag -> notes with both)
+        self.cooccur = {}              # tag -> Counter(other tag -> notes with both)
+        self.loaded_at = time.monotonic()
+
+    def _apply(self, terms, tags, sign):
+        self.n_docs += sign
+        for term in terms:
+            self.df[term] += sign
+            if tags:
+                bucket = self.token_tags.setdefault(term, Counter())
+                for tag in tags:
+                    bucket[tag] += sign
+                    if bucket[tag] <= 0:
+                        del bucket[tag]
+                if not bucket:
+                    del self.token_tags[term]
+            if self.df[term] <= 0:
+                del self.df[term]
+        for tag in tags:
+            self.tag_docs[tag] += sign
+            if self.tag_docs[tag] <= 0:
+                del self.tag_docs[tag]
+            others = self.cooccur.setdefault(tag, Counter())
+            for other in tags:
+                if other != tag:
+                    others[other] += sign
+                    if others[other] <= 0:
+                        del others[other]
+            if not others:
+                del self.cooccur[tag]
+
+    def add(self, terms, tags):
+        self._apply(terms, _clean_tags(tags), 1)
+
+    def remove(self, terms, tags):
+        self._apply(terms, _clean_tags(tags), -1)
+
+    def suggest(self, value, limit=DEFAULT_LIMIT, exclude=()):
+        if not self.tag_docs:
+            return []
+        tokens = tokenize(value)
+        scores = Counter()
+        n = max(self.n_docs, 1)
+        for token, tf in tokens.items():
+            df = self.df.get(token, 0)
+            if not df or (n >= 10 and df / n > MAX_DF_RATIO):
+                continue
+            idf = math.log((n + 1) / (df + 1)) + 1
+            weight = (1 + math.log(tf)) * idf
+            for tag, together in self.token_tags.get(token, {}).items():
+                scores[tag] += weight * together / self.tag_docs[tag]
+
+        for tag in self.tag_docs:
+            # whole tokens only, so "work" is not found in "workout"
+            tag_tokens = tokenize(tag).keys()
+            if tag_tokens and tag_tokens <= tokens.keys():
+                scores[tag] += LITERAL_BONUS * (max(scores.values()) if scores else 1)
+
+        excluded = {t.lower() for t in exclude}
+        ranked = [(tag, s) for tag, s in scores.most_common() if s > 0 and tag.lower() not in excluded]
+        if not ranked:
+            return []
+        best_tag, best_score = ranked[0]
+        related = self.cooccur.get(best_tag, {})
+        if related:
+            boosted = Counter(dict(ranked))
+            for tag, together in related.items():
+                if tag.lower() not in excluded:
+                    boosted[tag] += COOCCURRENCE_WEIGHT * best_score * together / self.tag_docs[best_tag]
+            ranked = boosted.most_common()
+        top = ranked[0][1]
+        return [{'tag': tag, 'score': round(s / top, 3)} for tag, s in ranked[:limit]]
+
+
+class TagSuggester:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = OrderedDict()  # user_id -> CorpusStats
+
+    def _load(self, user_id):
+        stats = CorpusStats()
+        query = Note.owned_by(user_id).with_entities(Note.title, Note.content, Note.tags).yield_per(500)
+        for title, content, raw_tags in query:
+            stats.add(_note_terms(title, content), Note.parse_tags(raw_tags))
+        return stats
+
+    def stats_for(self, user_id, load=True):
+        """Return the CorpusStats of `user_id`, loading it (needs an app context) if allowed."""
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is not None and time.monotonic() - stats.loaded_at < STATS_MAX_AGE:
+                self._users.move_to_end(user_id)
+                return stats
+        if not load:
+            return stats
+        fresh = self._load(user_id)
+        with self._lock:
+            self._users[user_id] = fresh
+            self._users.move_to_end(user_id)
+            while len(self._users) > MAX_USERS:
+                self._users.popitem(last=False)
+        return fresh
+
+    def suggest(self, value, user_id=None, limit=DEFAULT_LIMIT, exclude=(), load=True):
+        stats = self.stats_for(user_id, load=load)
+        if stats is None:
+            return []
+        with self._lock:
+            return stats.suggest(value, limit=limit, exclude=exclude)
+
+    def suggest_names(self, value, user_id=None, limit=DEFAULT_LIMIT, load=True):
+        return [s['tag'] for s in self.suggest(value, user_id, limit=limit, load=load)]
+
+    def _loaded(self, user_id):
+        return self._users.get(user_id)
+
+    def note_added(self, user_id, title, content, tags):
+        with self._lock:
+            stats = self._loaded(user_id)
+            if stats is not None:
+                stats.add(_note_terms(title, content), tags)
+
+    def note_removed(self, user_id, title, content, tags):
+        with self._lock:
+            stats = self._loaded(user_id)
+            if stats is not None:
+                stats.remove(_note_terms(title, content), tags)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+tag_suggester = TagSuggester()
+
+
+def _previous(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, name)
+
+
+def _on_commit(target, func, *args):
+    session = object_session(target)
+    if session is None:
+        func(*args)
+    else:
+        session.info.setdefault(PENDING_KEY, []).append(partial(func, *args))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    for change in session.info.pop(PENDING_KEY, ()):
+        change()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+@event.listens_for(Note, 'after_insert')
+def _track_inserted_note(mapper, connection, target):
+    _on_commit(target, tag_suggester.note_added, target.user_id, target.title, target.content, target.get_tags())
+
+
+@event.listens_for(Note, 'after_update')
+def _track_updated_note(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in ('title', 'content', 'tags', 'user_id')):
+        return
+    old_user = _previous(state, 'user_id')
+    if old_user != target.user_id:
+        _on_commit(target, tag_suggester.forget, old_user)
+        _on_commit(target, tag_suggester.forget, target.user_id)
+        return
+    _on_commit(target, tag_suggester.note_removed, target.user_id, _previous(state, 'title'),
+               _previous(state, 'content'), Note.parse_tags(_previous(state, 'tags')))
+    _on_commit(target, tag_suggester.note_added, target.user_id, target.title, target.content, target.get_tags())
+
+
+@event.listens_for(Note, 'after_delete')
+def _track_deleted_note(mapper, connection, target):
+    _on_commit(target, tag_suggester.note_removed, target.user_id, target.title, target.content, target.get_tags())
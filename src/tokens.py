@@ -0,0 +1,187 @@
+"""Local token counting and per-endpoint input budgets for LLM calls.
+
+Counts are estimates (one token per CJK character, one per four other
+characters), close enough to catch oversized prompts before they are sent
+and billed. Set TOKEN_COUNTER=tiktoken to count with tiktoken instead
+when it is installed.
+
+Each LLM endpoint has a TokenBudget for the user-supplied part of its
+prompt. Input over the budget is handled by the endpoint's overflow
+strategy:
+
+* `chunk` splits the text on paragraph, then sentence boundaries into
+  pieces that each fit (at most `max_chunks` of them),
+* `truncate` keeps the beginning and the end of the text,
+* `reject` raises TokenBudgetError.
+"""
+import os
+import re
+
+TOKEN_COUNTER = os.environ.get('TOKEN_COUNTER', 'estimate')
+# role and separator tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = '\n…\n'
+
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[.!?;。！？；])\s*')
+
+_encoding = {'loaded': False, 'value': None}
+
+
+class TokenBudgetError(ValueError):
+    """Raised when input exceeds its token budget and cannot be chunked or truncated."""
+
+
+def _tiktoken_encoding():
+    if not _encoding['loaded']:
+        _encoding['loaded'] = True
+        try:
+            import tiktoken
+            _encoding['value'] = tiktoken.get_encoding(os.environ.get('TIKTOKEN_ENCODING', 'o200k_base'))
+        except Exception as e:
+            print(f"[WARN] tiktoken unavailable, estimating token counts instead: {e}")
+    return _encoding['value']
+
+
+def estimate_tokens(text):
+    """Rough token count: one per CJK character, one per four other characters."""
+    if TOKEN_COUNTER == 'tiktoken':
+        encoding = _tiktoken_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages):
+    """Estimated prompt tokens of a list of chat messages."""
+    return sum(estimate_tokens(m.get('content') or '') + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def _fits(text, max_tokens, reverse=False):
+    """Length of the longest prefix (or suffix) of `text` estimated at no more than `max_tokens`."""
+    budget = max_tokens * 4
+    chars = reversed(text) if reverse else text
+    length = 0
+    for ch in chars:
+        budget -= 4 if ord(ch) >= 0x2E80 else 1
+        if budget < 0:
+            break
+        length += 1
+    return length
+
+
+def truncate_text(text, max_tokens):
+    """Keep about two thirds of `max_tokens` from the start of `text` and the rest from its end."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    head_budget = max(1, (max_tokens * 2) // 3)
+    head = text[:_fits(text, head_budget)]
+    tail_length = _fits(text, max(0, max_tokens - head_budget - 1), reverse=True)
+    tail = text[len(text) - tail_length:] if tail_length else ''
+    # don't cut words in half where there are spaces to cut at
+    space = head.rfind(' ')
+    if space > len(head) // 2:
+        head = head[:space]
+    space = tail.find(' ')
+    if 0 <= space < len(tail) // 2:
+        tail = tail[space + 1:]
+    return head.rstrip() + TRUNCATION_MARKER + tail.lstrip()
+
+
+def _pieces(text, pattern):
+    """Split `text` after every match of `pattern`, keeping the separators."""
+    pieces, start = [], 0
+    for match in pattern.finditer(text):
+        if match.end() > start and match.end() < len(text):
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    return pieces
+
+
+def _split_piece(piece, max_tokens):
+    if estimate_tokens(piece) <= max_tokens:
+        return [piece]
+    sentences = _pieces(piece, _SENTENCE_RE)
+    if len(sentences) > 1:
+        return [part for sentence in sentences for part in _split_piece(sentence, max_tokens)]
+    parts = []
+    while piece:
+        length = max(1, _fits(piece, max_tokens))
+        if length < len(piece):
+            space = piece.rfind(' ', 0, length)
+            if space > length // 2:
+                length = space + 1
+        parts.append(piece[:length])
+        piece = piece[length:]
+    return parts
+
+
+def split_text(text, max_tokens):
+    """Split `text` into chunks of at most `max_tokens` whose concatenation is `text`.
+
+    Chunks end on paragraph breaks where possible, then on sentence ends,
+    and only as a last resort on spaces or in the middle of a word.
+    """
+    chunks, current, cost = [], '', 0
+    for paragraph in _pieces(text, _PARAGRAPH_RE):
+        for piece in _split_piece(paragraph, max_tokens):
+            piece_cost = estimate_tokens(piece)
+            if current and cost + piece_cost > max_tokens:
+                chunks.append(current)
+                current, cost = '', 0
+            current += piece
+            cost += piece_cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBudget:
+    OVERFLOWS = ('chunk', 'truncate', 'reject')
+
+    def __init__(self, endpoint, max_input_tokens, overflow='truncate', max_chunks=1):
+        if overflow not in self.OVERFLOWS:
+            raise ValueError(f"Unknown overflow strategy for {endpoint}: {overflow}")
+        self.endpoint = endpoint
+        self.max_input_tokens = max_input_tokens
+        self.overflow = overflow
+        self.max_chunks = max_chunks
+
+    def fit(self, text):
+        """Return (pieces, action): the text to send, in one or more requests.
+
+        `action` is None when `text` fits, otherwise 'chunked' or
+        'truncated'. Raises TokenBudgetError for `reject`, or when chunking
+        would take more than `max_chunks` requests.
+        """
+        tokens = estimate_tokens(text)
+        if self.max_input_tokens <= 0 or tokens <= self.max_input_tokens:
+            return [text], None
+        if self.overflow == 'truncate':
+            return [truncate_text(text, self.max_input_tokens)], 'truncated'
+        if self.overflow == 'chunk':
+            chunks = split_text(text, self.max_input_tokens)
+            if len(chunks) <= self.max_chunks:
+                return chunks, 'chunked'
+        raise TokenBudgetError(f"Input of about {tokens} tokens exceeds the {self.endpoint} budget "
+                               f"of {self.max_input_tokens} tokens")
+
+    def to_dict(self):
+        return {'max_input_tokens': self.max_input_tokens, 'overflow': self.overflow,
+                'max_chunks': self.max_chunks}
+
+
+# note extraction needs the whole input in one request, so it can only truncate or reject
+notes_budget = TokenBudget(
+    'notes',
+    int(os.environ.get('LLM_NOTES_MAX_INPUT_TOKENS', '2000')),
+    os.environ.get('LLM_NOTES_OVERFLOW', 'truncate'),
+)
+translate_budget = TokenBudget(
+    'translate',
+    int(os.environ.get('LLM_TRANSLATE_MAX_INPUT_TOKENS', '2000')),
+    os.environ.get('LLM_TRANSLATE_OVERFLOW', 'chunk'),
+    max_chunks=int(os.environ.get('LLM_TRANSLATE_MAX_CHUNKS', '16')),
+)
@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Settings are read at import time, so they must be in place before `src` is imported.
+TEST_DIR = tempfile.mkdtemp(prefix='notetaker-tests-')
+DB_PATH = os.path.join(TEST_DIR, 'app.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ['GITHUB_TOKEN'] = 'test-token'
+# nothing listens here, so accidental LLM calls fail fast
+os.environ['GITHUB_MODELS_ENDPOINT'] = 'http://127.0.0.1:9'
+os.environ['ADMIN_TOKEN'] = 'test-admin'
+os.environ['SECRET_KEY'] = 'test-secret'
+os.environ['SLOW_QUERY_MS'] = '500'
+os.environ['SNAPSHOT_DIR'] = os.path.join(TEST_DIR, 'snapshots')
+os.environ.pop('DATABASE_READ_URL', None)
+os.environ.pop('OPENAI_API_KEY', None)
+
+ADMIN_HEADERS = {'X-Admin-Token': 'test-admin'}
+
+
+@pytest.fixture(scope='session')
+def app():
+    from src.main import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
@@ -0,0 +1,59 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+from flask import g
+from sqlalchemy import create_engine
+
+from conftest import DB_PATH
+from src.archive import archive_cold_notes
+from src.db_routing import REPLICA_BIND
+from src.models.note import Note
+from src.models.note_archive import NoteArchive
+from src.models.user import db
+
+
+def _age(app, note_id, days):
+    with app.app_context():
+        db.session.execute(Note.__table__.update().where(Note.__table__.c.id == note_id)
+                           .values(updated_at=datetime.utcnow() - timedelta(days=days)))
+        db.session.commit()
+        moved = archive_cold_notes(days=days - 1)
+        assert moved >= 1
+        assert db.session.get(NoteArchive, note_id) is not None
+
+
+def test_rehydrated_notes_are_not_archived_again(app, client):
+    note_id = client.post('/api/notes', json={'title': 'cold', 'content': 'old'}).get_json()['id']
+    _age(app, note_id, 400)
+
+    body = client.get(f'/api/notes/{note_id}').get_json()
+    assert body['content'] == 'old'
+    assert datetime.fromisoformat(body['updated_at']) > datetime.utcnow() - timedelta(minutes=1)
+    with app.app_context():
+        archive_cold_notes(days=399)
+        assert db.session.get(Note, note_id) is not None
+        assert db.session.get(NoteArchive, note_id) is None
+
+
+def test_rehydrating_on_a_replica_read_uses_the_primary(app, client, tmp_path, monkeypatch):
+    note_id = client.post('/api/notes', json={'title': 'cold', 'content': 'old'}).get_json()['id']
+    _age(app, note_id, 400)
+    # the replica stops replaying here, with the first archived copy
+    replica_path = tmp_path / 'replica.db'
+    source, copy = sqlite3.connect(DB_PATH), sqlite3.connect(replica_path)
+    source.backup(copy)
+    source.close()
+    copy.close()
+    client.get(f'/api/notes/{note_id}')
+    assert client.put(f'/api/notes/{note_id}', json={'content': 'new'}).status_code == 200
+    _age(app, note_id, 400)
+
+    replica = create_engine(f'sqlite:///{replica_path}')
+    with app.app_context():
+        monkeypatch.setitem(db.engines, REPLICA_BIND, replica)
+        with app.test_request_context(f'/api/notes/{note_id}'):
+            g.db_read_replica = True
+            assert app.view_functions['note.get_note'](note_id).get_json()['content'] == 'new'
+            db.session.remove()
+    replica.dispose()
+    assert client.get(f'/api/notes/{note_id}').get_json()['content'] == 'new'
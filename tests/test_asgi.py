@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from mock_llm_server import MockConfig, start_mock_server  # noqa: E402
+from src import async_llm  # noqa: E402
+from src.asgi import app as asgi_app  # noqa: E402
+from src.circuit_breaker import llm_breaker  # noqa: E402
+from src.tokens import TokenBudget  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def mock_llm():
+    return start_mock_server(MockConfig(latency='fixed:0.01'))
+
+
+@pytest.fixture
+def upstream(mock_llm, monkeypatch):
+    port, stats = mock_llm
+    monkeypatch.setenv('GITHUB_MODELS_ENDPOINT', f'http://127.0.0.1:{port}')
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._outcomes.clear()
+    return stats
+
+
+def _run(*requests):
+    """Send (method, path, kwargs) requests to the ASGI app concurrently; returns the responses."""
+    async def main():
+        transport = httpx.ASGITransport(app=asgi_app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://app') as client:
+                return await asyncio.gather(*(client.request(method, path, **kwargs)
+                                              for method, path, kwargs in requests))
+        finally:
+            await async_llm.aclose()
+    return asyncio.run(main())
+
+
+def test_translate_runs_on_the_loop_concurrently(upstream):
+    before = upstream.snapshot()['ok']
+    responses = _run(*[('POST', '/api/translate', {'json': {'text': f'text {i}', 'lang': 'fr'}}) for i in range(20)])
+    assert [r.json()['translation'] for r in responses] == [f'[fr] text {i}' for i in range(20)]
+    assert upstream.snapshot()['ok'] - before == 20
+
+
+def test_long_texts_are_translated_in_order(upstream, monkeypatch):
+    monkeypatch.setattr('src.llm.translate_budget', TokenBudget('translate', 15, 'chunk', max_chunks=16))
+    text = '\n\n'.join(f'Paragraph {i} is here.' for i in range(5))
+    (response,) = _run(('POST', '/api/translate', {'json': {'text': text, 'lang': 'fr'}}))
+    translation = response.json()['translation']
+    # the mock prefixes each chunk it translates
+    assert translation.count('[fr] ') > 1
+    assert translation.replace('[fr] ', '') == text
+
+
+def test_generate_notes_and_auth(upstream):
+    ok, unauthorized = _run(
+        ('POST', '/api/generate-notes', {'json': {'user_input': 'Dentist tomorrow at 14:00', 'language': 'English'}}),
+        ('POST', '/api/generate-notes', {'json': {'user_input': 'x'}, 'headers': {'Authorization': 'Bearer bogus'}}),
+    )
+    assert ok.status_code == 200
+    assert ok.json()['event_time'].startswith('14:00')
+    assert unauthorized.status_code == 401
+
+
+def test_other_routes_fall_through_to_flask(upstream):
+    (created,) = _run(('POST', '/api/notes', {'json': {'title': 'asgi', 'content': 'via wsgi'}}))
+    assert created.status_code == 201
+    (fetched,) = _run(('GET', f"/api/notes/{created.json()['id']}", {}))
+    assert fetched.json()['content'] == 'via wsgi'
@@ -0,0 +1,140 @@
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+import src.auth as auth
+from conftest import ADMIN_HEADERS
+from src.models.schema import ensure_schema, foreign_key_ddl
+
+
+def _user(client, name):
+    response = client.post('/api/users', json={'username': name, 'email': f'{name}@example.com'})
+    assert response.status_code == 201
+    body = response.get_json()
+    return body['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def test_notes_are_scoped_by_a_verified_token(client):
+    alice, alice_auth = _user(client, 'auth-alice')
+    bob, bob_auth = _user(client, 'auth-bob')
+    note_id = client.post('/api/notes', json={'title': 'private', 'content': 'x'}, headers=alice_auth).get_json()['id']
+
+    assert client.get(f'/api/notes/{note_id}', headers=alice_auth).status_code == 200
+    assert client.get(f'/api/notes/{note_id}', headers=bob_auth).status_code == 404
+    assert note_id not in [n['id'] for n in client.get('/api/notes', headers=bob_auth).get_json()]
+    assert client.get(f'/api/notes/{note_id}', query_string={'token': alice_auth['Authorization'][7:]}).status_code == 200
+
+
+def test_forged_tokens_and_bare_user_ids_are_rejected(client):
+    alice, _ = _user(client, 'auth-carol')
+    forged = auth._serializer('not the secret').dumps(alice)
+    assert client.get('/api/notes', headers={'Authorization': f'Bearer {forged}'}).status_code == 401
+    assert client.get('/api/notes', headers={'X-User-Id': str(alice)}).status_code == 401
+    assert client.get('/api/notes', query_string={'user_id': alice}).status_code == 401
+
+
+def test_user_id_header_only_with_a_trusted_proxy(client, monkeypatch):
+    alice, alice_auth = _user(client, 'auth-dave')
+    client.post('/api/notes', json={'title': 'proxied', 'content': 'x'}, headers=alice_auth)
+    monkeypatch.setattr(auth, 'TRUST_USER_ID_HEADER', True)
+    notes = client.get('/api/notes', headers={'X-User-Id': str(alice)}).get_json()
+    assert [n['title'] for n in notes] == ['proxied']
+
+
+def test_other_users_tag_statistics_need_their_token_or_admin(client):
+    alice, alice_auth = _user(client, 'auth-erin')
+    _, bob_auth = _user(client, 'auth-frank')
+    path = f'/api/users/{alice}/tags/statistics'
+    assert client.get(path, headers=bob_auth).status_code == 403
+    assert client.get(path, headers=alice_auth).status_code == 200
+    assert client.get(path, headers=ADMIN_HEADERS).status_code == 200
+
+
+def test_admin_issues_tokens_for_existing_users(client):
+    alice, _ = _user(client, 'auth-grace')
+    token = client.post(f'/api/admin/users/{alice}/token', headers=ADMIN_HEADERS).get_json()['token']
+    assert client.get('/api/notes', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+    assert client.post('/api/admin/users/999999/token', headers=ADMIN_HEADERS).status_code == 404
+
+
+def test_ensure_schema_quotes_identifiers(app_context):
+    from src.models.user import db
+    statements = []
+    column = db.Column('nickname', db.String(40), nullable=True)
+    user_table = db.metadata.tables['user']
+    user_table.append_column(column)
+    try:
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            ensure_schema()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    finally:
+        user_table._columns.remove(column)
+    quote = db.engine.dialect.identifier_preparer.quote
+    assert f'ALTER TABLE {quote("user")} ADD COLUMN nickname VARCHAR(40)' in statements
+    assert postgresql.dialect().identifier_preparer.quote('user') == '"user"'
+
+
+def test_ensure_schema_adds_the_note_owner_foreign_key_on_postgres(app_context):
+    from src.models.user import db
+    (constraint,) = db.metadata.tables['note'].foreign_key_constraints
+    ddl, name = foreign_key_ddl(constraint, postgresql.dialect())
+    assert name == 'fk_note_user_id'
+    assert ddl == ('ALTER TABLE note ADD CONSTRAINT fk_note_user_id FOREIGN KEY (user_id) '
+                   'REFERENCES "user" (id) NOT VALID')
+
+
+def test_invalid_tokens_are_401_on_every_write_endpoint(client):
+    bogus = {'Authorization': 'Bearer bogus'}
+    assert client.post('/api/notes', json={'title': 't', 'content': 'c'}, headers=bogus).status_code == 401
+    assert client.put('/api/notes/1', json={'content': 'c'}, headers=bogus).status_code == 401
+    assert client.delete('/api/notes/1', headers=bogus).status_code == 401
+    assert client.patch('/api/notes/1', json={'base_version': 1}, headers=bogus).status_code == 401
+    assert client.get('/api/tags/search/work', headers=bogus).status_code == 401
+    assert client.get('/api/tags/statistics', headers=bogus).status_code == 401
+    assert client.put('/api/notes/987654', json={'content': 'c'}).status_code == 404
+
+
+def test_users_are_changed_and_deleted_only_by_themselves_or_admin(client):
+    alice, alice_auth = _user(client, 'auth-heidi')
+    _, bob_auth = _user(client, 'auth-ivan')
+    client.post('/api/notes', json={'title': 'kept', 'content': 'x'}, headers=alice_auth)
+    assert client.delete(f'/api/users/{alice}').status_code == 403
+    assert client.delete(f'/api/users/{alice}', headers=bob_auth).status_code == 403
+    assert client.put(f'/api/users/{alice}', json={'username': 'taken'}, headers=bob_auth).status_code == 403
+    assert [n['title'] for n in client.get('/api/notes', headers=alice_auth).get_json()] == ['kept']
+
+    assert client.put(f'/api/users/{alice}', json={'username': 'auth-heidi2'}, headers=alice_auth).status_code == 200
+    assert client.put(f'/api/users/{alice}', json={'username': 'auth-heidi3'}, headers=ADMIN_HEADERS).status_code == 200
+    assert client.delete(f'/api/users/{alice}', headers=alice_auth).status_code == 204
+
+
+def test_tokens_of_a_deleted_user_do_not_carry_over_to_a_reused_id(client):
+    alice, alice_auth = _user(client, 'auth-judy')
+    assert client.delete(f'/api/users/{alice}', headers=ADMIN_HEADERS).status_code == 204
+    mallory, mallory_auth = _user(client, 'auth-mallory')
+    assert mallory == alice  # SQLite hands out the freed id again
+    client.post('/api/notes', json={'title': 'mine', 'content': 'x'}, headers=mallory_auth)
+    assert client.get('/api/notes', headers=alice_auth).status_code == 401
+    assert client.get('/api/notes', headers=mallory_auth).status_code == 200
+
+
+def test_admin_revokes_a_users_tokens(client):
+    alice, alice_auth = _user(client, 'auth-niaj')
+    assert client.delete(f'/api/admin/users/{alice}/token').status_code == 403
+    assert client.delete(f'/api/admin/users/{alice}/token', headers=ADMIN_HEADERS).status_code == 204
+    assert client.get('/api/notes', headers=alice_auth).status_code == 401
+    token = client.post(f'/api/admin/users/{alice}/token', headers=ADMIN_HEADERS).get_json()['token']
+    assert client.get('/api/notes', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+
+def test_no_tokens_without_a_secret_key(app, client, monkeypatch):
+    alice, alice_auth = _user(client, 'auth-olivia')
+    monkeypatch.setattr(app, 'secret_key', None)
+    response = client.post('/api/users', json={'username': 'auth-peggy', 'email': 'auth-peggy@example.com'})
+    assert response.status_code == 503
+    assert 'SECRET_KEY' in response.get_json()['error']
+    assert 'auth-peggy' not in [u['username'] for u in client.get('/api/users').get_json()]
+    assert client.get('/api/notes', headers=alice_auth).status_code == 401
+    assert client.post(f'/api/admin/users/{alice}/token', headers=ADMIN_HEADERS).status_code == 503
@@ -0,0 +1,90 @@
+import functools
+import re
+
+import pytest
+
+from src import batch_translate
+from src.batch_translate import pack_tasks, parse_batch_response, translate_batch
+from src.circuit_breaker import CircuitOpenError
+
+
+class FakeLLM:
+    """Answers batch prompts task by task; `refuse` texts make the breaker reject the call."""
+
+    def __init__(self, refuse=()):
+        self.refuse = refuse
+        self.batches = []
+        self.singles = []
+
+    def call(self, model, messages, **kwargs):
+        prompt = messages[-1]['content']
+        if any(text in prompt for text in self.refuse):
+            raise CircuitOpenError("Circuit 'llm' is open; skipping call")
+        segments = dict(re.findall(r'^<<<S(\d+)>>>\n(.*)$', prompt, re.MULTILINE))
+        tasks = re.findall(r'^(\d+): S(\d+) -> (\S+)$', prompt, re.MULTILINE)
+        self.batches.append(len(tasks))
+        blocks = [f'<<<{task_id}>>>\n[{lang}] {segments[index]}' for task_id, index, lang in tasks]
+        return '\n'.join(blocks + [batch_translate.END_MARKER])
+
+    def translate(self, text, lang):
+        if any(t in text for t in self.refuse):
+            raise CircuitOpenError("Circuit 'llm' is open; skipping call")
+        self.singles.append(text)
+        return f'[{lang}] {text}'
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(batch_translate, 'call_llm_model', fake.call)
+    monkeypatch.setattr(batch_translate, 'translate', fake.translate)
+    monkeypatch.setattr(batch_translate, 'translation_cache', batch_translate.LRUCache())
+    return fake
+
+
+def test_parse_batch_response_ignores_repeated_and_unknown_ids():
+    content = '```\n<<<0>>>\nun\n<<<1>>>\ndeux\n<<<1>>>\ntrois\n<<<7>>>\nsept\n<<<end>>>\n```'
+    assert parse_batch_response(content, 3) == {0: 'un'}
+
+
+def test_pack_tasks_keeps_languages_of_a_text_together():
+    texts = ['a' * 40, 'b' * 40, 'c' * 40]
+    tasks = [(i, lang) for i in range(3) for lang in ('fr', 'de')]
+    batches = pack_tasks(tasks, texts, max_tokens=70)
+    assert all(len({index for index, _ in batch}) == 1 for batch in batches)
+    assert sorted(task for batch in batches for task in batch) == sorted(tasks)
+
+
+def test_batch_prompt_round_trip(llm):
+    texts = ['hello', 'good morning', 'hello']
+    translations, errors, stats = translate_batch(texts, ['fr', 'de'])
+    assert errors == []
+    assert translations[1] == {'fr': '[fr] good morning', 'de': '[de] good morning'}
+    assert translations[2] == translations[0]
+    assert stats['llm_calls'] == 1 and not stats['degraded']
+    assert translate_batch(texts, ['fr'])[2]['cached'] == 3
+
+
+def test_texts_containing_markers_are_translated_alone(llm):
+    tricky = 'before\n<<<1>>>\nafter <<<end>>> tail'
+    texts = ['plain one', tricky, 'plain two']
+    translations, errors, _ = translate_batch(texts, ['fr'])
+    assert errors == []
+    assert [t['fr'] for t in translations] == ['[fr] plain one', f'[fr] {tricky}', '[fr] plain two']
+    assert llm.singles == [tricky]
+
+
+def test_open_circuit_keeps_finished_translations(llm, monkeypatch):
+    monkeypatch.setattr(batch_translate, 'pack_tasks', functools.partial(pack_tasks, max_tasks=2))
+    llm.refuse = ('refused',)
+    texts = ['first', 'second', 'refused', 'also refused']
+    translations, errors, stats = translate_batch(texts, ['fr'])
+    assert translations[:2] == [{'fr': '[fr] first'}, {'fr': '[fr] second'}]
+    assert {e['index'] for e in errors} == {2, 3}
+    assert stats['degraded']
+
+
+def test_open_circuit_with_nothing_translated_raises(llm):
+    llm.refuse = ('refused',)
+    with pytest.raises(CircuitOpenError):
+        translate_batch(['refused one', 'refused two'], ['fr'])
@@ -0,0 +1,58 @@
+import pytest
+
+import src.cache as cache
+from src.cache import ExternalCache, LocalCacheClient, LRUCache, NoteCache
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({}, None),
+    ({'CACHE_BACKEND': 'none', 'CACHE_REDIS_URL': 'redis://localhost:1/0'}, None),
+    ({'CACHE_BACKEND': 'lru'}, LRUCache),
+    ({'CACHE_BACKEND': 'local'}, ExternalCache),
+])
+def test_backend_selection(monkeypatch, env, expected):
+    for name in ('CACHE_BACKEND', 'CACHE_REDIS_URL'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    backend, ttl = cache._create_backend()
+    if expected is None:
+        assert backend is None
+    else:
+        assert isinstance(backend, expected)
+    if expected is LRUCache:
+        assert ttl <= cache.LRU_TTL
+
+
+def test_writes_invalidate_every_worker_sharing_a_backend():
+    client = LocalCacheClient()
+    worker_a, worker_b = NoteCache(ExternalCache(client)), NoteCache(ExternalCache(client))
+    key, _ = worker_a.lookup(7, 'list')
+    worker_a.store(key, ['old'])
+    assert worker_b.lookup(7, 'list')[1] == ['old']
+    worker_b.invalidate_user(7)
+    assert worker_a.lookup(7, 'list')[1] is None
+
+
+def test_evicted_version_key_never_reuses_an_old_version():
+    backend = LRUCache(max_entries=100)
+    notes = NoteCache(backend)
+    seen = set()
+    for _ in range(3):
+        key, value = notes.lookup(1, 'list')
+        assert value is None and key not in seen
+        seen.add(key)
+        notes.store(key, ['stale'])
+        del backend._data['ver:u1']  # evicted, while the entries it versioned are still there
+        notes.invalidate_user(1)
+
+
+def test_get_or_load_only_loads_on_a_miss():
+    notes = NoteCache(LRUCache())
+    calls = []
+    load = lambda: calls.append(1) or {'n': len(calls)}
+    assert notes.get_or_load(3, 'note:1', load) == {'n': 1}
+    assert notes.get_or_load(3, 'note:1', load) == {'n': 1}
+    notes.invalidate_user(3)
+    assert notes.get_or_load(3, 'note:1', load) == {'n': 2}
+    assert notes.stats()['hits'] == 1
@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import call_llm_model, circuit_breaker
+from src.call_llm_model import LLM_LATENCY_BUDGET
+from src.circuit_breaker import CircuitBreaker, CircuitOpenError, llm_breaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_slow_threshold_is_below_the_latency_budget():
+    assert llm_breaker.slow_threshold('notes') < LLM_LATENCY_BUDGET
+
+
+def test_calls_within_the_budget_can_trip_it_as_slow(clock):
+    slow = llm_breaker.slow_threshold('notes')
+    breaker = CircuitBreaker('test', slow_call_durations={'notes': slow}, minimum_calls=5)
+    for _ in range(5):
+        breaker.record(True, (slow + LLM_LATENCY_BUDGET) / 2, 'notes')
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'never')
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = CircuitBreaker('test', minimum_calls=2, reset_timeout=30)
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == breaker.OPEN
+    clock[0] += 30
+    assert breaker.state == breaker.HALF_OPEN
+    with pytest.raises(ValueError):
+        breaker.call(lambda: (_ for _ in ()).throw(ValueError('still down')))
+    assert breaker.state == breaker.OPEN
+    clock[0] += 30
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == breaker.CLOSED
+
+
+def test_translations_are_not_slow_at_the_notes_threshold(clock):
+    breaker = CircuitBreaker('test', slow_call_duration=llm_breaker.slow_call_duration,
+                             slow_call_durations=llm_breaker.slow_call_durations, minimum_calls=5)
+    # well within the translation timeout, but past the notes budget
+    for _ in range(5):
+        breaker.record(True, LLM_LATENCY_BUDGET + 1, 'translate')
+        breaker.record(True, LLM_LATENCY_BUDGET + 1, 'translate_batch')
+    assert breaker.state == breaker.CLOSED
+    for _ in range(20):
+        breaker.record(True, LLM_LATENCY_BUDGET - 0.5, 'notes')
+    assert breaker.state == breaker.OPEN
+
+
+@pytest.fixture
+def closed_breaker():
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._outcomes.clear()
+
+
+def test_notes_calls_queued_past_their_budget_are_dropped(closed_breaker, monkeypatch):
+    calls = []
+    monkeypatch.setattr(call_llm_model, 'call_llm_model', lambda *args, **kwargs: calls.append(args))
+    executor = ThreadPoolExecutor(max_workers=1)
+    busy = threading.Event()
+    executor.submit(busy.wait, 5)
+    monkeypatch.setattr(call_llm_model, '_llm_executor', executor)
+    try:
+        result = call_llm_model.process_user_notes('English', 'note', latency_budget=0.05)
+    finally:
+        busy.set()
+        executor.shutdown(wait=True)
+    assert 'latency budget' in result['degraded_reason']
+    assert calls == []
+
+
+def test_notes_calls_beyond_the_queue_get_the_fallback(closed_breaker, monkeypatch):
+    monkeypatch.setattr(call_llm_model, '_llm_slots', threading.BoundedSemaphore(1))
+    call_llm_model._llm_slots.acquire()
+    result = call_llm_model.process_user_notes('English', 'note')
+    assert result['degraded_reason'] == 'LLM queue full'
@@ -0,0 +1,52 @@
+import sqlite3
+
+from flask import g
+from sqlalchemy import create_engine
+
+from conftest import DB_PATH
+from src.cache import LRUCache, note_cache
+from src.db_routing import REPLICA_BIND, served_from_replica
+from src.models.user import db
+
+
+def _copy_database(target):
+    source = sqlite3.connect(DB_PATH)
+    copy = sqlite3.connect(target)
+    source.backup(copy)
+    source.close()
+    copy.close()
+
+
+def test_replica_reads_are_not_cached(app, client, monkeypatch, tmp_path):
+    backend = LRUCache()
+    monkeypatch.setattr(note_cache, 'backend', backend)
+    note_id = client.post('/api/notes', json={'title': 'routing', 'content': 'v1'}).get_json()['id']
+
+    # a replica that has not yet replayed the next write
+    replica_path = tmp_path / 'replica.db'
+    _copy_database(str(replica_path))
+    assert client.put(f'/api/notes/{note_id}', json={'content': 'v2'}).status_code == 200
+
+    replica = create_engine(f'sqlite:///{replica_path}')
+    with app.app_context():
+        monkeypatch.setitem(db.engines, REPLICA_BIND, replica)
+        with app.test_request_context(f'/api/notes/{note_id}'):
+            g.db_read_replica = True
+            response = app.view_functions['note.get_note'](note_id)
+            assert response.get_json()['content'] == 'v1'
+            assert served_from_replica()
+            db.session.remove()
+    replica.dispose()
+
+    assert len(backend) <= 1  # at most the user's version key
+    assert client.get(f'/api/notes/{note_id}').get_json()['content'] == 'v2'
+
+
+def test_primary_reads_are_cached(client, monkeypatch):
+    backend = LRUCache()
+    monkeypatch.setattr(note_cache, 'backend', backend)
+    note_id = client.post('/api/notes', json={'title': 'cached', 'content': 'body'}).get_json()['id']
+    client.get(f'/api/notes/{note_id}')
+    hits = note_cache.stats()['hits']
+    assert client.get(f'/api/notes/{note_id}').get_json()['content'] == 'body'
+    assert note_cache.stats()['hits'] == hits + 1
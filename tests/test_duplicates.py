@@ -0,0 +1,45 @@
+from src import duplicates
+from src.duplicates import cluster_duplicates, hamming, note_simhash
+
+
+def _token(client, name):
+    body = client.post('/api/users', json={'username': name, 'email': f'{name}@example.com'}).get_json()
+    return body['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def test_near_duplicates_are_close():
+    agenda = ('Discuss the release plan for the mobile app, the open bugs in the sync engine, hiring for '
+              'the platform team and the budget for the next quarter. Bring the numbers from the last '
+              'review and the draft roadmap. ')
+    a = note_simhash('Weekly sync', agenda)
+    b = note_simhash('Weekly sync', agenda + 'Thanks')
+    c = note_simhash('Groceries', 'Milk, eggs, bread, coffee beans and a bag of oranges')
+    assert hamming(a, b) <= duplicates.MAX_DISTANCE < hamming(a, c)
+
+
+def test_large_groups_of_identical_notes_are_clustered(app, client, monkeypatch):
+    monkeypatch.setattr(duplicates, 'MAX_BUCKET', 3)
+    _, auth = _token(client, 'dup-owner')
+    ids = [client.post('/api/notes', json={'title': 'template', 'content': 'same body'}, headers=auth).get_json()['id']
+           for _ in range(6)]
+    _, other = _token(client, 'dup-other')
+    elsewhere = client.post('/api/notes', json={'title': 'template', 'content': 'same body'}, headers=other).get_json()['id']
+
+    with app.app_context():
+        clusters = cluster_duplicates()
+    mine = next(c for c in clusters if ids[0] in c)
+    assert set(ids) <= set(mine)
+    assert elsewhere not in mine
+
+
+def test_duplicates_endpoint_lists_identical_notes(client):
+    _, auth = _token(client, 'dup-api')
+    first = client.post('/api/notes', json={'title': 'copy', 'content': 'twice'}, headers=auth).get_json()['id']
+    second = client.post('/api/notes', json={'title': 'copy', 'content': 'twice'}, headers=auth).get_json()['id']
+    response = client.get(f'/api/notes/{first}/duplicates', headers=auth)
+    assert response.status_code == 200
+    assert second in [d['id'] for d in response.get_json()['duplicates']]
+    # out-of-range limits are clamped, not used as slice bounds
+    for limit in (-1, 0):
+        response = client.get(f'/api/notes/{first}/duplicates', query_string={'limit': limit}, headers=auth)
+        assert [d['id'] for d in response.get_json()['duplicates']] == [second]
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from src import async_llm, llm
+from src.circuit_breaker import llm_breaker
+from src.llm_usage import usage_meter
+from src.tokens import TokenBudget, TokenBudgetError, estimate_tokens, split_text, truncate_text
+
+PARAGRAPHS = '\n\n'.join(f'Paragraph {i}. It has two sentences, both short.' for i in range(6))
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    monkeypatch.setattr(llm, 'translate_budget', TokenBudget('translate', 15, 'chunk', max_chunks=16))
+
+
+def test_split_text_respects_budget_and_paragraphs():
+    chunks = split_text(PARAGRAPHS, 15)
+    assert ''.join(chunks) == PARAGRAPHS
+    assert all(estimate_tokens(chunk) <= 15 for chunk in chunks)
+    assert all(chunk.startswith('Paragraph') for chunk in chunks)
+
+
+def test_split_text_cuts_long_words_as_a_last_resort():
+    text = 'x' * 100 + ' 中文' * 30
+    chunks = split_text(text, 10)
+    assert ''.join(chunks) == text
+    assert all(estimate_tokens(chunk) <= 10 for chunk in chunks)
+
+
+def test_truncate_and_reject():
+    text = ' '.join(f'word{i}' for i in range(200))
+    short = truncate_text(text, 40)
+    assert short.startswith('word0 ') and short.endswith('word199') and estimate_tokens(short) <= 40
+    with pytest.raises(TokenBudgetError):
+        TokenBudget('test', 10, 'chunk', max_chunks=2).fit(text)
+
+
+def test_chunks_are_translated_concurrently_in_order(chunked, monkeypatch):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fake_piece(text, lang, timeout=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return text.upper()
+
+    monkeypatch.setattr(llm, '_translate_piece', fake_piece)
+    assert llm.translate(PARAGRAPHS, 'fr') == PARAGRAPHS.upper()
+    assert peak[0] > 1
+
+
+def test_chunks_share_one_deadline(chunked, monkeypatch):
+    timeouts = []
+
+    def slow_piece(text, lang, timeout=None):
+        timeouts.append(timeout)
+        time.sleep(0.3)
+        return text
+
+    monkeypatch.setattr(llm, 'default_timeout', lambda: 0.2)
+    monkeypatch.setattr(llm, '_translate_piece', slow_piece)
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match='timed out'):
+        llm.translate(PARAGRAPHS, 'fr')
+    assert time.monotonic() - started < 0.3
+    assert all(0 < t <= 0.2 for t in timeouts)
+
+
+def test_a_failed_chunk_fails_the_text(chunked, monkeypatch):
+    def piece(text, lang, timeout=None):
+        if 'Paragraph 1.' in text:
+            raise RuntimeError('upstream 500')
+        return text
+
+    monkeypatch.setattr(llm, '_translate_piece', piece)
+    with pytest.raises(RuntimeError, match='upstream 500'):
+        llm.translate(PARAGRAPHS, 'fr')
+
+
+def test_async_failure_cancels_sibling_chunks(monkeypatch):
+    monkeypatch.setattr(async_llm, 'fit_translation', lambda text: ['one', 'two', 'three'])
+    cancelled = []
+
+    async def fake_call(model, messages, endpoint='other', **kwargs):
+        text = messages[-1]['content']
+        if text == 'two':
+            raise RuntimeError('upstream 500')
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(text)
+            raise
+        return text
+
+    monkeypatch.setattr(async_llm, 'acall_llm_model', fake_call)
+
+    async def run():
+        with pytest.raises(RuntimeError, match='upstream 500'):
+            await async_llm.atranslate('ignored', 'fr')
+        # before the loop shuts down, which would cancel leftovers anyway
+        return sorted(cancelled)
+
+    assert asyncio.run(run()) == ['one', 'three']
+
+
+def _mock_upstream(monkeypatch, handler):
+    """Route `acall_llm_model` through an httpx MockTransport; returns a coroutine that closes it."""
+    clients = []
+
+    def get_client():
+        if not clients:
+            clients.append(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        return clients[0]
+
+    monkeypatch.setattr(async_llm, '_get_client', get_client)
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._outcomes.clear()
+
+    async def close():
+        for client in clients:
+            await client.aclose()
+    return close
+
+
+def test_cancelled_chunks_are_not_counted_as_failures(monkeypatch):
+    pieces = [f'chunk {i}' for i in range(6)]
+    monkeypatch.setattr(async_llm, 'fit_translation', lambda text: pieces)
+
+    async def handler(request):
+        text = json.loads(request.content)['messages'][-1]['content']
+        if text == 'chunk 3':
+            return httpx.Response(400, text='bad chunk')
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={'choices': [{'message': {'content': text}}]})
+
+    close = _mock_upstream(monkeypatch, handler)
+    errors_before = usage_meter.summary()['endpoints'].get('translate', {}).get('errors', 0)
+
+    async def run():
+        try:
+            with pytest.raises(RuntimeError, match='400'):
+                await async_llm.atranslate('ignored', 'fr')
+        finally:
+            await close()
+
+    asyncio.run(run())
+    assert [ok for ok, _ in llm_breaker._outcomes] == [False]
+    assert usage_meter.summary()['endpoints']['translate']['errors'] - errors_before == 1
+    assert llm_breaker.state == llm_breaker.CLOSED
+
+
+def test_a_cancelled_probe_frees_its_half_open_slot(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={'choices': [{'message': {'content': 'late'}}]})
+
+    close = _mock_upstream(monkeypatch, handler)
+    llm_breaker._state = llm_breaker.HALF_OPEN
+    llm_breaker._half_open_in_flight = 0
+
+    async def run():
+        try:
+            probe = asyncio.ensure_future(async_llm.acall_llm_model('m', [{'role': 'user', 'content': 'x'}]))
+            await asyncio.sleep(0.05)
+            assert not llm_breaker.allow_request()
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+        finally:
+            await close()
+
+    asyncio.run(run())
+    assert llm_breaker.state == llm_breaker.HALF_OPEN
+    assert llm_breaker.allow_request()
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._half_open_in_flight = 0
+
+
+def test_an_expired_latency_budget_counts_as_one_failure(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={'choices': [{'message': {'content': 'late'}}]})
+
+    close = _mock_upstream(monkeypatch, handler)
+
+    async def run():
+        try:
+            return await async_llm.aprocess_user_notes('English', 'some notes', latency_budget=0.05)
+        finally:
+            await close()
+
+    result = asyncio.run(run())
+    assert 'latency budget' in result['degraded_reason']
+    assert [ok for ok, _ in llm_breaker._outcomes] == [False]
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+import pytest
+import requests
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from mock_llm_server import LatencyDistribution, MockConfig, canned_reply, start_mock_server  # noqa: E402
+from src import llm  # noqa: E402
+from src.batch_translate import build_batch_messages, parse_batch_response  # noqa: E402
+from src.call_llm_model import build_note_messages  # noqa: E402
+from src.circuit_breaker import llm_breaker  # noqa: E402
+
+
+@pytest.fixture
+def closed_breaker():
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._outcomes.clear()
+    yield llm_breaker
+    llm_breaker._state = llm_breaker.CLOSED
+    llm_breaker._outcomes.clear()
+
+
+def test_latency_distributions():
+    assert LatencyDistribution('fixed:0.25').sample() == 0.25
+    assert 1 <= LatencyDistribution('uniform:1,2').sample() <= 2
+    with pytest.raises(ValueError):
+        LatencyDistribution('gamma:1')
+
+
+def test_canned_replies_parse_like_real_ones():
+    assert canned_reply(llm.build_translate_messages('hello', 'fr')) == '[fr] hello'
+    texts = ['one', 'two']
+    batch = [(0, 'fr'), (1, 'fr'), (1, 'de')]
+    parsed = parse_batch_response(canned_reply(build_batch_messages(batch, texts)), len(batch))
+    assert parsed == {0: '[fr] one', 1: '[fr] two', 2: '[de] two'}
+    note = json.loads(canned_reply(build_note_messages('English', 'Standup tomorrow at 9:30')))
+    assert note['Event_Time'] == '09:30' and note['Event_Date'] is not None
+
+
+def test_error_injection_and_stats():
+    port, stats = start_mock_server(MockConfig(latency='fixed:0', error_rate=1.0))
+    response = requests.post(f'http://127.0.0.1:{port}/chat/completions',
+                             json={'messages': [{'role': 'user', 'content': 'hi'}]}, timeout=5)
+    assert response.status_code == 500
+    counters = requests.get(f'http://127.0.0.1:{port}/stats', timeout=5).json()
+    assert counters['requests'] == counters['errors'] == stats.snapshot()['errors'] == 1
+
+
+def test_sync_client_round_trip_with_usage(monkeypatch, closed_breaker):
+    port, stats = start_mock_server(MockConfig(latency='fixed:0.01'))
+    url = f'http://127.0.0.1:{port}'
+    monkeypatch.setenv('GITHUB_MODELS_ENDPOINT', url)
+    monkeypatch.setattr(llm, 'ENDPOINT', url)
+    assert llm.translate('good morning', 'de') == '[de] good morning'
+    assert stats.snapshot()['ok'] >= 1
@@ -0,0 +1,137 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.note_events as note_events
+from src.models.note_event import NoteEvent
+from src.models.user import db
+from src.note_events import NoteEventBroadcaster, ThreadSubscription
+
+USER = 4200
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(note_events.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def broadcaster(app_context):
+    broadcaster = NoteEventBroadcaster()
+    broadcaster.reset(db.engine)
+    return broadcaster
+
+
+def _insert(*ids):
+    db.session.execute(NoteEvent.__table__.insert(), [
+        {'id': i, 'user_id': USER, 'note_id': 1, 'kind': 'updated', 'version': 1, 'data': '{}',
+         'created_at': datetime.utcnow()} for i in ids])
+    db.session.commit()
+
+
+def _drain(subscription):
+    ids = []
+    while (event := subscription.get(0)) is not None:
+        ids.append(event.id)
+    return ids
+
+
+def test_all_expired_gaps_are_skipped_in_one_pass(broadcaster, clock):
+    subscription = broadcaster.subscribe(ThreadSubscription(USER))
+    base = broadcaster._cursor
+    _insert(*(base + i for i in (1, 3, 5, 7, 9, 11)))
+    broadcaster.poll(db.engine)
+    assert _drain(subscription) == [base + i for i in (1, 3, 5, 7, 9, 11)]
+    assert broadcaster._cursor == base + 1
+
+    clock.now += note_events.GAP_TIMEOUT + 0.1
+    broadcaster.poll(db.engine)
+    assert broadcaster._cursor == base + 11
+    assert not broadcaster._gaps and not broadcaster._seen
+
+
+def test_late_rows_fill_their_gap(broadcaster, clock):
+    subscription = broadcaster.subscribe(ThreadSubscription(USER))
+    base = broadcaster._cursor
+    _insert(base + 2)
+    broadcaster.poll(db.engine)
+    _insert(base + 1)
+    clock.now += 1
+    broadcaster.poll(db.engine)
+    assert _drain(subscription) == [base + 2, base + 1]
+    assert broadcaster._cursor == base + 2
+
+
+def test_delivery_continues_past_a_full_batch_above_a_gap(broadcaster, clock, monkeypatch):
+    monkeypatch.setattr(note_events, 'POLL_BATCH', 3)
+    subscription = broadcaster.subscribe(ThreadSubscription(USER))
+    base = broadcaster._cursor
+    _insert(*range(base + 2, base + 12))
+    for _ in range(4):
+        broadcaster.poll(db.engine)
+    assert _drain(subscription) == list(range(base + 2, base + 12))
+    assert broadcaster._cursor == base  # still waiting for base + 1
+
+
+def test_poller_starts_at_the_newest_event(app, app_context, monkeypatch):
+    broadcaster = NoteEventBroadcaster()
+    broadcaster.init_app(app)
+    _insert(db.session.query(db.func.max(NoteEvent.id)).scalar() + 1)
+    newest = db.session.query(db.func.max(NoteEvent.id)).scalar()
+    monkeypatch.setattr(broadcaster, '_run', lambda: None)
+    broadcaster.subscribe(ThreadSubscription(USER))
+    assert broadcaster._cursor == newest
+
+
+def test_replay_returns_events_after_last_event_id(app, client):
+    with app.app_context():
+        last = db.session.query(db.func.max(NoteEvent.id)).scalar() or 0
+    note_id = client.post('/api/notes', json={'title': 'stream', 'content': 'x'}).get_json()['id']
+    client.delete(f'/api/notes/{note_id}')
+    with app.app_context():
+        events, reset = note_events.replay(None, last)
+    assert not reset
+    assert [e.frame.split('\n')[1] for e in events] == ['event: created', 'event: deleted']
+
+
+def test_replay_asks_for_reset_when_events_were_pruned(app_context):
+    oldest = db.session.query(db.func.min(NoteEvent.id)).scalar()
+    events, reset = note_events.replay(None, oldest - 2)
+    assert reset and events == []
+
+
+def test_events_store_ids_and_deliver_the_note(app, client):
+    with app.app_context():
+        last = db.session.query(db.func.max(NoteEvent.id)).scalar() or 0
+    note_id = client.post('/api/notes', json={'title': 'slim', 'content': 'a long body'}).get_json()['id']
+    with app.app_context():
+        row = db.session.query(NoteEvent).filter(NoteEvent.id > last).one()
+        assert json.loads(row.data) == {'id': note_id, 'version': row.version}
+        (event,), _ = note_events.replay(None, last)
+    assert json.loads(event.frame.split('data: ', 1)[1])['content'] == 'a long body'
+
+
+def test_writes_prune_old_events_without_subscribers(app, client, monkeypatch):
+    monkeypatch.setattr(note_events, '_pruned_at', [float('-inf')])
+    with app.app_context():
+        stale = datetime.utcnow() - timedelta(seconds=note_events.NOTES_STREAM_RETENTION + 60)
+        newest = db.session.query(db.func.max(NoteEvent.id)).scalar() or 0
+        db.session.execute(NoteEvent.__table__.insert(), [
+            {'id': newest + 1, 'user_id': USER, 'note_id': 1, 'kind': 'updated', 'version': 1, 'data': '{}',
+             'created_at': stale}])
+        db.session.commit()
+    assert note_events.broadcaster.subscriber_count() == 0
+    client.post('/api/notes', json={'title': 'prune', 'content': 'x'})
+    with app.app_context():
+        assert db.session.get(NoteEvent, newest + 1) is None
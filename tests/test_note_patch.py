@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import text
+
+from src.models.user import db
+from src.note_patch import PatchError, apply_text_ops, merge_text, patch_coalescer
+
+
+@pytest.fixture(autouse=True)
+def slow_timer(monkeypatch):
+    # flushes happen only when the test triggers them
+    monkeypatch.setattr(patch_coalescer, 'window', 60)
+
+
+def _create(client, content='The quick brown fox jumps over the lazy dog.'):
+    note = client.post('/api/notes', json={'title': 'patch', 'content': content}).get_json()
+    return note['id'], note['version']
+
+
+def _patch(client, note_id, base_version, **body):
+    return client.patch(f'/api/notes/{note_id}', json=dict(body, base_version=base_version))
+
+
+def _change_elsewhere(app, note_id, content):
+    """An update committed by another worker, which this worker's coalescer cannot see."""
+    with app.app_context():
+        db.session.execute(text('UPDATE note SET content = :c, version = version + 1 WHERE id = :id'),
+                           {'c': content, 'id': note_id})
+        db.session.commit()
+
+
+def test_text_ops_apply_in_order():
+    ops = [{'op': 'insert', 'offset': 5, 'text': ' big'}, {'op': 'delete', 'offset': 0, 'length': 1}]
+    assert apply_text_ops('Hello world', ops) == 'ello big world'
+    with pytest.raises(PatchError):
+        apply_text_ops('short', [{'op': 'delete', 'offset': 3, 'length': 10}])
+    with pytest.raises(PatchError):
+        apply_text_ops('short', [{'op': 'insert', 'offset': True, 'text': 'x'}])
+    with pytest.raises(PatchError):
+        apply_text_ops('short', [{'op': 'delete', 'offset': 0, 'length': True}])
+
+
+def test_merge_text_combines_separate_edits_and_refuses_overlaps():
+    base = 'one two three four'
+    assert merge_text(base, 'ONE two three four', 'one two three FOUR') == 'ONE two three FOUR'
+    assert merge_text(base, 'one TWO three four', 'one twice three four') is None
+    assert merge_text(base, base, 'changed') == 'changed'
+
+
+def test_coalesced_patches_are_written_once_on_read(client):
+    note_id, version = _create(client)
+    for step in range(3):
+        response = _patch(client, note_id, version + step, coalesce=True,
+                          content_ops=[{'op': 'insert', 'offset': 0, 'text': f'{step}'}])
+        assert response.status_code == 202 and response.get_json()['pending']
+    note = client.get(f'/api/notes/{note_id}').get_json()
+    assert note['content'].startswith('210The quick')
+    assert note['version'] == version + 3
+
+
+def test_listing_and_search_flush_pending_patches(client):
+    note_id, version = _create(client, 'listing body')
+    _patch(client, note_id, version, coalesce=True, content='listing body edited')
+    listed = {n['id']: n for n in client.get('/api/notes').get_json()}
+    assert listed[note_id]['content'] == 'listing body edited'
+
+    _patch(client, note_id, version + 1, coalesce=True, content='searchable marker')
+    found = client.get('/api/notes/search', query_string={'q': 'searchable marker'}).get_json()
+    assert [n['id'] for n in found] == [note_id]
+
+
+def test_pending_edits_are_rebased_onto_a_concurrent_change(app, client):
+    note_id, version = _create(client)
+    _patch(client, note_id, version, coalesce=True,
+           content_ops=[{'op': 'insert', 'offset': 0, 'text': 'Today: '}])
+    _change_elsewhere(app, note_id, 'The quick brown fox jumps over the sleeping dog.')
+    note = client.get(f'/api/notes/{note_id}').get_json()
+    assert note['content'] == 'Today: The quick brown fox jumps over the sleeping dog.'
+    assert 'unsaved_changes' not in note
+    assert note['version'] == version + 2
+
+
+def test_conflicting_edits_are_reported_instead_of_dropped(app, client):
+    note_id, version = _create(client)
+    _patch(client, note_id, version, coalesce=True, content='The quick brown cat.')
+    _change_elsewhere(app, note_id, 'The quick brown wolf.')
+
+    note = client.get(f'/api/notes/{note_id}').get_json()
+    assert note['content'] == 'The quick brown wolf.'
+    assert note['unsaved_changes']['changes']['content'] == 'The quick brown cat.'
+
+    response = _patch(client, note_id, version + 1, content='again')
+    assert response.status_code == 409
+    assert response.get_json()['unsaved_changes']['changes']['content'] == 'The quick brown cat.'
+    # reported once; the client can now save on top of the current version
+    assert _patch(client, note_id, version + 1, content='merged by hand').status_code == 200
+
+
+def test_boolean_base_version_is_rejected(client):
+    note_id, _ = _create(client)
+    assert _patch(client, note_id, True, title='bool').status_code == 400
+
+
+def test_coalescing_can_be_turned_off(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PATCH_COALESCE', False)
+    note_id, version = _create(client)
+    response = _patch(client, note_id, version, coalesce=True, title='committed')
+    assert response.status_code == 200 and not response.get_json()['pending']
+    assert note_id not in patch_coalescer._pending
+    _change_elsewhere(app, note_id, 'seen by every worker')
+    assert _patch(client, note_id, version + 2, coalesce=True, title='again').status_code == 200
@@ -0,0 +1,79 @@
+import sys
+from types import SimpleNamespace
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+import src.profiling as profiling
+from conftest import ADMIN_HEADERS
+from src.db_routing import REPLICA_BIND
+from src.profiling import SlowQueryLog, fold_stack, route_slug, slow_query_log
+
+
+class FakeCursor:
+    def __init__(self, log, fail):
+        self.log = log
+        self.fail = fail
+
+    def execute(self, statement, parameters=None):
+        self.log.append(statement)
+        if self.fail and statement.startswith('EXPLAIN'):
+            raise RuntimeError('cannot explain this')
+
+    def fetchall(self):
+        return [('Seq Scan on note',)]
+
+    def close(self):
+        pass
+
+
+def _explain(fail):
+    log = []
+    dbapi = SimpleNamespace(cursor=lambda: FakeCursor(log, fail))
+    conn = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+    plan = SlowQueryLog._explain(conn, SimpleNamespace(connection=dbapi), 'SELECT 1', ())
+    return plan, log
+
+
+def test_failed_explain_is_rolled_back_to_its_savepoint():
+    plan, log = _explain(fail=True)
+    assert plan.startswith('EXPLAIN failed')
+    assert log == ['SAVEPOINT slow_query_explain', 'EXPLAIN SELECT 1', 'ROLLBACK TO SAVEPOINT slow_query_explain']
+
+
+def test_explain_releases_its_savepoint():
+    plan, log = _explain(fail=False)
+    assert plan == 'Seq Scan on note'
+    assert log[-1] == 'RELEASE SAVEPOINT slow_query_explain'
+
+
+def test_slow_queries_are_captured_with_a_plan(client, monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'threshold', 1e-9)
+    client.delete('/api/admin/slow-queries', headers=ADMIN_HEADERS)
+    assert client.get('/api/notes').status_code == 200
+    queries = client.get('/api/admin/slow-queries', headers=ADMIN_HEADERS).get_json()['queries']
+    listing = [q for q in queries if q['route'] == 'GET /api/notes' and 'FROM note' in q['statement']]
+    assert listing and listing[0]['plan']
+
+
+def test_route_slug_and_folded_stacks():
+    assert route_slug('GET', '/api/notes/<int:note_id>') == 'GET_api_notes_int_note_id'
+
+    def inner():
+        return fold_stack(sys._getframe())
+
+    stack = inner().split(';')
+    assert stack[-1] == 'test_profiling.py:inner'
+    assert stack[-2] == 'test_profiling.py:test_route_slug_and_folded_stacks'
+
+
+def test_slow_queries_on_the_replica_are_captured(monkeypatch):
+    primary, replica = create_engine('sqlite://'), create_engine('sqlite://')
+    log = SlowQueryLog(threshold_ms=1e-6, explain=False)
+    monkeypatch.setattr(profiling, 'slow_query_log', log)
+    profiling.init_profiling(Flask('replica-test'), SimpleNamespace(engine=primary, engines={REPLICA_BIND: replica}))
+    for engine in (primary, replica):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+    assert [entry['engine'] for entry in log.entries()] == ['replica', 'primary']
+
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from src import revisions
+from src.models.note import Note
+from src.models.note_revision import NoteRevision
+from src.models.user import db
+from src.revisions import apply_delta, compact_note, make_delta, revision_state
+
+BASE = {'title': 'Plan', 'content': 'The quick brown fox jumps over the lazy dog.', 'tags': 'a',
+        'event_date': None, 'event_time': None}
+
+
+def _note(client, content='v0'):
+    return client.post('/api/notes', json={'title': 'revisions', 'content': content}).get_json()['id']
+
+
+def _edit(client, note_id, *contents):
+    for content in contents:
+        assert client.put(f'/api/notes/{note_id}', json={'content': content}).status_code == 200
+
+
+def _revisions(client, note_id):
+    return client.get(f'/api/notes/{note_id}/revisions', query_string={'limit': 200}).get_json()['revisions']
+
+
+def test_reverse_delta_round_trip():
+    newer = dict(BASE, content='The quick red fox leaps over the lazy dog today.', tags='a,b')
+    delta = make_delta(newer, BASE)
+    assert apply_delta(newer, delta) == BASE
+    assert delta['fields'] == {'tags': 'a'}
+    assert sum(isinstance(op, str) for op in delta['ops']) <= 3
+
+
+def test_every_revision_reads_back_across_keyframes(client, monkeypatch):
+    monkeypatch.setattr(revisions, 'REVISION_KEYFRAME_INTERVAL', 3)
+    note_id = _note(client)
+    contents = [f'v{i} ' + 'word ' * i for i in range(1, 8)]
+    _edit(client, note_id, *contents)
+
+    rows = _revisions(client, note_id)
+    assert [r['version'] for r in rows] == list(range(7, 0, -1))
+    assert any(r['keyframe'] for r in rows) and not all(r['keyframe'] for r in rows)
+    history = ['v0'] + contents[:-1]
+    for row in rows:
+        body = client.get(f"/api/notes/{note_id}/revisions/{row['id']}").get_json()
+        assert body['content'] == history[row['version'] - 1]
+
+
+def test_restore_is_undoable(client):
+    note_id = _note(client, 'first')
+    _edit(client, note_id, 'second')
+    oldest = _revisions(client, note_id)[-1]['id']
+    restored = client.post(f'/api/notes/{note_id}/revisions/{oldest}/restore', json={'base_version': 2})
+    assert restored.status_code == 200 and restored.get_json()['content'] == 'first'
+    assert client.post(f'/api/notes/{note_id}/revisions/{oldest}/restore',
+                       json={'base_version': 2}).status_code == 409
+    newest = _revisions(client, note_id)[0]['id']
+    assert client.get(f'/api/notes/{note_id}/revisions/{newest}').get_json()['content'] == 'second'
+
+
+def test_restore_errors_roll_back_and_answer_json(client, monkeypatch):
+    note_id = _note(client, 'first')
+    _edit(client, note_id, 'second')
+    oldest = _revisions(client, note_id)[-1]['id']
+
+    def broken(note, state):
+        note.content = 'half written'
+        raise ValueError('bad revision data')
+
+    monkeypatch.setattr('src.routes.note.restore_state', broken)
+    response = client.post(f'/api/notes/{note_id}/revisions/{oldest}/restore')
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'bad revision data'}
+    assert client.get(f'/api/notes/{note_id}').get_json()['content'] == 'second'
+    assert client.post(f'/api/notes/999999/revisions/{oldest}/restore').status_code == 404
+
+
+def test_compaction_thins_old_history_and_keeps_it_readable(app, client):
+    note_id = _note(client)
+    _edit(client, note_id, *[f'v{i}' for i in range(1, 7)])
+    # half past, so the two-days-old saves fall into one hour
+    now = datetime.utcnow().replace(minute=30, second=0, microsecond=0)
+    with app.app_context():
+        rows = NoteRevision.query.filter_by(note_id=note_id).order_by(NoteRevision.id).all()
+        # three saves within one hour two days ago, three within another hour today
+        for row, age in zip(rows, (48.5, 48.4, 48.3, 0.3, 0.2, 0.1)):
+            row.saved_at = now - timedelta(hours=age)
+        db.session.commit()
+        note = db.session.get(Note, note_id)
+        assert compact_note(note, now) == (6, 4)
+        db.session.commit()
+        kept = NoteRevision.query.filter_by(note_id=note_id).order_by(NoteRevision.id).all()
+        assert [revision_state(note, r.id)['content'] for r in kept] == ['v2', 'v3', 'v4', 'v5']
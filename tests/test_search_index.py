@@ -0,0 +1,90 @@
+from sqlalchemy.dialects import postgresql
+
+import src.search_index as search_index
+from src.models.note import Note
+from src.models.note_ngram import NoteNgram
+from src.models.user import db
+from src.search_index import backfill_search_text, ngrams, normalize, rebuild_ngram_index
+
+
+def _user(client, name):
+    body = client.post('/api/users', json={'username': name, 'email': f'{name}@example.com'}).get_json()
+    return body['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def _fuzzy(client, auth, q, **params):
+    response = client.get('/api/notes/search', query_string=dict(q=q, mode='fuzzy', **params), headers=auth)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_normalisation_folds_width_case_and_traditional_chinese():
+    assert normalize('ＭＥＥＴＩＮＧ 會議') == 'meeting 会议'
+    assert ngrams('會議') == ngrams('会议') == {'会议'}
+    assert '  m' in ngrams('meeting') and 'ng ' in ngrams('meeting')
+
+
+def test_typos_still_match_and_rank_best_first(client):
+    _, auth = _user(client, 'fuzzy-typos')
+    best = client.post('/api/notes', json={'title': 'Quarterly planning', 'content': 'budget review'},
+                       headers=auth).get_json()['id']
+    client.post('/api/notes', json={'title': 'Planting tomatoes', 'content': 'garden'}, headers=auth)
+    client.post('/api/notes', json={'title': 'Groceries', 'content': 'milk'}, headers=auth)
+
+    results = _fuzzy(client, auth, 'quartely planing')
+    assert results[0]['id'] == best
+    assert all(0 < r['similarity'] <= 1 for r in results)
+    assert 'Groceries' not in [r['title'] for r in results]
+    assert len(_fuzzy(client, auth, 'quartely planing', threshold=1)) == 0
+
+
+def test_traditional_query_finds_simplified_note_of_the_same_user_only(client):
+    _, auth = _user(client, 'fuzzy-cjk')
+    _, other = _user(client, 'fuzzy-cjk-other')
+    mine = client.post('/api/notes', json={'title': '项目会议', 'content': '讨论预算'}, headers=auth).get_json()['id']
+    client.post('/api/notes', json={'title': '项目会议', 'content': '讨论预算'}, headers=other)
+    assert [r['id'] for r in _fuzzy(client, auth, '項目會議')] == [mine]
+
+
+def test_index_follows_edits_and_rebuilds(app, client):
+    _, auth = _user(client, 'fuzzy-edits')
+    note_id = client.post('/api/notes', json={'title': 'alpha', 'content': 'x'}, headers=auth).get_json()['id']
+    client.put(f'/api/notes/{note_id}', json={'title': 'omega'}, headers=auth)
+    assert _fuzzy(client, auth, 'alpha') == []
+    assert [r['id'] for r in _fuzzy(client, auth, 'omega')] == [note_id]
+
+    with app.app_context():
+        before = db.session.query(NoteNgram).filter_by(note_id=note_id).count()
+        rebuild_ngram_index()
+        assert db.session.query(NoteNgram).filter_by(note_id=note_id).count() == before
+    client.delete(f'/api/notes/{note_id}', headers=auth)
+    assert _fuzzy(client, auth, 'omega') == []
+
+
+def test_pg_trgm_compares_the_normalised_query_with_normalised_text(app, client, monkeypatch):
+    monkeypatch.setitem(search_index._backend, 'mode', 'pg_trgm')
+    _, auth = _user(client, 'fuzzy-pg')
+    note_id = client.post('/api/notes', json={'title': '會議', 'content': 'ＲＯＯＭ 5'}, headers=auth).get_json()['id']
+    with app.app_context():
+        assert db.session.get(Note, note_id).search_text == '会议\nroom 5'
+    client.put(f'/api/notes/{note_id}', json={'title': '項目'}, headers=auth)
+    with app.app_context():
+        assert db.session.get(Note, note_id).search_text == '项目\nroom 5'
+        match, score = search_index._pg_match('會議')
+        compiled = match.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    # `%` comes out doubled for the driver's paramstyle
+    assert str(compiled).replace('%%', '%') == "'会议' <% note.search_text"
+
+
+def test_search_text_is_backfilled_after_edits_under_the_ngram_backend(app, client, monkeypatch):
+    _, auth = _user(client, 'fuzzy-backfill')
+    note_id = client.post('/api/notes', json={'title': 'Ｔitle', 'content': '會'}, headers=auth).get_json()['id']
+    with app.app_context():
+        note = db.session.get(Note, note_id)
+        assert note.search_text is None
+        updated_at = note.updated_at
+        assert backfill_search_text(batch_size=2) >= 1
+        db.session.expire_all()
+        note = db.session.get(Note, note_id)
+        assert note.search_text == 'title\n会'
+        assert note.updated_at == updated_at
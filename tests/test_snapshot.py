@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from conftest import DB_PATH
+from src.snapshot import (FORMAT, FORMAT_VERSION, SnapshotError, create_snapshot, read_header,
+                          restore_snapshot, snapshot_chain)
+
+SOURCE = f'sqlite:///{DB_PATH}'
+
+
+def _notes(url):
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT id, title, content FROM note ORDER BY id')).all()
+    engine.dispose()
+    return [tuple(row) for row in rows]
+
+
+def test_incremental_chain_restores_the_current_state(client, tmp_path):
+    directory = str(tmp_path / 'snaps')
+    first = client.post('/api/notes', json={'title': 'snap one', 'content': 'a'}).get_json()['id']
+    second = client.post('/api/notes', json={'title': 'snap two', 'content': 'b'}).get_json()['id']
+    full_path, full = create_snapshot(SOURCE, directory)
+    assert full['kind'] == 'full'
+
+    client.put(f'/api/notes/{first}', json={'content': 'changed'})
+    client.delete(f'/api/notes/{second}')
+    mid_path, mid = create_snapshot(SOURCE, directory)
+    client.post('/api/notes', json={'title': 'snap three', 'content': 'c'})
+    # two incrementals within the same second must not collide
+    last_path, last = create_snapshot(SOURCE, directory)
+
+    assert len({full_path, mid_path, last_path}) == 3
+    assert (mid['parent'], last['parent']) == (full['id'], mid['id'])
+    assert snapshot_chain(last_path) == [full_path, mid_path, last_path]
+
+    target = f"sqlite:///{tmp_path / 'restored.db'}"
+    result = restore_snapshot(last_path, target)
+    assert result['snapshots'] == [os.path.basename(p) for p in (full_path, mid_path, last_path)]
+    assert _notes(target) == _notes(SOURCE)
+
+
+def test_snapshot_chain_detects_loops(tmp_path):
+    path = tmp_path / 'loop.snap'
+    with gzip.open(path, 'wb') as f:
+        f.write(json.dumps({'format': FORMAT, 'version': FORMAT_VERSION, 'id': 'loop',
+                            'parent': 'loop'}).encode() + b'\n')
+    assert read_header(str(path))['parent'] == 'loop'
+    with pytest.raises(SnapshotError):
+        snapshot_chain(str(path))
+
+
+def test_existing_snapshot_is_never_overwritten(tmp_path, monkeypatch):
+    import src.snapshot as snapshot
+    directory = str(tmp_path / 'snaps')
+    path, header = create_snapshot(SOURCE, directory, full=True)
+
+    class FrozenClock(snapshot.datetime):
+        @classmethod
+        def utcnow(cls):
+            return snapshot.datetime.strptime(header['id'].rsplit('-', 1)[0], '%Y%m%dT%H%M%S.%f')
+
+    monkeypatch.setattr(snapshot, 'datetime', FrozenClock)
+    before = os.path.getsize(path)
+    with pytest.raises(SnapshotError):
+        create_snapshot(SOURCE, directory, full=True)
+    assert os.path.getsize(path) == before
+    assert os.listdir(directory) == [os.path.basename(path)]
@@ -0,0 +1,50 @@
+import gzip
+
+from flask import Flask
+
+from src.static_assets import IMMUTABLE, REVALIDATE, SHORT_LIVED, choose_encoding, register_static_routes
+
+SCRIPT = 'console.log("notes");\n' * 40
+
+
+def _client(tmp_path):
+    (tmp_path / 'index.html').write_text('<html><script src="/app.js"></script></html>')
+    (tmp_path / 'app.js').write_text(SCRIPT)
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path='/static-unused')
+    manifest = register_static_routes(app)
+    return app.test_client(), manifest
+
+
+def test_choose_encoding_honours_preference_and_q_values():
+    assert choose_encoding({'gzip', 'br'}, 'gzip, br') == 'br'
+    assert choose_encoding({'gzip', 'br'}, 'br;q=0, gzip') == 'gzip'
+    assert choose_encoding({'gzip'}, '*') == 'gzip'
+    assert choose_encoding({'gzip'}, 'identity') is None
+    assert choose_encoding({'gzip'}, None) is None
+
+
+def test_index_references_fingerprinted_assets(tmp_path):
+    client, manifest = _client(tmp_path)
+    fingerprinted = manifest['app.js'][0].fingerprinted
+    index = client.get('/')
+    assert f'"/{fingerprinted}"' in index.get_data(as_text=True)
+    assert index.headers['Cache-Control'] == REVALIDATE
+    assert client.get(f'/{fingerprinted}').headers['Cache-Control'] == IMMUTABLE
+    assert client.get('/app.js').headers['Cache-Control'] == SHORT_LIVED
+    # unknown paths are client-side routes
+    assert client.get('/notes/42').get_data() == index.get_data()
+
+
+def test_precompressed_variants_and_revalidation(tmp_path):
+    client, manifest = _client(tmp_path)
+    path = '/' + manifest['app.js'][0].fingerprinted
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()).decode() == SCRIPT
+    etag = response.headers['ETag']
+    assert etag.strip('"').endswith('-gzip')
+
+    cached = client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert cached.status_code == 304 and not cached.get_data()
+    plain = client.get(path, headers={'If-None-Match': etag})
+    assert plain.status_code == 200 and plain.get_data(as_text=True) == SCRIPT
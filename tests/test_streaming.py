@@ -0,0 +1,54 @@
+import gzip
+import json
+from datetime import datetime
+
+from sqlalchemy import event
+
+from src import streaming
+from src.models.note import Note
+from src.models.user import db
+from src.streaming import keyset_pages
+
+
+def _user(client, name):
+    body = client.post('/api/users', json={'username': name, 'email': f'{name}@example.com'}).get_json()
+    return body['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def test_keyset_pages_breaks_ties_by_id_and_ends_each_transaction(app, client):
+    user_id, auth = _user(client, 'stream-pages')
+    ids = [client.post('/api/notes', json={'title': f'n{i}', 'content': 'x'}, headers=auth).get_json()['id']
+           for i in range(7)]
+    with app.app_context():
+        table = Note.__table__
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(updated_at=datetime(2024, 1, 1)))
+        db.session.commit()
+
+        seen, ended_after = [], []
+        listener = lambda conn: ended_after.append(len(seen))
+        event.listen(db.engine, 'rollback', listener)
+        try:
+            pages = keyset_pages(Note.owned_by(user_id), ((Note.updated_at, True), (Note.id, True)), page_size=3)
+            for note in pages:
+                seen.append(note.id)
+        finally:
+            event.remove(db.engine, 'rollback', listener)
+    assert seen == sorted(ids, reverse=True)
+    # the connection goes back to the pool after every page
+    assert ended_after == [3, 6, 7]
+
+
+def test_large_listings_stream_compressed_in_order(client, monkeypatch):
+    monkeypatch.setattr(streaming, 'YIELD_PER', 4)
+    _, auth = _user(client, 'stream-list')
+    ids = [client.post('/api/notes', json={'title': f'note {i}', 'content': 'body ' * 40}, headers=auth).get_json()['id']
+           for i in range(10)]
+
+    response = client.get('/api/notes', headers=dict(auth, **{'Accept-Encoding': 'gzip'}))
+    assert response.is_streamed and response.headers['Content-Encoding'] == 'gzip'
+    notes = json.loads(gzip.decompress(response.get_data()))
+    assert [n['id'] for n in notes] == ids[::-1]
+
+    lines = client.get('/api/notes/search', query_string={'q': 'note', 'format': 'ndjson'},
+                       headers=auth).get_data(as_text=True).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == ids[::-1]
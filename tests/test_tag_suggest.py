@@ -0,0 +1,51 @@
+from src.models.note import Note
+from src.models.user import db
+from src.tag_suggest import tag_suggester, tokenize
+
+
+def _user(client, name):
+    body = client.post('/api/users', json={'username': name, 'email': f'{name}@example.com'}).get_json()
+    return body['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def _tag_docs(user_id):
+    return dict(tag_suggester.stats_for(user_id, load=False).tag_docs)
+
+
+def test_tokenize_handles_latin_and_cjk():
+    tokens = tokenize('Project meeting 项目會議')
+    assert {'project', 'meeting'} <= set(tokens)
+    assert '项目' in tokens
+
+
+def test_suggestions_follow_the_users_tagged_notes(client):
+    user_id, auth = _user(client, 'tags-suggest')
+    for i in range(3):
+        client.post('/api/notes', json={'title': f'Sprint {i}', 'content': 'project meeting about the roadmap',
+                                        'tags': ['work']}, headers=auth)
+        client.post('/api/notes', json={'title': f'Run {i}', 'content': 'morning run in the park',
+                                        'tags': ['health']}, headers=auth)
+    response = client.post('/api/tags/suggest-for-text', json={'text': 'roadmap meeting for the project'}, headers=auth)
+    assert [s['tag'] for s in response.get_json()['suggestions']][0] == 'work'
+
+
+def test_stats_only_change_when_the_write_commits(app, client):
+    user_id, auth = _user(client, 'tags-commit')
+    client.post('/api/notes', json={'title': 'a', 'content': 'b', 'tags': ['seen']}, headers=auth)
+    with app.app_context():
+        tag_suggester.suggest('warm up', user_id)
+        before = _tag_docs(user_id)
+
+        db.session.add(Note(title='x', content='y', tags='rolled-back', user_id=user_id, version=1))
+        db.session.flush()
+        assert _tag_docs(user_id) == before
+        db.session.rollback()
+
+        db.session.add(Note(title='x', content='y', tags='abandoned', user_id=user_id, version=1))
+        db.session.flush()
+        db.session.remove()
+        assert _tag_docs(user_id) == before
+
+        db.session.add(Note(title='x', content='y', tags='kept', user_id=user_id, version=1))
+        db.session.commit()
+        assert _tag_docs(user_id) == dict(before, kept=1)